@@ -0,0 +1,81 @@
+"""Compare context window lookups: per-call normalize-and-scan vs the compiled trie index.
+
+Builds a map with ``--entries`` model names (like a live map that grew through automatic
+additions) and times exact, longest-prefix and missing lookups.
+
+    python benchmarks/bench_context_window_lookup.py --entries 10000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from ralphsweagent.models.context_window import (
+    ContextWindowIndex,
+    lookup_context_window,
+    normalize_model_name,
+)
+
+
+def _lookup_before(model_name: str, context_map: dict[str, int]) -> int | None:
+    normalized_name = normalize_model_name(model_name)
+    normalized_map = {normalize_model_name(key): int(value) for key, value in context_map.items()}
+    if normalized_name in normalized_map:
+        return normalized_map[normalized_name]
+    best_key = ""
+    for key in normalized_map:
+        if normalized_name.startswith(key) and len(key) > len(best_key):
+            best_key = key
+    return normalized_map.get(best_key) if best_key else None
+
+
+def _context_map(entries: int) -> dict[str, int]:
+    rng = random.Random(0)
+    families = ["gpt", "claude", "qwen", "llama", "mistral", "gemini", "deepseek", "phi"]
+    context_map = {}
+    while len(context_map) < entries:
+        name = f"{rng.choice(families)}-{rng.randint(1, 99)}.{rng.randint(0, 9)}-{rng.randint(1, 400)}b"
+        if rng.random() < 0.3:
+            name += f"-instruct-{rng.choice(['fp8', 'awq', 'q4_k_m'])}"
+        context_map[f"provider{rng.randint(0, 9)}/{name}"] = rng.choice([8192, 32768, 131072, 200000])
+    return context_map
+
+
+def _time(lookup, names: list[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for name in names:
+            lookup(name)
+    return (time.perf_counter() - start) / (repeat * len(names))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=10_000)
+    args = parser.parse_args()
+
+    context_map = _context_map(args.entries)
+    keys = list(context_map)
+    names = [keys[0], keys[len(keys) // 2] + "-2025-01-01", "provider1/unknown-model-7b"]
+
+    start = time.perf_counter()
+    index = ContextWindowIndex(context_map)
+    build = time.perf_counter() - start
+    for name in names:
+        expected = _lookup_before(name, context_map)
+        assert index.lookup(name) == lookup_context_window(name, context_map, "bench") == expected
+
+    results = {
+        "before (per call)": _time(lambda name: _lookup_before(name, context_map), names, 1),
+        "lookup_context_window": _time(lambda name: lookup_context_window(name, context_map, "bench"), names, 20),
+        "ContextWindowIndex": _time(index.lookup, names, 1000),
+    }
+    print(f"{args.entries} entries; index built once in {build * 1e3:.1f} ms; us per lookup:")
+    for name, seconds in results.items():
+        print(f"{name:<24}{seconds * 1e6:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Compare per-call overhead of one-off `requests.post` against the pooled model transport.
+
+Runs a local fake provider in a separate process and issues the same small POST from several
+worker threads, reporting the mean latency of a single call. Loopback
+connections are nearly free, so the server sleeps for ``--handshake-ms`` whenever a new connection
+is accepted to stand in for the TCP + TLS setup paid against a real provider.
+
+    python benchmarks/bench_http_transport.py --calls 2000 --workers 32 --handshake-ms 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from ralphsweagent.models.utils.http_transport import get_http_transport
+
+_BODY = json.dumps({"choices": [{"message": {"role": "assistant", "content": "ok"}}], "usage": {"cost": 1e-6}}).encode()
+
+
+class _FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    handshake_seconds = 0.0
+    shared_connections = None
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.shared_connections.get_lock():
+            self.shared_connections.value += 1
+        time.sleep(self.handshake_seconds)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(_BODY)))
+        self.end_headers()
+        self.wfile.write(_BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve(handshake_seconds: float, ports: multiprocessing.Queue, connections: multiprocessing.Value) -> None:
+    _FakeProviderHandler.handshake_seconds = handshake_seconds
+    _FakeProviderHandler.shared_connections = connections
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeProviderHandler)
+    server.daemon_threads = True
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def _run(post, url: str, calls: int, workers: int, connections: multiprocessing.Value) -> tuple[float, int]:
+    connections.value = 0
+    payload = json.dumps({"model": "bench", "messages": [{"role": "user", "content": "x" * 2048}]})
+
+    def _call(_) -> float:
+        start = time.perf_counter()
+        response = post(url, headers={"Content-Type": "application/json"}, data=payload, timeout=10)
+        response.raise_for_status()
+        response.json()
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        durations = list(executor.map(_call, range(calls)))
+    return sum(durations) / calls, connections.value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--handshake-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    ports: multiprocessing.Queue = multiprocessing.Queue()
+    connections = multiprocessing.Value("i", 0)
+    server = multiprocessing.Process(target=_serve, args=(args.handshake_ms / 1e3, ports, connections), daemon=True)
+    server.start()
+    url = f"http://127.0.0.1:{ports.get(timeout=10)}/api/v1/chat/completions"
+
+    transport = get_http_transport("bench", url, pool_maxsize=args.workers)
+    results = {
+        "requests.post (before)": _run(requests.post, url, args.calls, args.workers, connections),
+        "pooled transport (after)": _run(transport.post, url, args.calls, args.workers, connections),
+    }
+    server.terminate()
+
+    print(f"{args.calls} calls, {args.workers} workers, {args.handshake_ms:g} ms simulated handshake")
+    for name, (per_call, connections) in results.items():
+        print(f"{name:<26} {per_call * 1e3:8.3f} ms/call  {connections:5d} connections")
+
+
+if __name__ == "__main__":
+    main()
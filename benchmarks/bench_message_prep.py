@@ -0,0 +1,85 @@
+"""Compare per-step message preparation before and after the prepared-prefix memo.
+
+Simulates a run that appends an assistant message and a tool observation per step and
+prepares the whole history for the API every step, as `LitellmModel` (with
+``set_cache_control``) and `LitellmResponseModel` do. Reports the preparation time at a few
+history lengths so the growth per step is visible.
+
+    python benchmarks/bench_message_prep.py --steps 250 --observation-chars 4000
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+from minisweagent.models.utils.anthropic_utils import _reorder_anthropic_thinking_blocks
+from minisweagent.models.utils.cache_control import set_cache_control
+from ralphsweagent.models.utils.message_prep import (
+    ChatMessagePreparer,
+    PreparedMessageCache,
+    flatten_response_message,
+    prepare_response_items,
+)
+
+
+def _chat_before(messages: list[dict]) -> list[dict]:
+    prepared = [{k: v for k, v in msg.items() if k != "extra"} for msg in messages]
+    prepared = _reorder_anthropic_thinking_blocks(prepared)
+    return set_cache_control(prepared, mode="default_end")
+
+
+def _history(steps: int, observation_chars: int, responses_api: bool) -> list[list[dict]]:
+    """Snapshots of the conversation at every step."""
+    messages = [{"role": "system", "content": "system"}, {"role": "user", "content": "task " * 200}]
+    snapshots = []
+    for step in range(steps):
+        if responses_api:
+            output = [{"type": "function_call", "call_id": f"c{step}", "arguments": '{"command": "ls"}'}]
+            messages.append({"object": "response", "id": f"r{step}", "output": output, "extra": {"cost": 0.1}})
+            messages.append({"type": "function_call_output", "call_id": f"c{step}", "output": "x" * observation_chars})
+        else:
+            messages.append({"role": "assistant", "content": f"step {step}", "extra": {"cost": 0.1}})
+            messages.append({"role": "tool", "tool_call_id": f"c{step}", "content": "x" * observation_chars})
+        snapshots.append(list(messages))
+    return snapshots
+
+
+def _time_steps(prepare, snapshots: list[list[dict]]) -> list[float]:
+    durations = []
+    for messages in snapshots:
+        start = time.perf_counter()
+        prepare(messages)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=250)
+    parser.add_argument("--observation-chars", type=int, default=4000)
+    args = parser.parse_args()
+
+    chat = _history(args.steps, args.observation_chars, responses_api=False)
+    responses = _history(args.steps, args.observation_chars, responses_api=True)
+    preparer = ChatMessagePreparer()
+    response_cache = PreparedMessageCache(flatten_response_message)
+    results = {
+        "chat before": _time_steps(_chat_before, chat),
+        "chat after": _time_steps(lambda m: preparer.prepare(m, cache_control="default_end"), chat),
+        "responses before": _time_steps(prepare_response_items, responses),
+        "responses after": _time_steps(response_cache.prepare, responses),
+    }
+    assert preparer.prepare(chat[-1], cache_control="default_end") == _chat_before(chat[-1])
+    assert response_cache.prepare(responses[-1]) == prepare_response_items(responses[-1])
+
+    checkpoints = sorted({0, args.steps // 4, args.steps // 2, args.steps - 1})
+    print(f"{args.steps} steps, {args.observation_chars} chars per observation; us per step at step:")
+    print(f"{'':<18}" + "".join(f"{step + 1:>10}" for step in checkpoints) + f"{'total ms':>12}")
+    for name, durations in results.items():
+        cells = "".join(f"{durations[step] * 1e6:10.1f}" for step in checkpoints)
+        print(f"{name:<18}{cells}{sum(durations) * 1e3:12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compare the previous string-concatenating stream reconstruction against `StreamReassembler`.
+
+Feeds synthetic 100k-chunk streams through both with the stream guard enabled, checks they
+reconstruct identical content, and reports total and per-chunk time.
+
+    python benchmarks/bench_stream_reassembly.py --chunks 100000 --chunk-chars 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from ralphsweagent.models.utils.stream_reassembly import CLOSING_TAG_RE, StreamReassembler
+
+
+def _naive(chunks, window: int, threshold: int) -> str:
+    """Content handling of the previous implementation: ``+=`` plus a regex rescan of the window per chunk."""
+    content = ""
+    for chunk in chunks:
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        content += delta
+        window_text = content[-window:] if len(content) > window else content
+        matches = list(CLOSING_TAG_RE.finditer(window_text))
+        if len(matches) >= threshold:
+            return content[: len(content) - len(window_text) + matches[threshold - 1].start()]
+    return content
+
+
+def _reassembled(chunks, window: int, threshold: int) -> str:
+    reassembler = StreamReassembler(guard_window=window, guard_threshold=threshold)
+    for chunk in chunks:
+        if reassembler.add(chunk):
+            break
+    return reassembler.content
+
+
+def _stream(n_chunks: int, chunk_chars: int, tag_every: int, seed: int) -> list:
+    rng = random.Random(seed)
+    alphabet = "abcdefghij klmnop\n"
+    chunks = []
+    for i in range(n_chunks):
+        text = "".join(rng.choice(alphabet) for _ in range(chunk_chars))
+        if tag_every and i % tag_every == 0:
+            text += "</div>"
+        delta = SimpleNamespace(content=text, tool_calls=None, role="assistant")
+        chunks.append(SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)], usage=None))
+    return chunks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--chunk-chars", type=int, default=8)
+    parser.add_argument("--window", type=int, default=8192)
+    parser.add_argument("--threshold", type=int, default=50)
+    parser.add_argument("--tag-every", type=int, default=40, help="append a closing tag every N chunks (0: never)")
+    args = parser.parse_args()
+
+    chunks = _stream(args.chunks, args.chunk_chars, args.tag_every, seed=0)
+    results = {}
+    for name, fn in [("naive (before)", _naive), ("StreamReassembler (after)", _reassembled)]:
+        start = time.perf_counter()
+        content = fn(chunks, args.window, args.threshold)
+        results[name] = (time.perf_counter() - start, content)
+
+    contents = {content for _, content in results.values()}
+    assert len(contents) == 1, "reconstructed content differs"
+    print(f"{args.chunks} chunks x {args.chunk_chars} chars, window {args.window}, threshold {args.threshold}")
+    for name, (elapsed, content) in results.items():
+        print(f"{name:<26} {elapsed:8.3f} s  {elapsed / args.chunks * 1e6:8.2f} us/chunk  {len(content)} chars")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Compare per-step trajectory saving: rewriting ``.traj.json`` vs the append-only partial log.
+
+Simulates a run that appends an assistant message and a tool observation per step and saves
+after every step, as the agent's run loop does. Reports the save time at a few history
+lengths so the growth per step is visible.
+
+    python benchmarks/bench_trajectory_save.py --steps 250 --observation-chars 4000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from ralphsweagent.agents.trajectory_log import TrajectoryLog, read_partial_trajectory
+
+
+def _data(messages: list[dict], step: int) -> dict:
+    return {
+        "info": {"model_stats": {"instance_cost": 0.1 * step, "api_calls": step}, "config": {"agent": {"x": 1}}},
+        "messages": messages,
+        "trajectory_format": "mini-swe-agent-1.1",
+    }
+
+
+def _full_save(path: Path, data: dict) -> None:
+    path.write_text(json.dumps(data, indent=2))
+
+
+def _run(save, steps: int, observation_chars: int) -> list[float]:
+    messages = [{"role": "system", "content": "system"}, {"role": "user", "content": "task " * 200}]
+    durations = []
+    for step in range(steps):
+        messages.append({"role": "assistant", "content": f"step {step}", "extra": {"cost": 0.1}})
+        messages.append({"role": "tool", "tool_call_id": f"c{step}", "content": "x" * observation_chars})
+        start = time.perf_counter()
+        save(_data(messages, step))
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=250)
+    parser.add_argument("--observation-chars", type=int, default=4000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        full_path = Path(tmp) / "full.traj.json"
+        log = TrajectoryLog(Path(tmp) / "incremental.traj.json")
+        results = {
+            "full rewrite": _run(lambda data: _full_save(full_path, data), args.steps, args.observation_chars),
+            "partial log": _run(log.save, args.steps, args.observation_chars),
+        }
+        log.close()
+        assert read_partial_trajectory(log.path) == json.loads(full_path.read_text())
+
+    checkpoints = sorted({0, args.steps // 4, args.steps // 2, args.steps - 1})
+    print(f"{args.steps} steps, {args.observation_chars} chars per observation; us per save at step:")
+    print(f"{'':<14}" + "".join(f"{step + 1:>10}" for step in checkpoints) + f"{'total ms':>12}")
+    for name, durations in results.items():
+        cells = "".join(f"{durations[step] * 1e6:10.1f}" for step in checkpoints)
+        print(f"{name:<14}{cells}{sum(durations) * 1e3:12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Shrink the conversation history once the context window fills up.
+
+A compactor takes the agent's messages and returns a shorter copy, never editing messages
+in place (memoized prompt preparation and the trajectory log detect replaced dicts only).
+The system message, the task and the most recent messages are always kept verbatim, and
+an assistant message is never separated from the tool results that answer it.
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+import time
+from typing import Any, Protocol
+
+from ralphsweagent.models.utils.observation_budget import elide_middle
+
+logger = logging.getLogger("compaction")
+
+ELISION_MARKER = "\n[... {n} characters elided by context compaction ...]\n"
+
+_SUMMARY_PROMPT = (
+    "You are compressing the history of a software engineering agent working in a shell. "
+    "Summarize the conversation below for the agent itself: the task, what was tried, which files "
+    "and functions matter, key command outputs and errors, and what remains to be done. "
+    "Be specific (paths, names, exact errors) and concise."
+)
+
+
+class Compactor(Protocol):
+    name: str
+
+    def compact(self, messages: list[dict], *, level: int) -> tuple[list[dict], dict[str, Any]] | None:
+        """Return the compacted messages and details for the compaction event, or None if nothing changed.
+
+        ``level`` starts at 1 and grows with how far the context has filled up.
+        """
+        ...
+
+
+def _is_turn_start(msg: dict) -> bool:
+    return msg.get("role") == "assistant" or msg.get("object") == "response"
+
+
+def split_history(messages: list[dict], keep_recent: int) -> tuple[int, int]:
+    """Indices ``(start, end)`` of the compactable middle of the history.
+
+    The first two messages (system prompt and task) and everything from the start of the
+    turn containing the last ``keep_recent`` messages on are kept.
+    """
+    start = min(2, len(messages))
+    end = max(start, len(messages) - keep_recent)
+    while end > start and not _is_turn_start(messages[end]):
+        end -= 1
+    return start, end
+
+
+def _elide(text: str, max_chars: int) -> str:
+    return elide_middle(text, max_chars, ELISION_MARKER)
+
+
+def _elide_content(content: Any, max_chars: int) -> Any:
+    if isinstance(content, str):
+        return _elide(content, max_chars)
+    if isinstance(content, list):
+        return [
+            {**block, "text": _elide(block["text"], max_chars)}
+            if isinstance(block, dict) and isinstance(block.get("text"), str)
+            else block
+            for block in content
+        ]
+    return content
+
+
+def _transcript_entry(msg: dict) -> str:
+    label = msg.get("role") or msg.get("type") or msg.get("object")
+    return f"[{label}]\n{msg.get('content') or msg.get('output') or ''}"
+
+
+class TruncationCompactor:
+    """Deterministic compaction: head+tail elision of old observations and dropped reasoning.
+
+    Each level halves the characters kept per observation.
+    """
+
+    name = "truncate"
+
+    def __init__(self, *, keep_recent: int = 6, observation_chars: int = 2000):
+        self.keep_recent = keep_recent
+        self.observation_chars = observation_chars
+
+    def _compact_message(self, msg: dict, max_chars: int) -> dict:
+        if msg.get("object") == "response":
+            output = [item for item in msg.get("output", []) if item.get("type") != "reasoning"]
+            return {**msg, "output": output} if len(output) != len(msg.get("output", [])) else msg
+        if msg.get("type") == "function_call_output" and isinstance(msg.get("output"), str):
+            return {**msg, "output": _elide(msg["output"], max_chars)}
+        if msg.get("role") == "assistant":
+            dropped = {k: v for k, v in msg.items() if k not in ("reasoning_content", "thinking_blocks")}
+            return dropped if len(dropped) != len(msg) else msg
+        if msg.get("role") in ("tool", "user"):
+            return {**msg, "content": _elide_content(msg.get("content"), max_chars)}
+        return msg
+
+    def compact(self, messages: list[dict], *, level: int) -> tuple[list[dict], dict[str, Any]] | None:
+        max_chars = max(200, self.observation_chars >> max(0, level - 1))
+        start, end = split_history(messages, self.keep_recent)
+        compacted = list(messages)
+        changed = 0
+        for index in range(start, end):
+            msg = messages[index]
+            if msg.get("extra", {}).get("compacted_chars", max_chars + 1) <= max_chars:
+                continue
+            new = self._compact_message(msg, max_chars)
+            if new is msg or new == msg:
+                continue
+            new = copy.copy(new)
+            new["extra"] = {**msg.get("extra", {}), "compacted": True, "compacted_chars": max_chars}
+            compacted[index] = new
+            changed += 1
+        if not changed:
+            return None
+        return compacted, {"messages_compacted": changed, "observation_chars": max_chars}
+
+
+class SummaryCompactor:
+    """Replace the middle of the history with a summary written by a cheap model via litellm.
+
+    Falls back to ``fallback`` (truncation by default) if the summary request fails.
+    """
+
+    name = "summarize"
+
+    def __init__(self, model_name: str, *, keep_recent: int = 6, fallback: Compactor | None = None, **model_kwargs):
+        self.model_name = model_name
+        self.keep_recent = keep_recent
+        self.model_kwargs = model_kwargs
+        self.fallback = fallback or TruncationCompactor(keep_recent=keep_recent)
+
+    def _summarize(self, transcript: str) -> tuple[str, float]:
+        import litellm
+
+        response = litellm.completion(
+            model=self.model_name,
+            messages=[{"role": "system", "content": _SUMMARY_PROMPT}, {"role": "user", "content": transcript}],
+            **self.model_kwargs,
+        )
+        try:
+            cost = litellm.cost_calculator.completion_cost(response, model=self.model_name)
+        except Exception:
+            cost = 0.0
+        return response.choices[0].message.content or "", cost
+
+    def compact(self, messages: list[dict], *, level: int) -> tuple[list[dict], dict[str, Any]] | None:
+        start, end = split_history(messages, self.keep_recent)
+        if end - start < 2:
+            return self.fallback.compact(messages, level=level)
+        transcript = "\n\n".join(_transcript_entry(msg) for msg in messages[start:end])
+        try:
+            summary, cost = self._summarize(transcript)
+        except Exception as e:
+            logger.warning("Summarizing history with %s failed, truncating instead: %s", self.model_name, e)
+            return self.fallback.compact(messages, level=level)
+        summary_message = {
+            "role": "user",
+            "content": f"Summary of the earlier steps (older messages were removed to save context):\n\n{summary}",
+            "extra": {"compacted": True, "summarized_messages": end - start, "timestamp": time.time()},
+        }
+        details = {"messages_compacted": end - start, "summary_model": self.model_name, "cost": cost}
+        return [*messages[:start], summary_message, *messages[end:]], details
+
+
+COMPACTORS: dict[str, type] = {"truncate": TruncationCompactor, "summarize": SummaryCompactor}
+
+
+def get_compactor(strategy: str, *, keep_recent: int, observation_chars: int, summary_model: str = "") -> Compactor:
+    if strategy == "summarize":
+        if not summary_model:
+            raise ValueError("The 'summarize' compaction strategy needs a summary model name")
+        fallback = TruncationCompactor(keep_recent=keep_recent, observation_chars=observation_chars)
+        return SummaryCompactor(summary_model, keep_recent=keep_recent, fallback=fallback)
+    if strategy == "truncate":
+        return TruncationCompactor(keep_recent=keep_recent, observation_chars=observation_chars)
+    raise ValueError(f"Unknown compaction strategy {strategy!r}; expected one of {sorted(COMPACTORS)}")
@@ -0,0 +1,91 @@
+"""Run streamed tool calls while the model is still generating the rest of its response."""
+
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from minisweagent.exceptions import InterruptAgentFlow
+
+
+class EarlyToolDispatcher:
+    """Execute actions on a single background worker, in the order they were submitted.
+
+    Once an action raises (e.g. ``Submitted``), later submissions are skipped so the
+    environment sees exactly what sequential execution would have run.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="early-dispatch")
+        self._pending: list[tuple[dict, Future]] = []
+        self._lock = threading.Lock()
+        self._failed = threading.Event()
+
+    def submit(self, action: dict) -> None:
+        with self._lock:
+            self._pending.append((action, self._executor.submit(self._run, action)))
+
+    def _run(self, action: dict) -> dict | None:
+        if self._failed.is_set():
+            return None
+        try:
+            return self.env.execute(action)
+        except BaseException:
+            self._failed.set()
+            raise
+
+    def take(self) -> list[tuple[dict, Future]]:
+        """Return and forget the actions dispatched since the last call."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    def collect(self) -> list[dict]:
+        """Wait for the actions dispatched since the last call and return them with their ``output``.
+
+        Used when the query that dispatched them failed, so that no message claims them even
+        though they ran. Actions skipped after an earlier failure are left out. If an action
+        interrupted the agent flow (e.g. ``Submitted``), that exception is raised once every
+        action has finished, as sequential execution would have.
+        """
+        executed: list[dict] = []
+        interrupt: InterruptAgentFlow | None = None
+        for action, future in self.take():
+            error = future.exception()
+            if isinstance(error, InterruptAgentFlow):
+                interrupt = interrupt or error
+            elif error is not None:
+                output = {"output": "", "returncode": -1, "exception_info": f"{type(error).__name__}: {error}"}
+                executed.append({**action, "output": output})
+            elif future.result() is not None:
+                executed.append({**action, "output": future.result()})
+        if interrupt is not None:
+            raise interrupt
+        return executed
+
+    def reset(self) -> int:
+        """Start a new model turn: wait for and drop unclaimed actions, then re-enable execution.
+
+        Returns the number of dropped actions.
+        """
+        dropped = self.take()
+        for _, future in dropped:
+            future.exception()
+        self._failed.clear()
+        return len(dropped)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+def describe_executed(executed: list[dict]) -> str:
+    """Tell the model which of its tool calls already ran, for a message that has no tool results for them."""
+    parts = ["These tool calls from your response were already executed:"]
+    for item in executed:
+        output = item["output"]
+        parts.append(
+            f"<command>{item['command']}</command>\n<returncode>{output.get('returncode')}</returncode>\n"
+            f"<output>\n{output.get('output', '')}</output>"
+        )
+    return "\n\n".join(parts)
@@ -1,18 +1,26 @@
 """Monkeypatch DefaultAgent with ralph-swe-agent enhancements.
 
-This module adds context window tracking and live trajectory streaming to
-DefaultAgent so all agent classes (default, interactive, reasoning_tool_call)
-inherit the behavior regardless of which class is resolved from config.
+This module adds context window tracking with preflight prompt token estimates, context
+compaction, per-step phase timings, live trajectory streaming, incremental trajectory
+saving, early tool-call dispatch and concurrent read-only tool calls to DefaultAgent so all
+agent classes (default, interactive, reasoning_tool_call) inherit the behavior regardless of
+which class is resolved from config.
 """
 
 from __future__ import annotations
 
+from ralphsweagent.agents.compaction import Compactor, get_compactor
+from ralphsweagent.agents.early_dispatch import EarlyToolDispatcher, describe_executed
+from ralphsweagent.agents.live_trajectory import LiveTrajectorySink
+from ralphsweagent.agents.parallel_tools import execute_actions_concurrently
+from ralphsweagent.agents.resume import ResumeState, replay_actions
+from ralphsweagent.agents.trajectory_log import TrajectoryLog
 from ralphsweagent.models.context_window import (
-    load_context_window_map,
-    lookup_context_window,
-    normalize_model_name,
-    update_context_window_map,
+    CONTEXT_WINDOW_EXCEPTIONS,
+    ContextWindowBudgetExceeded,
+    get_context_window_registry,
 )
+from ralphsweagent.models.utils.token_estimate import PromptTokenEstimator
 
 _patched = False
 
@@ -27,27 +35,43 @@ def register_agent_enhancements() -> None:
         return
     _patched = True
 
-    import json
+    import os
+    import time
     from pathlib import Path
 
     from minisweagent.agents.default import DefaultAgent
-    from minisweagent.utils.serialize import to_jsonable
+    from minisweagent.exceptions import FormatError, InterruptAgentFlow
+    from ralphsweagent.utils.env import env_flag, env_float, env_int
 
     _original_init = DefaultAgent.__init__
     _original_run = DefaultAgent.run
     _original_query = DefaultAgent.query
     _original_get_template_vars = DefaultAgent.get_template_vars
     _original_add_messages = DefaultAgent.add_messages
+    _original_serialize = DefaultAgent.serialize
 
     def _patched_init(self, *args, **kwargs):
         _original_init(self, *args, **kwargs)
         self.context_window_max: int | None = None
         self.context_window_prompt_tokens: int | None = None
         self.context_left_percent: int | None = None
+        self.context_window_estimated_tokens: int | None = None
+        self._token_estimator: PromptTokenEstimator | None = None
         self._live_trajectory_path: Path | None = None
+        self._live_trajectory_sink: LiveTrajectorySink | None = None
+        self._trajectory_log: TrajectoryLog | None = None
+        self._early_dispatcher: EarlyToolDispatcher | None = None
+        self._compactor: Compactor | None = None
+        self._compaction_level = 0
+        self.compaction_events: list[dict] = []
+        self._resume_state: ResumeState | None = None
+        self._step_timings: dict[str, float] | None = None
+        self._step_message_index = 0
+        self._live_pending: list[dict] = []
 
     def _set_live_trajectory_path(self, path: Path | None) -> None:
         """Set a live JSONL trajectory path and clear any existing file."""
+        self.close_live_trajectory()
         self._live_trajectory_path = path
         if not path:
             return
@@ -56,19 +80,34 @@ def register_agent_enhancements() -> None:
             path.unlink(missing_ok=True)
         except Exception as exc:
             self.logger.warning("Failed to initialize live trajectory file %s: %s", path, exc)
+        self._live_trajectory_sink = LiveTrajectorySink(
+            path, flush_interval=self.live_trajectory_flush_interval, fsync=self.live_trajectory_fsync
+        )
+
+    def _restore_trajectory(self, state: ResumeState, *, replay: bool = True) -> None:
+        """Make the next `run` continue ``state`` instead of starting from the task.
+
+        With ``replay``, the recorded actions are re-run first so the environment is back in
+        the state the interrupted run left it in.
+        """
+        if replay:
+            replayed = replay_actions(self.env, state.actions)
+            self.logger.info("Replayed %d action(s) from %s", replayed, state.source)
+        self._resume_state = state
+
+    def _close_live_trajectory(self) -> None:
+        """Flush and close the live trajectory file, e.g. before deleting it."""
+        if self._live_trajectory_sink is not None:
+            self._live_trajectory_sink.close()
+            self._live_trajectory_sink = None
 
     def _patched_add_messages(self, *messages: dict) -> list[dict]:
         result = _original_add_messages(self, *messages)
-        if self._live_trajectory_path:
-            try:
-                self._live_trajectory_path.parent.mkdir(parents=True, exist_ok=True)
-                with self._live_trajectory_path.open("a", encoding="utf-8") as handle:
-                    for message in messages:
-                        handle.write(json.dumps(to_jsonable(message)) + "\n")
-            except Exception as exc:
-                self.logger.warning(
-                    "Failed to write live trajectory to %s: %s", self._live_trajectory_path, exc
-                )
+        if self._live_trajectory_sink is not None and self._step_timings is not None:
+            # Written once the step's timings are complete, see `_record_step_timings`.
+            self._live_pending.extend(messages)
+        elif self._live_trajectory_sink is not None:
+            self._live_trajectory_sink.write(messages)
         return result
 
     def _patched_get_template_vars(self, **kwargs):
@@ -77,37 +116,96 @@ def register_agent_enhancements() -> None:
             "context_window_max": self.context_window_max,
             "context_window_prompt_tokens": self.context_window_prompt_tokens,
             "context_left_percent": self.context_left_percent,
+            "context_window_estimated_tokens": self.context_window_estimated_tokens,
         })
         return base
 
     def _patched_run(self, task: str = "", **kwargs):
         self.extra_template_vars |= {"task": task, **kwargs}
         self.messages = []
+        self._compaction_level = 0
+        self.compaction_events = []
         self._resolve_context_window_max()
-        self.add_messages(
-            self.model.format_message(
-                role="system", content=self._render_template(self.config.system_template)
-            ),
-            self.model.format_message(
-                role="user", content=self._render_template(self.config.instance_template)
-            ),
-        )
+        if self._resume_state is not None:
+            state, self._resume_state = self._resume_state, None
+            self.n_calls, self.cost = state.n_calls, state.cost
+            self.compaction_events = list(state.info.get("compaction", []))
+            self.add_messages(*state.messages)
+        else:
+            self.add_messages(
+                self.model.format_message(
+                    role="system", content=self._render_template(self.config.system_template)
+                ),
+                self.model.format_message(
+                    role="user", content=self._render_template(self.config.instance_template)
+                ),
+            )
         from minisweagent.exceptions import InterruptAgentFlow
 
-        while True:
-            try:
-                self.step()
-            except InterruptAgentFlow as e:
-                self.add_messages(*e.messages)
-            except Exception as e:
-                self.handle_uncaught_exception(e)
-                raise
-            finally:
-                self.save(self.config.output_path)
-            if self.messages[-1].get("role") == "exit":
-                break
+        try:
+            while True:
+                try:
+                    self.step()
+                except InterruptAgentFlow as e:
+                    self.add_messages(*e.messages)
+                except ContextWindowBudgetExceeded as e:
+                    if not self.handle_context_budget_exceeded(e):
+                        self.add_messages(
+                            {
+                                "role": "exit",
+                                "content": str(e),
+                                "extra": {"exit_status": "ContextWindowExceeded", "submission": ""},
+                            }
+                        )
+                except Exception as e:
+                    self.handle_uncaught_exception(e)
+                    raise
+                finally:
+                    save_started = time.monotonic()
+                    self._save_step(self.config.output_path)
+                    if self._step_timings is not None:
+                        self._step_timings["save"] = time.monotonic() - save_started
+                        self._record_step_timings()
+                if self.messages[-1].get("role") == "exit":
+                    break
+        finally:
+            self._finalize_trajectory(self.config.output_path)
+        if self._live_trajectory_sink is not None:
+            self._live_trajectory_sink.flush()
         return self.messages[-1].get("extra", {})
 
+    def _save_step(self, path: Path | None) -> None:
+        """Save after a step: append to the partial log, or rewrite the whole file if disabled."""
+        if not self.incremental_trajectory:
+            self.save(path)
+            return
+        if not path:
+            return
+        if self._trajectory_log is None or self._trajectory_log.output_path != path:
+            self._trajectory_log = TrajectoryLog(path)
+        self._trajectory_log.save(self.serialize())
+
+    def _record_step_timings(self) -> None:
+        """Persist the finished step with its complete timings.
+
+        The live JSONL gets the step's messages only now, so they carry every phase. The partial
+        log saved the model response before the save was timed, so it gets a timings record.
+        """
+        timings, self._step_timings = self._step_timings, None
+        pending, self._live_pending = self._live_pending, []
+        if self._live_trajectory_sink is not None and pending:
+            self._live_trajectory_sink.write(pending)
+        if self._trajectory_log is not None:
+            self._trajectory_log.update_timings(self._step_message_index, timings)
+
+    def _finalize_trajectory(self, path: Path | None) -> None:
+        """Write the complete ``.traj.json`` once and drop the partial log."""
+        if self._trajectory_log is None:
+            return
+        self.save(path)
+        self._trajectory_log.discard()
+        self._trajectory_log = None
+
     def _patched_query(self):
         from minisweagent.exceptions import LimitsExceeded
 
@@ -121,13 +219,196 @@ def register_agent_enhancements() -> None:
             )
         if self.context_window_max is None:
             self._resolve_context_window_max()
+        started = time.monotonic()
+        self._maybe_compact()
+        self._preflight_context_check()
+        checked = time.monotonic()
         self.n_calls += 1
-        message = self.model.query(self.messages)
+        dispatcher = self._get_early_dispatcher()
+        if dispatcher is not None:
+            dropped = dispatcher.reset()
+            if dropped:
+                self.logger.warning("%d early-dispatched tool call(s) ran without a recorded response", dropped)
+            self.model.tool_call_listener = dispatcher.submit
+        try:
+            message = self.model.query(self.messages)
+        except FormatError as e:
+            # The response was rejected after some of its tool calls ran; record them in the format error.
+            if dispatcher is not None and (executed := dispatcher.collect()):
+                notice = e.messages[-1]
+                notice["content"] = f"{notice['content']}\n\n{describe_executed(executed)}"
+                notice.setdefault("extra", {})["early_dispatch"] = {"executed": executed}
+            raise
+        except CONTEXT_WINDOW_EXCEPTIONS as e:
+            raise ContextWindowBudgetExceeded(
+                self.context_window_estimated_tokens, self.context_window_max, f"Provider rejected the prompt: {e}"
+            ) from e
+        except Exception as e:
+            if dispatcher is not None and (executed := dispatcher.collect()):
+                # The model does not retry once tool calls ran; tell it what ran and let it answer again.
+                content = f"Your response was interrupted ({type(e).__name__}: {e}).\n\n{describe_executed(executed)}"
+                extra = {"interrupt_type": "InterruptedAfterDispatch", "early_dispatch": {"executed": executed}}
+                raise InterruptAgentFlow({"role": "user", "content": content, "extra": extra}) from e
+            raise
+        finally:
+            if dispatcher is not None:
+                self.model.tool_call_listener = None
+        timings = message.setdefault("extra", {}).setdefault("timings", {})
+        timings.update({"context_check": checked - started, "model": time.monotonic() - checked})
+        self._step_timings = timings
         self._update_context_window_stats(message)
         self.cost += message.get("extra", {}).get("cost", 0.0)
+        self._step_message_index = len(self.messages)
         self.add_messages(message)
         return message
 
+    def _preflight_context_check(self) -> None:
+        """Estimate the prompt before sending it and raise if it cannot fit the context window."""
+        tools = getattr(self.model, "_tools", None)
+        estimate = self._estimate_prompt_tokens(self.messages, tools=tools() if callable(tools) else None)
+        if estimate is None:
+            return
+        self.context_window_estimated_tokens = estimate
+        limit_percent = self.context_preflight_percent
+        if self.context_window_max and limit_percent > 0 and estimate > self.context_window_max * limit_percent / 100:
+            raise ContextWindowBudgetExceeded(estimate, self.context_window_max)
+
+    def _handle_context_budget_exceeded(self, exc: ContextWindowBudgetExceeded) -> bool:
+        """Shorten `self.messages` so the next query fits and return True, or return False to exit.
+
+        Replace message dicts rather than editing them in place, so memoized prompt preparation
+        and token estimates notice the change. With compaction enabled, this compacts one level
+        deeper than the thresholds have reached so far.
+        """
+        if self.compaction_thresholds and self.compact_history(self._compaction_level + 1, reason=str(exc)):
+            self._compaction_level += 1
+            return True
+        self.logger.warning("%s; ending the run", exc)
+        return False
+
+    def _maybe_compact(self) -> None:
+        """Compact once ``context_left_percent`` drops to a threshold it had not reached before.
+
+        The level passed to the compactor is the number of thresholds reached, so each threshold
+        compacts more aggressively than the previous one.
+        """
+        left = self.context_left_percent
+        if left is None or not self.compaction_thresholds:
+            return
+        level = sum(left <= threshold for threshold in self.compaction_thresholds)
+        if level <= self._compaction_level:
+            return
+        reached = min(threshold for threshold in self.compaction_thresholds if left <= threshold)
+        self.compact_history(level, reason=f"{left}% of the context window left (threshold {reached}%)")
+        # Compaction re-estimates context_left_percent, so thresholds it freed up can fire again.
+        self._compaction_level = sum(self.context_left_percent <= threshold for threshold in self.compaction_thresholds)
+
+    def _compact_history(self, level: int, reason: str = "") -> bool:
+        """Replace `self.messages` with a compacted copy and record the event. False if nothing changed."""
+        if self._compactor is None:
+            self._compactor = get_compactor(
+                self.compaction_strategy,
+                keep_recent=self.compaction_keep_recent,
+                observation_chars=self.compaction_observation_chars,
+                summary_model=self.compaction_summary_model,
+            )
+        result = self._compactor.compact(self.messages, level=level)
+        if result is None:
+            return False
+        messages, details = result
+        messages_before = len(self.messages)
+        tokens_before = self._estimate_prompt_tokens(self.messages)
+        tokens_after = self._estimate_prompt_tokens(messages)
+        self.messages = messages
+        # Stateful Responses models only send items after the previous response, which the
+        # provider still holds uncompacted; start a fresh chain with the full compacted input.
+        if hasattr(self.model, "_previous_response_id"):
+            self.model._previous_response_id = None
+        self.cost += details.pop("cost", 0.0)
+        event = {
+            "step": self.n_calls,
+            "level": level,
+            "reason": reason,
+            "strategy": self._compactor.name,
+            "messages_before": messages_before,
+            "messages_after": len(messages),
+            "estimated_tokens_before": tokens_before,
+            "estimated_tokens_after": tokens_after,
+            **details,
+        }
+        self.compaction_events.append(event)
+        if tokens_after is not None and self.context_window_max:
+            self.context_window_estimated_tokens = tokens_after
+            self.context_left_percent = max(0, min(100, int(100 * (1 - tokens_after / self.context_window_max))))
+        self.logger.info("Compacted history (%s): %s", reason, event)
+        return True
+
+    def _estimate_prompt_tokens(self, messages: list[dict], tools: list[dict] | None = None) -> int | None:
+        model_name = getattr(getattr(self.model, "config", None), "model_name", None)
+        if not model_name or not isinstance(model_name, str):
+            return None
+        if self._token_estimator is None or self._token_estimator.model_name != model_name:
+            self._token_estimator = PromptTokenEstimator(model_name)
+        return self._token_estimator.estimate(messages, tools=tools)
+
+    def _patched_serialize(self, *extra_dicts) -> dict:
+        if not self.compaction_events:
+            return _original_serialize(self, *extra_dicts)
+        return _original_serialize(self, {"info": {"compaction": self.compaction_events}}, *extra_dicts)
+
+    def _get_early_dispatcher(self) -> EarlyToolDispatcher | None:
+        """Return the dispatcher if the model streams with early dispatch and actions run unconfirmed."""
+        # Wrappers such as CachedModel keep the streaming model in ``model``.
+        config = getattr(getattr(self.model, "model", self.model), "config", None)
+        if not getattr(config, "early_tool_dispatch", False) or not getattr(config, "use_streaming", False):
+            return None
+        if type(self).execute_actions is not _patched_execute_actions:
+            return None
+        if self._early_dispatcher is None:
+            self._early_dispatcher = EarlyToolDispatcher(self.env)
+        return self._early_dispatcher
+
+    def _patched_execute_actions(self, message: dict) -> list[dict]:
+        started = time.monotonic()
+        outputs = self._execute_message_actions(message)
+        executed = time.monotonic()
+        observations = self.model.format_observation_messages(message, outputs, self.get_template_vars())
+        timings = message.setdefault("extra", {}).setdefault("timings", {})
+        timings.update({"environment": executed - started, "observation_render": time.monotonic() - executed})
+        return self.add_messages(*observations)
+
+    def _execute_message_actions(self, message: dict) -> list[dict]:
+        """Outputs of the message's actions: early-dispatched, concurrent or sequential."""
+        dispatched = self._early_dispatcher.take() if self._early_dispatcher is not None else []
+        actions = message.get("extra", {}).get("actions", [])
+        if not dispatched and self.parallel_tool_calls and len(actions) > 1:
+            return execute_actions_concurrently(self.env, actions, max_workers=self.parallel_tool_workers)
+        if not dispatched:
+            return [self.env.execute(action) for action in actions]
+        futures = {(action.get("tool_call_id"), action.get("command")): future for action, future in dispatched}
+        outputs = []
+        reused = 0
+        try:
+            for action in actions:
+                future = futures.pop((action.get("tool_call_id"), action.get("command")), None)
+                if future is None:
+                    outputs.append(self.env.execute(action))
+                else:
+                    outputs.append(future.result())
+                    reused += 1
+        finally:
+            for future in futures.values():
+                future.exception()
+            if futures:
+                self.logger.warning(
+                    "%d early-dispatched tool call(s) were not in the final response", len(futures)
+                )
+            message.setdefault("extra", {})["early_dispatch"] = {
+                "reused": reused,
+                "unclaimed": [command for _, command in futures],
+            }
+        return outputs
+
     def _resolve_context_window_max(self) -> None:
         if self.context_window_max is not None:
             return
@@ -138,24 +419,24 @@ def register_agent_enhancements() -> None:
         model_name = model_name.strip()
         if not model_name:
             return
-        context_map = load_context_window_map()
-        resolved = lookup_context_window(model_name, context_map)
-        normalized_name = normalize_model_name(model_name)
-        normalized_keys = {normalize_model_name(key) for key in context_map}
+        registry = get_context_window_registry()
+        resolved = registry.lookup(model_name)
         if resolved is None and getattr(self, "context_window_mode", "auto") == "interactive":
             resolved = self._prompt_for_context_window(model_name)
-            if resolved is not None:
-                update_context_window_map(model_name, resolved)
         if resolved is not None:
             self.context_window_max = int(resolved)
-            if normalized_name not in normalized_keys:
-                update_context_window_map(model_name, resolved)
+            if not registry.contains(model_name):
+                registry.update(model_name, resolved)
 
     def _prompt_for_context_window(self, model_name: str) -> int | None:
         return None
 
     def _update_context_window_stats(self, message: dict) -> None:
+        if self.context_window_estimated_tokens is not None:
+            message.setdefault("extra", {})["estimated_prompt_tokens"] = self.context_window_estimated_tokens
         prompt_tokens = self._extract_prompt_tokens(message)
+        if prompt_tokens is None:
+            prompt_tokens = self.context_window_estimated_tokens
         if prompt_tokens is None:
             return
         self.context_window_prompt_tokens = prompt_tokens
@@ -188,9 +469,39 @@ def register_agent_enhancements() -> None:
     DefaultAgent.query = _patched_query
     DefaultAgent.get_template_vars = _patched_get_template_vars
     DefaultAgent.add_messages = _patched_add_messages
+    DefaultAgent.execute_actions = _patched_execute_actions
+    DefaultAgent._get_early_dispatcher = _get_early_dispatcher
+    DefaultAgent._execute_message_actions = _execute_message_actions
+    DefaultAgent.parallel_tool_calls = env_flag("MSWEA_PARALLEL_TOOL_CALLS", False)
+    DefaultAgent.parallel_tool_workers = env_int("MSWEA_PARALLEL_TOOL_WORKERS", 4)
+    DefaultAgent.context_preflight_percent = env_int("MSWEA_CONTEXT_PREFLIGHT_PERCENT", 100)
+    DefaultAgent._preflight_context_check = _preflight_context_check
+    DefaultAgent.handle_context_budget_exceeded = _handle_context_budget_exceeded
+    DefaultAgent.serialize = _patched_serialize
+    DefaultAgent.compaction_thresholds = _parse_thresholds(os.getenv("MSWEA_COMPACTION_THRESHOLDS", ""))
+    DefaultAgent.compaction_strategy = os.getenv("MSWEA_COMPACTION_STRATEGY", "truncate")
+    DefaultAgent.compaction_summary_model = os.getenv("MSWEA_COMPACTION_SUMMARY_MODEL", "")
+    DefaultAgent.compaction_keep_recent = env_int("MSWEA_COMPACTION_KEEP_RECENT", 6)
+    DefaultAgent.compaction_observation_chars = env_int("MSWEA_COMPACTION_OBSERVATION_CHARS", 2000)
+    DefaultAgent._maybe_compact = _maybe_compact
+    DefaultAgent.compact_history = _compact_history
+    DefaultAgent._estimate_prompt_tokens = _estimate_prompt_tokens
     DefaultAgent.set_live_trajectory_path = _set_live_trajectory_path
+    DefaultAgent.close_live_trajectory = _close_live_trajectory
+    DefaultAgent.restore_trajectory = _restore_trajectory
+    DefaultAgent.incremental_trajectory = env_flag("MSWEA_INCREMENTAL_TRAJECTORY", True)
+    DefaultAgent._save_step = _save_step
+    DefaultAgent._record_step_timings = _record_step_timings
+    DefaultAgent._finalize_trajectory = _finalize_trajectory
+    DefaultAgent.live_trajectory_flush_interval = env_float("MSWEA_LIVE_TRAJECTORY_FLUSH_INTERVAL", 0.5)
+    DefaultAgent.live_trajectory_fsync = os.getenv("MSWEA_LIVE_TRAJECTORY_FSYNC", "never")
     DefaultAgent.context_window_mode = "auto"
     DefaultAgent._resolve_context_window_max = _resolve_context_window_max
     DefaultAgent._prompt_for_context_window = _prompt_for_context_window
     DefaultAgent._update_context_window_stats = _update_context_window_stats
     DefaultAgent._extract_prompt_tokens = _extract_prompt_tokens
+
+
+def _parse_thresholds(value: str) -> tuple[int, ...]:
+    """Parse ``MSWEA_COMPACTION_THRESHOLDS`` ("30,15") into percentages, largest first."""
+    return tuple(sorted((int(part) for part in value.split(",") if part.strip()), reverse=True))
@@ -0,0 +1,148 @@
+"""Buffered, append-only live trajectory JSONL written from a background thread."""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Literal
+
+from minisweagent.utils.serialize import to_jsonable
+
+logger = logging.getLogger("live_trajectory")
+
+FsyncPolicy = Literal["never", "flush", "close"]
+
+_OPEN_SINKS: weakref.WeakSet[LiveTrajectorySink] = weakref.WeakSet()
+_CLOSE = object()
+
+
+class LiveTrajectorySink:
+    """Append messages to a JSONL file without doing file I/O on the caller's thread.
+
+    Messages are serialized by `write` (so later in-place edits do not leak into the file)
+    and handed to a writer thread through a bounded queue; `write` blocks when the queue
+    is full rather than dropping lines. The writer keeps the file open, writes whatever
+    is queued in one batch and flushes at most every ``flush_interval`` seconds, so
+    ``tail -f`` lags by at most that much. ``fsync`` is ``"never"``, on every
+    ``"flush"``, or once on ``"close"``.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        flush_interval: float = 0.5,
+        fsync: FsyncPolicy = "never",
+        max_queue: int = 1024,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._handle = None
+        self._failed = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="live-trajectory", daemon=True)
+        self._thread.start()
+        _OPEN_SINKS.add(self)
+
+    def write(self, messages: tuple[dict, ...] | list[dict]) -> None:
+        if self._closed or self._failed:
+            return
+        lines = "".join(json.dumps(to_jsonable(message)) + "\n" for message in messages)
+        self._queue.put(lines)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Block until everything written so far is on disk (or ``timeout`` expires)."""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float | None = 10.0) -> None:
+        """Flush, close the file and stop the writer thread. Safe to call more than once."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_CLOSE)
+        self._thread.join(timeout)
+        _OPEN_SINKS.discard(self)
+
+    def _run(self) -> None:
+        last_flush = 0.0
+        dirty = False
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval if dirty else None)
+            except queue.Empty:
+                item = None
+            batch, waiters, closing = [], [], False
+            while item is not None:
+                if item is _CLOSE:
+                    closing = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+            if batch:
+                self._write("".join(batch))
+                dirty = True
+            now = time.monotonic()
+            if dirty and (closing or waiters or now - last_flush >= self.flush_interval):
+                self._flush(sync=self.fsync == "flush" or (closing and self.fsync == "close"))
+                last_flush, dirty = now, False
+            for waiter in waiters:
+                waiter.set()
+            if closing:
+                self._close_handle()
+                return
+
+    def _write(self, data: str) -> None:
+        if self._failed:
+            return
+        try:
+            if self._handle is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._handle = self.path.open("a", encoding="utf-8")
+            self._handle.write(data)
+        except Exception as exc:
+            self._failed = True
+            logger.warning("Failed to write live trajectory to %s: %s", self.path, exc)
+
+    def _flush(self, *, sync: bool) -> None:
+        if self._handle is None or self._failed:
+            return
+        try:
+            self._handle.flush()
+            if sync:
+                os.fsync(self._handle.fileno())
+        except Exception as exc:
+            self._failed = True
+            logger.warning("Failed to flush live trajectory %s: %s", self.path, exc)
+
+    def _close_handle(self) -> None:
+        if self._handle is not None:
+            try:
+                self._handle.close()
+            except Exception as exc:
+                logger.warning("Failed to close live trajectory %s: %s", self.path, exc)
+            self._handle = None
+
+
+@atexit.register
+def close_live_trajectory_sinks() -> None:
+    """Flush and close every open sink."""
+    for sink in list(_OPEN_SINKS):
+        sink.close()
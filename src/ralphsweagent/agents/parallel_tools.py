@@ -0,0 +1,91 @@
+"""Run read-only tool calls from one model turn concurrently."""
+
+from __future__ import annotations
+
+import re
+import shlex
+from concurrent.futures import Future, ThreadPoolExecutor
+
+READ_ONLY_COMMANDS = frozenset(
+    "cat cut diff egrep fgrep file find grep head ls nl pwd rg sort stat tail uniq wc".split()
+)
+"""Programs that only read, as long as their output is not redirected into a file."""
+
+READ_ONLY_GIT_SUBCOMMANDS = frozenset("blame diff grep log ls-files rev-parse show status".split())
+
+_WRITING_FIND_FLAGS = frozenset("-delete -exec -execdir -ok -okdir -fprint -fprint0 -fprintf -fls".split())
+_UNSAFE_SHELL = re.compile(r"[;&`<>()$\n\\]")
+
+
+def _is_read_only_segment(words: list[str]) -> bool:
+    if not words:
+        return False
+    program, args = words[0], words[1:]
+    if program == "git":
+        subcommand = next((arg for arg in args if not arg.startswith("-")), "")
+        if subcommand == "grep" and any(_opens_pager(arg) for arg in args):
+            return False
+        return subcommand in READ_ONLY_GIT_SUBCOMMANDS and "--output" not in " ".join(args)
+    if program not in READ_ONLY_COMMANDS:
+        return False
+    if program == "find":
+        return not _WRITING_FIND_FLAGS.intersection(args)
+    if program == "sort":
+        return not any(arg == "-o" or arg.startswith("--output") for arg in args)
+    if program == "rg":
+        return not any(arg.startswith("--pre") for arg in args)
+    if program == "uniq":
+        # uniq writes its second operand.
+        return len([arg for arg in args if not arg.startswith("-")]) <= 1
+    return True
+
+
+def _opens_pager(arg: str) -> bool:
+    """``git grep -O``/``--open-files-in-pager``, also inside a cluster of short flags."""
+    if arg.startswith("--"):
+        return arg.startswith("--open-files-in-pager")
+    return arg.startswith("-") and "O" in arg
+
+
+def is_read_only_command(command: str) -> bool:
+    """True if ``command`` is a pipeline of known read-only programs without redirects or substitutions.
+
+    Anything the check does not understand counts as not read-only.
+    """
+    if not command.strip() or _UNSAFE_SHELL.search(command.replace("2>/dev/null", "")):
+        return False
+    try:
+        segments = [shlex.split(segment) for segment in command.split("|")]
+    except ValueError:
+        return False
+    return all(_is_read_only_segment(words) for words in segments)
+
+
+def execute_actions_concurrently(env, actions: list[dict], *, max_workers: int = 4) -> list[dict]:
+    """Execute ``actions`` in ``env`` and return their outputs in order.
+
+    Consecutive read-only actions run concurrently; any other action waits for everything before
+    it and runs alone. If an action raises (e.g. ``Submitted``), the exception propagates after
+    the actions before it have finished and no later action is started, as with sequential
+    execution (read-only actions of the same batch may already have run).
+    """
+    outputs: list[dict] = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="parallel-tools") as executor:
+        index = 0
+        while index < len(actions):
+            end = index + 1
+            if is_read_only_command(actions[index].get("command", "")):
+                while end < len(actions) and is_read_only_command(actions[end].get("command", "")):
+                    end += 1
+            if end - index == 1:
+                outputs.append(env.execute(actions[index]))
+            else:
+                futures: list[Future] = [executor.submit(env.execute, action) for action in actions[index:end]]
+                try:
+                    for future in futures:
+                        outputs.append(future.result())
+                finally:
+                    for future in futures:
+                        future.exception()
+            index = end
+    return outputs
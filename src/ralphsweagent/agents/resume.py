@@ -0,0 +1,94 @@
+"""Rebuild an interrupted run from the trajectory files it left behind."""
+
+from __future__ import annotations
+
+import json
+import logging
+from pathlib import Path
+
+from ralphsweagent.agents.trajectory_log import get_partial_trajectory_path, read_partial_trajectory
+
+logger = logging.getLogger("resume")
+
+
+class ResumeState:
+    """Messages, API calls and cost of an interrupted run, read from ``source``."""
+
+    def __init__(self, messages: list[dict], n_calls: int, cost: float, source: Path, info: dict | None = None):
+        self.messages = messages
+        self.n_calls = n_calls
+        self.cost = cost
+        self.source = source
+        self.info = info or {}
+
+    @property
+    def actions(self) -> list[dict]:
+        """Actions of the recorded steps, in the order they were executed."""
+        return [action for msg in self.messages for action in msg.get("extra", {}).get("actions", [])]
+
+
+def _read_live_trajectory(path: Path) -> list[dict]:
+    messages = []
+    with path.open(encoding="utf-8") as handle:
+        for line_number, line in enumerate(handle, 1):
+            try:
+                messages.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning("Ignoring unreadable line %s:%d", path, line_number)
+    return messages
+
+
+def _read_trajectory(output_path: Path, live_path: Path | None) -> tuple[dict, Path] | None:
+    """The most complete record of the run: partial log, then ``.traj.json``, then the live JSONL."""
+    partial_path = get_partial_trajectory_path(output_path)
+    if partial_path.exists():
+        return read_partial_trajectory(partial_path), partial_path
+    if output_path.exists():
+        try:
+            return json.loads(output_path.read_text()), output_path
+        except json.JSONDecodeError:
+            logger.warning("Ignoring unreadable trajectory %s", output_path)
+    if live_path is not None and live_path.exists():
+        return {"messages": _read_live_trajectory(live_path)}, live_path
+    return None
+
+
+def _drop_unfinished_step(messages: list[dict]) -> list[dict]:
+    """Drop a trailing model response whose actions have no recorded observations yet."""
+    if messages and messages[-1].get("extra", {}).get("actions"):
+        return messages[:-1]
+    return messages
+
+
+def load_resume_state(output_path: Path, live_path: Path | None = None) -> ResumeState | None:
+    """Read the state of an interrupted run, or None if there is nothing (left) to resume.
+
+    Runs that already ended (last message has role ``exit``) are not resumed. ``n_calls`` and
+    ``cost`` come from the saved model stats, or are recounted from the messages for a live JSONL.
+    """
+    found = _read_trajectory(output_path, live_path)
+    if found is None:
+        return None
+    data, source = found
+    messages = data.get("messages") or []
+    if len(messages) < 2 or messages[-1].get("role") == "exit":
+        return None
+    info = data.get("info") or {}
+    stats = info.get("model_stats") or {}
+    responses = [msg for msg in messages if msg.get("role") == "assistant" or msg.get("object") == "response"]
+    n_calls = stats.get("api_calls", len(responses))
+    cost = stats.get("instance_cost", sum(msg.get("extra", {}).get("cost", 0.0) for msg in responses))
+    return ResumeState(_drop_unfinished_step(messages), n_calls, cost, source, info)
+
+
+def replay_actions(env, actions: list[dict]) -> int:
+    """Re-run recorded actions in a fresh environment to restore its state. Returns how many ran.
+
+    Outputs are discarded; a failing action is logged and replay continues.
+    """
+    for action in actions:
+        try:
+            env.execute(action)
+        except Exception as e:
+            logger.warning("Replaying %r raised %s: %s", action.get("command"), type(e).__name__, e)
+    return len(actions)
@@ -0,0 +1,45 @@
+"""Per-step phase durations recorded in ``extra.timings`` and their per-run summary."""
+
+from __future__ import annotations
+
+import json
+import math
+from collections.abc import Iterable
+from pathlib import Path
+
+
+def collect_step_timings(messages: Iterable[dict]) -> list[dict[str, float]]:
+    """The ``extra.timings`` of every step (model response) in ``messages``."""
+    return [timings for msg in messages if (timings := msg.get("extra", {}).get("timings"))]
+
+
+def _percentile(sorted_values: list[float], percent: float) -> float:
+    """Nearest-rank percentile of an ascending, non-empty list."""
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize_timings(step_timings: Iterable[dict[str, float]]) -> dict[str, dict[str, float]]:
+    """Count, total, p50, p95 and max seconds per phase, over all steps that recorded the phase."""
+    by_phase: dict[str, list[float]] = {}
+    for timings in step_timings:
+        for phase, seconds in timings.items():
+            if isinstance(seconds, int | float):
+                by_phase.setdefault(phase, []).append(seconds)
+    summary = {}
+    for phase, values in sorted(by_phase.items()):
+        values.sort()
+        summary[phase] = {
+            "count": len(values),
+            "total": sum(values),
+            "p50": _percentile(values, 50),
+            "p95": _percentile(values, 95),
+            "max": values[-1],
+        }
+    return summary
+
+
+def write_timing_summary(path: Path, step_timings: Iterable[dict[str, float]]) -> dict[str, dict[str, float]]:
+    summary = summarize_timings(step_timings)
+    path.write_text(json.dumps(summary, indent=2))
+    return summary
@@ -0,0 +1,158 @@
+"""Append-only trajectory log saved every step and compacted into ``.traj.json`` at exit.
+
+Each line of ``<output>.partial.jsonl`` is one record:
+
+* ``{"messages": [...], "start": n}``: messages from index ``n`` on (earlier ones are kept,
+  later ones are replaced), i.e. the messages appended since the previous save, or the
+  tail from the first message that was replaced.
+* ``{"meta": {...}}``: changed metadata (everything but the messages), merged recursively.
+* ``{"meta": {...}, "replace": true}``: full metadata, written when a key disappeared.
+* ``{"index": n, "timings": {...}}``: final ``extra.timings`` of message ``n``, written once
+  its step has been timed completely (after the save that wrote the message).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import operator
+from pathlib import Path
+from typing import Any
+
+from minisweagent.utils.serialize import recursive_merge, to_jsonable
+
+logger = logging.getLogger("trajectory_log")
+
+PARTIAL_SUFFIX = ".partial.jsonl"
+
+
+def get_partial_trajectory_path(output_path: Path) -> Path:
+    return output_path.with_name(output_path.name + PARTIAL_SUFFIX)
+
+
+def _meta_delta(old: dict, new: dict) -> dict | None:
+    """Keys of ``new`` that differ from ``old`` (recursing into dicts), or None if a key was removed."""
+    if old.keys() - new.keys():
+        return None
+    delta = {}
+    for key, value in new.items():
+        if key not in old:
+            delta[key] = value
+        elif isinstance(value, dict) and isinstance(old[key], dict):
+            nested = _meta_delta(old[key], value)
+            if nested is None:
+                return None
+            if nested:
+                delta[key] = nested
+        elif value != old[key]:
+            delta[key] = value
+    return delta
+
+
+class TrajectoryLog:
+    """Writes only what changed since the previous `save`, so saving a step costs O(step).
+
+    Messages are tracked like prepared API input: a saved message is rewritten only when it
+    is replaced, removed or gains/loses a top-level key. Values edited in place inside an
+    already saved message are not picked up; replace the message dict instead.
+    """
+
+    def __init__(self, output_path: Path):
+        self.output_path = output_path
+        self.path = get_partial_trajectory_path(output_path)
+        self._sources: list[dict] = []
+        self._sizes: list[int] = []
+        self._meta: dict = {}
+        self._handle = None
+
+    def save(self, data: dict) -> None:
+        """Append the changes between ``data`` (as from ``agent.serialize()``) and the last save."""
+        messages = data.get("messages", [])
+        # Keep a placeholder so the messages keep their position in the compacted file.
+        meta = to_jsonable({k: None if k == "messages" else v for k, v in data.items()})
+        records = []
+        keep = self._matching_prefix(messages)
+        if keep < len(self._sources) or keep < len(messages):
+            records.append({"start": keep, "messages": to_jsonable(messages[keep:])})
+            del self._sources[keep:], self._sizes[keep:]
+            self._sources.extend(messages[keep:])
+            self._sizes.extend(len(msg) for msg in messages[keep:])
+        delta = _meta_delta(self._meta, meta)
+        if delta is None:
+            records.append({"meta": meta, "replace": True})
+        elif delta:
+            records.append({"meta": delta})
+        self._meta = meta
+        if records:
+            self._write("".join(json.dumps(record) + "\n" for record in records))
+
+    def _matching_prefix(self, messages: list[dict]) -> int:
+        limit = min(len(messages), len(self._sources))
+        head = messages[:limit]
+        if all(map(operator.is_, head, self._sources)) and list(map(len, head)) == self._sizes[:limit]:
+            return limit
+        for index, (msg, source, size) in enumerate(zip(head, self._sources, self._sizes)):
+            if msg is not source or len(msg) != size:
+                return index
+        return limit
+
+    def update_timings(self, index: int, timings: dict) -> None:
+        """Record the final ``extra.timings`` of the already saved message at ``index``."""
+        self._write(json.dumps({"index": index, "timings": to_jsonable(timings)}) + "\n")
+
+    def _write(self, data: str) -> None:
+        if self._handle is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._handle = self.path.open("w", encoding="utf-8")
+        self._handle.write(data)
+        self._handle.flush()
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def discard(self) -> None:
+        """Close and delete the log, e.g. once the final trajectory has been written."""
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+
+def apply_timings_record(messages: list[dict], record: dict) -> None:
+    """Apply an ``{"index": n, "timings": {...}}`` record, as written after a step, to ``messages``."""
+    if 0 <= record["index"] < len(messages):
+        messages[record["index"]].setdefault("extra", {})["timings"] = record["timings"]
+
+
+def read_partial_trajectory(path: Path) -> dict[str, Any]:
+    """Replay a ``.partial.jsonl`` log into trajectory data. A truncated last line is ignored."""
+    messages: list[dict] = []
+    meta: dict = {}
+    with path.open(encoding="utf-8") as handle:
+        for line_number, line in enumerate(handle, 1):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning("Ignoring unreadable record at %s:%d", path, line_number)
+                continue
+            if "messages" in record:
+                del messages[record["start"] :]
+                messages.extend(record["messages"])
+            if "meta" in record:
+                meta = record["meta"] if record.get("replace") else recursive_merge(meta, record["meta"])
+            if "timings" in record:
+                apply_timings_record(messages, record)
+    return {**meta, "messages": messages}
+
+
+def compact_partial_trajectory(path: Path, output_path: Path | None = None) -> Path:
+    """Write the ``.traj.json`` for a partial log and delete the log. Returns the output path."""
+    if output_path is None:
+        if not path.name.endswith(PARTIAL_SUFFIX):
+            raise ValueError(f"Cannot derive the trajectory path from {path}; pass an output path")
+        output_path = path.with_name(path.name[: -len(PARTIAL_SUFFIX)])
+    data = read_partial_trajectory(path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(data, indent=2))
+    path.unlink()
+    return output_path
@@ -0,0 +1 @@
+"""Environment wrappers for ralph-swe-agent."""
@@ -0,0 +1,100 @@
+"""Environment that starts in the background and is only waited for when it is first used."""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any
+
+from minisweagent.utils.serialize import recursive_merge
+
+
+class DeferredEnvironment:
+    """Runs ``factory()`` on a background thread and forwards to the environment it returns.
+
+    ``execute``, ``serialize`` and any other attribute block until startup has finished and
+    re-raise a startup error. ``get_template_vars`` answers from ``template_vars`` while startup
+    is still running, so the system and instance templates can be rendered and the first model
+    query sent before the container is up; without ``template_vars`` it waits for startup too.
+    ``startup_seconds`` and ``wait_seconds`` record how long startup took and how long callers
+    were blocked on it.
+
+    The startup thread is not a daemon: the interpreter waits for a starting environment, so
+    the cleanup registered by `cleanup` still runs on exit and after Ctrl-C.
+    """
+
+    def __init__(self, factory: Callable[[], Any], *, template_vars: dict | None = None):
+        self._template_vars = template_vars
+        self._future: Future = Future()
+        self.startup_seconds: float | None = None
+        self.wait_seconds = 0.0
+        self._thread = threading.Thread(target=self._start, args=(factory,), name="environment-startup")
+        self._thread.start()
+
+    def _start(self, factory: Callable[[], Any]) -> None:
+        started = time.monotonic()
+        try:
+            env = factory()
+        except BaseException as e:
+            self.startup_seconds = time.monotonic() - started
+            self._future.set_exception(e)
+        else:
+            self.startup_seconds = time.monotonic() - started
+            self._future.set_result(env)
+
+    @property
+    def ready(self) -> bool:
+        """Whether startup has finished, successfully or not."""
+        return self._future.done()
+
+    @property
+    def environment(self):
+        """The started environment, waiting for startup if needed."""
+        if not self._future.done():
+            started = time.monotonic()
+            self._future.exception()
+            self.wait_seconds += time.monotonic() - started
+        return self._future.result()
+
+    def execute(self, action: dict, cwd: str = "", **kwargs) -> dict[str, Any]:
+        return self.environment.execute(action, cwd, **kwargs)
+
+    def get_template_vars(self, **kwargs) -> dict[str, Any]:
+        if self._template_vars is None:
+            return self.environment.get_template_vars(**kwargs)
+        if self._future.done() and self._future.exception() is None:
+            return self._future.result().get_template_vars(**kwargs)
+        return recursive_merge(self._template_vars, kwargs)
+
+    def serialize(self) -> dict:
+        """The environment's serialization, or nothing if it failed to start."""
+        try:
+            return self.environment.serialize()
+        except Exception:
+            return {}
+
+    def cleanup(self, timeout: float | None = 60.0) -> None:
+        """Clean up the environment, waiting up to ``timeout`` seconds for startup to finish.
+
+        If startup is still running after ``timeout`` (or the wait is interrupted), the
+        environment is cleaned up on the startup thread as soon as it is up.
+        """
+        try:
+            self._future.exception(timeout=timeout)
+        except FutureTimeoutError:
+            pass
+        finally:
+            self._future.add_done_callback(_cleanup_started)
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.environment, name)
+
+
+def _cleanup_started(future: Future) -> None:
+    if future.exception() is None and hasattr(future.result(), "cleanup"):
+        future.result().cleanup()
@@ -9,6 +9,7 @@ ensure_vendor_minisweagent_on_path()
 from minisweagent import models as miniswe_models
 
 _MODEL_OVERRIDES = {
+    "cached": "ralphsweagent.models.cached_model.CachedModel",
     "litellm": "ralphsweagent.models.litellm_model.LitellmModel",
     "litellm_response": "ralphsweagent.models.litellm_response_model.LitellmResponseModel",
     "openrouter": "ralphsweagent.models.openrouter_model.OpenRouterModel",
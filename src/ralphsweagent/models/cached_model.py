@@ -0,0 +1,137 @@
+"""Record/replay cache around any model, keyed on the request the model would send."""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Any, Literal
+
+from pydantic import BaseModel
+
+from ralphsweagent.models.utils.response_cache import cache_key, get_response_cache
+from ralphsweagent.utils.env import env_int
+
+logger = logging.getLogger("cached_model")
+
+
+class CachedModelConfig(BaseModel):
+    wrapped_model: dict = {}
+    """Config of the wrapped model, as passed to `get_model` (e.g. `{"model_class": "litellm"}`)."""
+    model_name: str = ""
+    """Name of the wrapped model. Defaults to the wrapped model's `model_name`."""
+    cache_path: str = os.getenv("MSWEA_MODEL_CACHE_PATH", "~/.cache/ralph-swe-agent/model_responses.sqlite")
+    """SQLite file holding cached responses. Can be shared between runs and processes."""
+    cache_mode: Literal["read_through", "record", "replay"] = os.getenv("MSWEA_MODEL_CACHE_MODE", "read_through")
+    """`read_through` serves hits and records misses, `record` always queries and overwrites,
+    `replay` serves hits and raises `ResponseCacheMiss` on misses."""
+    cache_max_bytes: int = env_int("MSWEA_MODEL_CACHE_MAX_BYTES", 2 * 1024**3)
+    """Evict least-recently-used entries once the cache exceeds this size (0 disables eviction)."""
+
+
+class ResponseCacheMiss(Exception):
+    """Raised in `replay` mode when a request is not in the cache."""
+
+
+class CachedModel:
+    _FORWARDED_ATTRIBUTES = frozenset({"tool_call_listener", "_previous_response_id"})
+    """Attributes the agent sets on its model that belong to the wrapped model."""
+
+    def __init__(self, *, model=None, config_class: type = CachedModelConfig, **kwargs):
+        """Wrap ``model`` (or the model built from ``wrapped_model``) with a content-addressed response cache."""
+        self.config = config_class(**kwargs)
+        if model is None:
+            from minisweagent.models import get_model
+
+            model = get_model(config={"model_name": self.config.model_name, **self.config.wrapped_model})
+        self.model = model
+        if not self.config.model_name:
+            self.config.model_name = model.config.model_name
+        self.cache = get_response_cache(self.config.cache_path, max_bytes=self.config.cache_max_bytes)
+
+    def __getattr__(self, name: str):
+        """Attributes the wrapper does not define (e.g. ``_tools``) come from the wrapped model."""
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def __setattr__(self, name: str, value) -> None:
+        if name in self._FORWARDED_ATTRIBUTES:
+            setattr(self.model, name, value)
+        else:
+            super().__setattr__(name, value)
+
+    def _key(self, messages: list[dict], kwargs: dict) -> str:
+        """Hash of everything that determines the provider request."""
+        model = self.model
+        config = model.config
+        prepare = getattr(model, "_prepare_messages_for_api", None)
+        tools = getattr(model, "_tools", None)
+        return cache_key(
+            {
+                "model_name": config.model_name,
+                "messages": prepare(messages) if prepare else messages,
+                "tools": tools() if tools else None,
+                "tool_choice": getattr(config, "tool_choice", None),
+                "model_kwargs": getattr(config, "model_kwargs", {}),
+                "kwargs": kwargs,
+                "previous_response_id": getattr(model, "_previous_response_id", None),
+            }
+        )
+
+    def _lookup(self, key: str, messages: list[dict]) -> dict | None:
+        if self.config.cache_mode == "record":
+            return None
+        entry = self.cache.get(key)
+        if entry is None:
+            if self.config.cache_mode == "replay":
+                raise ResponseCacheMiss(f"No cached response for {self.config.model_name} (key {key})")
+            return None
+        message = entry["message"]
+        extra = message.setdefault("extra", {})
+        extra["cache"] = {"hit": True, "key": key, "cached_cost": extra.get("cost", 0.0)}
+        extra["cost"] = 0.0
+        extra["timestamp"] = time.time()
+        messages.extend(entry["appended"])
+        if message.get("object") == "response" and hasattr(self.model, "_previous_response_id"):
+            self.model._previous_response_id = message.get("id")
+        return message
+
+    def _store(self, key: str, message: dict, appended: list[dict]) -> dict:
+        self.cache.put(key, {"message": message, "appended": appended})
+        message.setdefault("extra", {})["cache"] = {"hit": False, "key": key}
+        return message
+
+    def query(self, messages: list[dict], **kwargs) -> dict:
+        key = self._key(messages, kwargs)
+        if (message := self._lookup(key, messages)) is not None:
+            return message
+        n_messages = len(messages)
+        message = self.model.query(messages, **kwargs)
+        return self._store(key, message, messages[n_messages:])
+
+    async def aquery(self, messages: list[dict], **kwargs) -> dict:
+        key = self._key(messages, kwargs)
+        if (message := self._lookup(key, messages)) is not None:
+            return message
+        n_messages = len(messages)
+        message = await self.model.aquery(messages, **kwargs)
+        return self._store(key, message, messages[n_messages:])
+
+    def format_message(self, **kwargs) -> dict:
+        return self.model.format_message(**kwargs)
+
+    def format_observation_messages(
+        self, message: dict, outputs: list[dict], template_vars: dict | None = None
+    ) -> list[dict]:
+        return self.model.format_observation_messages(message, outputs, template_vars)
+
+    def get_template_vars(self, **kwargs) -> dict[str, Any]:
+        return self.model.get_template_vars(**kwargs)
+
+    def serialize(self) -> dict:
+        data = self.model.serialize()
+        data.setdefault("info", {}).setdefault("config", {})["model_cache"] = self.config.model_dump(
+            mode="json", exclude={"wrapped_model"}
+        )
+        return data
@@ -2,14 +2,20 @@
 
 from __future__ import annotations
 
+import itertools
 import re
-import shutil
+import threading
+from collections.abc import Hashable, Iterator
+from contextlib import contextmanager
 from pathlib import Path
 
+import litellm
 import yaml
 
 from minisweagent import global_config_dir
 
+from ralphsweagent.utils.fs import atomic_write_text, file_lock
+
 _BUILTIN_CONFIG_DIR = Path(__file__).resolve().parent.parent / "config"
 _CONTEXT_WINDOW_FILENAME = "model_context_windows.yaml"
 _DATE_SUFFIX_RE = re.compile(r"-(?:\d{4}-\d{2}-\d{2}|\d{8})$")
@@ -20,6 +26,45 @@ _QUANT_SUFFIX_RE = re.compile(
 _Q_SUFFIX_RE = re.compile(r"-q\d+(?:_[a-z0-9_]+)?$")
 
 
+class ContextWindowBudgetExceeded(Exception):
+    """Raised before querying when the prompt would not fit the model's context window.
+
+    Unlike a provider-side context window error this is recoverable: the agent can shorten
+    its history and query again.
+    """
+
+    def __init__(self, estimated_tokens: int | None, context_window_max: int | None, reason: str = ""):
+        self.estimated_tokens = estimated_tokens
+        self.context_window_max = context_window_max
+        super().__init__(
+            reason or f"Prompt of ~{estimated_tokens} tokens exceeds the context window of {context_window_max} tokens"
+        )
+
+
+class ProviderContextWindowExceeded(Exception):
+    """The provider rejected the prompt because it does not fit the model's context window.
+
+    Models that do not go through litellm raise it for such HTTP errors (see `is_context_window_error`).
+    """
+
+
+CONTEXT_WINDOW_EXCEPTIONS: tuple[type[Exception], ...] = (
+    litellm.exceptions.ContextWindowExceededError,
+    ProviderContextWindowExceeded,
+)
+"""Exceptions a model's ``query`` raises when the provider rejects the prompt as too long for its context window."""
+
+_CONTEXT_WINDOW_ERROR_RE = re.compile(
+    r"context[ _-]?(?:length|window)|maximum context|prompt is too long|input is too long|too many (?:input )?tokens",
+    re.IGNORECASE,
+)
+
+
+def is_context_window_error(status_code: int | None, text: str | None) -> bool:
+    """Whether a provider's HTTP error says the prompt exceeds the model's context window."""
+    return status_code in (400, 413) and _CONTEXT_WINDOW_ERROR_RE.search(text or "") is not None
+
+
 def get_seed_context_window_path() -> Path:
     return _BUILTIN_CONFIG_DIR / _CONTEXT_WINDOW_FILENAME
 
@@ -40,14 +85,12 @@ def ensure_live_context_window_map(config_dir: Path | None = None) -> Path:
         raise FileNotFoundError(f"Seed context window map not found at {seed_path}")
 
     live_path.parent.mkdir(parents=True, exist_ok=True)
-    shutil.copyfile(seed_path, live_path)
+    atomic_write_text(live_path, seed_path.read_text())
     return live_path
 
 
-def load_context_window_map(config_dir: Path | None = None) -> dict[str, int]:
-    """Load the live context window map (creating it if missing)."""
-    live_path = ensure_live_context_window_map(config_dir)
-    data = yaml.safe_load(live_path.read_text()) or {}
+def _parse_context_window_map(text: str) -> dict[str, int]:
+    data = yaml.safe_load(text) or {}
     if not isinstance(data, dict):
         raise ValueError("Context window map must be a mapping of model names to token limits")
 
@@ -65,6 +108,11 @@ def load_context_window_map(config_dir: Path | None = None) -> dict[str, int]:
     return cleaned
 
 
+def load_context_window_map(config_dir: Path | None = None) -> dict[str, int]:
+    """Load the live context window map (creating it if missing)."""
+    return get_context_window_registry(config_dir).entries()
+
+
 def normalize_model_name(model_name: str) -> str:
     """Normalize model names to improve matching against the context window map."""
     normalized = model_name.strip().lower()
@@ -84,37 +132,188 @@ def normalize_model_name(model_name: str) -> str:
     return normalized
 
 
-def lookup_context_window(model_name: str, context_map: dict[str, int]) -> int | None:
-    """Resolve a model's context window using exact or longest-prefix match."""
-    normalized_name = normalize_model_name(model_name)
-    normalized_map = {normalize_model_name(key): int(value) for key, value in context_map.items()}
+_VALUE = ""
+"""Trie node key holding the context window of the key ending at that node (never a character)."""
+
+
+class ContextWindowIndex:
+    """Context window map compiled into a trie of normalized keys.
+
+    Built once per map version; `lookup` walks the normalized model name once, so exact and
+    longest-prefix matches cost O(len(name)) regardless of the number of entries.
+    """
+
+    def __init__(self, context_map: dict[str, int]):
+        self._root: dict = {}
+        self.exact: dict[str, int] = {}
+        for key, value in context_map.items():
+            normalized = normalize_model_name(key)
+            if not normalized:
+                continue
+            node = self._root
+            for char in normalized:
+                node = node.setdefault(char, {})
+            node[_VALUE] = self.exact[normalized] = int(value)
+
+    def lookup_normalized(self, normalized_name: str) -> int | None:
+        node = self._root
+        best = None
+        for char in normalized_name:
+            node = node.get(char)
+            if node is None:
+                break
+            best = node.get(_VALUE, best)
+        return best
+
+    def lookup(self, model_name: str) -> int | None:
+        return self.lookup_normalized(normalize_model_name(model_name))
 
-    if normalized_name in normalized_map:
-        return normalized_map[normalized_name]
 
-    best_key = ""
-    for key in normalized_map:
-        if normalized_name.startswith(key) and len(key) > len(best_key):
-            best_key = key
+_COMPILED_MAPS: dict[Hashable, ContextWindowIndex] = {}
+_COMPILED_MAPS_LOCK = threading.Lock()
+_MAX_COMPILED_MAPS = 8
+_REGISTRY_VERSIONS = itertools.count(1)
+"""Source of `ContextWindowRegistry.version`, unique across all registries of the process."""
 
-    return normalized_map.get(best_key) if best_key else None
+
+def compile_context_window_map(context_map: dict[str, int], version: Hashable | None = None) -> ContextWindowIndex:
+    """Return the compiled index for ``context_map``.
+
+    With a ``version`` (e.g. a `ContextWindowRegistry.version`), the index is cached under it
+    and reused without looking at the map again, so the caller must use a new version whenever
+    the map changes. Without one, the map is compiled on every call.
+    """
+    if version is None:
+        return ContextWindowIndex(context_map)
+    with _COMPILED_MAPS_LOCK:
+        cached = _COMPILED_MAPS.get(version)
+        if cached is not None:
+            return cached
+    index = ContextWindowIndex(context_map)
+    with _COMPILED_MAPS_LOCK:
+        if len(_COMPILED_MAPS) >= _MAX_COMPILED_MAPS:
+            _COMPILED_MAPS.pop(next(iter(_COMPILED_MAPS)))
+        _COMPILED_MAPS[version] = index
+    return index
+
+
+def lookup_context_window(model_name: str, context_map: dict[str, int], version: Hashable | None = None) -> int | None:
+    """Resolve a model's context window using exact or longest-prefix match (see `compile_context_window_map`)."""
+    return compile_context_window_map(context_map, version).lookup(model_name)
 
 
 def save_context_window_map(context_map: dict[str, int], config_dir: Path | None = None) -> Path:
     """Persist the context window map to the live config file."""
-    live_path = ensure_live_context_window_map(config_dir)
-    sanitized: dict[str, int] = {}
-    for key, value in context_map.items():
-        if key is None:
-            continue
-        sanitized[str(key)] = int(value)
-    live_path.write_text(yaml.safe_dump(sanitized, sort_keys=True))
-    return live_path
+    return get_context_window_registry(config_dir).save(context_map)
 
 
 def update_context_window_map(model_name: str, max_tokens: int, config_dir: Path | None = None) -> Path:
     """Update the live context window map with a resolved token limit."""
-    context_map = load_context_window_map(config_dir)
-    normalized_name = normalize_model_name(model_name)
-    context_map[normalized_name] = int(max_tokens)
-    return save_context_window_map(context_map, config_dir)
+    return get_context_window_registry(config_dir).update(model_name, max_tokens)
+
+
+class ContextWindowRegistry:
+    """In-memory view of the live context window map, shared by all agents in the process.
+
+    The file is parsed once and re-read only when its mtime, size or inode changes. Keys
+    are compiled once into a `ContextWindowIndex`, and lookups are memoized, so resolving a
+    model costs a ``stat`` and a dict lookup. Every (re)load gets a new `version`. Updates
+    re-read the file and write it atomically under a file lock, so concurrent workers and
+    processes do not lose each other's entries.
+    """
+
+    def __init__(self, config_dir: Path | None = None):
+        self.config_dir = config_dir
+        self.path = get_live_context_window_path(config_dir)
+        self._lock = threading.RLock()
+        self._stamp: tuple[int, int, int] | None = None
+        self._entries: dict[str, int] = {}
+        self._index = ContextWindowIndex({})
+        self.version = 0
+        """Identifies the loaded entries; changes whenever they are (re)loaded or updated."""
+        self._lookups: dict[str, int | None] = {}
+
+    def _refresh(self) -> None:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            ensure_live_context_window_map(self.config_dir)
+            stat = self.path.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if stamp == self._stamp:
+            return
+        self._set_entries(_parse_context_window_map(self.path.read_text()))
+        self._stamp = stamp
+
+    def _set_entries(self, entries: dict[str, int]) -> None:
+        self._entries = entries
+        self.version = next(_REGISTRY_VERSIONS)
+        self._index = compile_context_window_map(entries, self.version)
+        self._lookups = {}
+
+    def entries(self) -> dict[str, int]:
+        with self._lock:
+            self._refresh()
+            return dict(self._entries)
+
+    def snapshot(self) -> tuple[dict[str, int], int]:
+        """The entries together with their `version`, for `lookup_context_window`."""
+        with self._lock:
+            self._refresh()
+            return dict(self._entries), self.version
+
+    def lookup(self, model_name: str) -> int | None:
+        """Same result as `lookup_context_window` on the live map: exact, then longest-prefix match."""
+        with self._lock:
+            self._refresh()
+            if model_name in self._lookups:
+                return self._lookups[model_name]
+            resolved = self._index.lookup(model_name)
+            self._lookups[model_name] = resolved
+            return resolved
+
+    def contains(self, model_name: str) -> bool:
+        """Whether the map has an entry for exactly this (normalized) model name."""
+        with self._lock:
+            self._refresh()
+            return normalize_model_name(model_name) in self._index.exact
+
+    def update(self, model_name: str, max_tokens: int) -> Path:
+        with self._lock, self._locked_file():
+            entries = _parse_context_window_map(self.path.read_text())
+            entries[normalize_model_name(model_name)] = int(max_tokens)
+            self._write(entries)
+        return self.path
+
+    def save(self, context_map: dict[str, int]) -> Path:
+        sanitized = {str(key): int(value) for key, value in context_map.items() if key is not None}
+        with self._lock, self._locked_file():
+            self._write(sanitized)
+        return self.path
+
+    @contextmanager
+    def _locked_file(self) -> Iterator[None]:
+        ensure_live_context_window_map(self.config_dir)
+        with file_lock(self.path):
+            yield
+
+    def _write(self, entries: dict[str, int]) -> None:
+        atomic_write_text(self.path, yaml.safe_dump(entries, sort_keys=True))
+        stat = self.path.stat()
+        self._set_entries(entries)
+        self._stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+_REGISTRIES: dict[Path, ContextWindowRegistry] = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def get_context_window_registry(config_dir: Path | None = None) -> ContextWindowRegistry:
+    """Return the process-wide registry for the live map in ``config_dir``, creating it if needed."""
+    path = get_live_context_window_path(config_dir).resolve()
+    with _REGISTRIES_LOCK:
+        registry = _REGISTRIES.get(path)
+        if registry is None:
+            registry = ContextWindowRegistry(config_dir)
+            _REGISTRIES[path] = registry
+        return registry
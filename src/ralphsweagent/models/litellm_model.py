@@ -1,11 +1,10 @@
 import json
 import logging
 import os
-import re
 import time
-from collections.abc import Callable
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
 from pathlib import Path
-from types import SimpleNamespace
 from typing import Any, Literal
 
 import litellm
@@ -16,80 +15,23 @@ from minisweagent.models import GLOBAL_MODEL_STATS
 from ralphsweagent.models.utils.actions_toolcall import (
     BASH_TOOL,
     BASH_TOOL_WITH_REASONING,
+    _reasoning_is_valid,
     format_toolcall_observation_messages,
     parse_toolcall_actions,
 )
-from minisweagent.models.utils.anthropic_utils import _reorder_anthropic_thinking_blocks
-from minisweagent.models.utils.cache_control import set_cache_control
 from minisweagent.models.utils.openai_multimodal import expand_multimodal_content
 from minisweagent.models.utils.retry import retry
+from ralphsweagent.models.utils.retry import aretry
+from ralphsweagent.models.utils.stream_reassembly import StreamReassembler, _StreamingResponse
+from ralphsweagent.models.utils.message_prep import ChatMessagePreparer
+from ralphsweagent.models.utils.rate_limit import get_rate_limiter
+from ralphsweagent.utils.env import env_flag, env_int
 
 logger = logging.getLogger("litellm_model")
 
-CLOSING_TAG_RE = re.compile(r"</[^>]+>")
 
-
-def _env_flag(name: str, default: bool) -> bool:
-    value = os.getenv(name)
-    if value is None:
-        return default
-    return value.strip().lower() in {"1", "true", "yes", "on"}
-
-
-def _env_int(name: str, default: int) -> int:
-    value = os.getenv(name)
-    if value is None:
-        return default
-    try:
-        return int(value)
-    except ValueError:
-        return default
-
-
-class _StreamingMessage:
-    def __init__(self, *, role: str, content: str | None, tool_calls: list):
-        self.role = role
-        self.content = content
-        self.tool_calls = tool_calls
-
-    def model_dump(self) -> dict:
-        return {
-            "role": self.role,
-            "content": self.content,
-            "tool_calls": self.tool_calls,
-        }
-
-
-class _StreamingChoice:
-    def __init__(self, *, index: int, message: _StreamingMessage, finish_reason: str | None):
-        self.index = index
-        self.message = message
-        self.finish_reason = finish_reason
-
-    def model_dump(self) -> dict:
-        return {
-            "index": self.index,
-            "message": self.message.model_dump(),
-            "finish_reason": self.finish_reason,
-        }
-
-
-class _StreamingResponse(dict):
-    def __init__(self, *, choices: list[_StreamingChoice], usage: dict | None, model: str | None, **kwargs):
-        data: dict[str, Any] = {"choices": choices, **kwargs}
-        if usage is not None:
-            data["usage"] = usage
-        if model is not None:
-            data["model"] = model
-        super().__init__(data)
-        self.choices = choices
-        self.usage = usage
-        self.model = model
-
-    def model_dump(self) -> dict:
-        data = dict(self)
-        data["choices"] = [choice.model_dump() for choice in self.choices]
-        return data
+OBSERVATION_MAX_TOKENS = env_int("MSWEA_OBSERVATION_MAX_TOKENS", 0)
+"""Default ``observation_max_tokens`` of every model config (0 = unlimited; the budget is opt-in)."""
 
 
 class LitellmModelConfig(BaseModel):
@@ -103,16 +45,24 @@ class LitellmModelConfig(BaseModel):
     """Set explicit cache control markers, for example for Anthropic models"""
     cost_tracking: Literal["default", "ignore_errors"] = os.getenv("MSWEA_COST_TRACKING", "default")
     """Cost tracking mode for this model. Can be "default" or "ignore_errors" (ignore errors/missing cost info)"""
-    use_streaming: bool = _env_flag("MSWEA_USE_STREAMING", False)
+    use_streaming: bool = env_flag("MSWEA_USE_STREAMING", False)
     """Stream responses from LiteLLM to avoid long-response timeouts."""
-    stream_include_usage: bool = _env_flag("MSWEA_STREAM_INCLUDE_USAGE", True)
+    stream_include_usage: bool = env_flag("MSWEA_STREAM_INCLUDE_USAGE", True)
     """Include usage data in stream chunks when supported."""
-    stream_guard_enabled: bool = _env_flag("MSWEA_STREAM_GUARD_ENABLED", False)
+    stream_guard_enabled: bool = env_flag("MSWEA_STREAM_GUARD_ENABLED", False)
     """Enable stream guard to stop pathological closing-tag repetition."""
-    stream_guard_window: int = _env_int("MSWEA_STREAM_GUARD_WINDOW", 8192)
+    stream_guard_window: int = env_int("MSWEA_STREAM_GUARD_WINDOW", 8192)
     """Window size in characters for stream guard repetition detection."""
-    stream_guard_tag_threshold: int = _env_int("MSWEA_STREAM_GUARD_TAG_THRESHOLD", 50)
+    stream_guard_tag_threshold: int = env_int("MSWEA_STREAM_GUARD_TAG_THRESHOLD", 50)
     """Closing-tag repetition threshold in the rolling window before truncation."""
+    requests_per_minute: int = env_int("MSWEA_RATE_LIMIT_RPM", 0)
+    """Requests per minute shared by all instances of this model in the process (0 = unlimited)."""
+    tokens_per_minute: int = env_int("MSWEA_RATE_LIMIT_TPM", 0)
+    """Tokens per minute shared by all instances of this model in the process (0 = unlimited)."""
+    observation_max_tokens: int = OBSERVATION_MAX_TOKENS
+    """Approximate tokens of command output kept per observation (0 = unlimited). Shrinks as the context fills up."""
+    early_tool_dispatch: bool = env_flag("MSWEA_EARLY_TOOL_DISPATCH", False)
+    """When streaming, let the agent start executing each bash tool call as soon as its arguments are complete."""
     tool_choice: Any | None = None
     """Tool choice configuration passed to the API (e.g., "required")."""
     require_reasoning: bool = False
@@ -130,18 +80,36 @@ class LitellmModelConfig(BaseModel):
     """Regex to extract multimodal content. Empty string disables multimodal processing."""
 
 
+class StreamInterruptedAfterDispatch(Exception):
+    """A streamed response failed after some of its tool calls were handed to ``tool_call_listener``.
+
+    Never retried: a new attempt would dispatch its tool calls again, and they may not be idempotent.
+    """
+
+
 class LitellmModel:
+    tool_call_listener: Callable[[dict], None] | None = None
+    """Set by the agent to receive each streamed bash action as soon as its arguments are complete."""
+
     abort_exceptions: list[type[Exception]] = [
         litellm.exceptions.UnsupportedParamsError,
         litellm.exceptions.NotFoundError,
         litellm.exceptions.PermissionDeniedError,
         litellm.exceptions.ContextWindowExceededError,
         litellm.exceptions.AuthenticationError,
+        StreamInterruptedAfterDispatch,
         KeyboardInterrupt,
     ]
 
     def __init__(self, *, config_class: Callable = LitellmModelConfig, **kwargs):
         self.config = config_class(**kwargs)
+        self._message_preparer = ChatMessagePreparer()
+        self._rate_limiter = get_rate_limiter(
+            "litellm",
+            self.config.model_name,
+            requests_per_minute=self.config.requests_per_minute,
+            tokens_per_minute=self.config.tokens_per_minute,
+        )
         if self.config.litellm_model_registry and Path(self.config.litellm_model_registry).is_file():
             litellm.utils.register_model(json.loads(Path(self.config.litellm_model_registry).read_text()))
 
@@ -154,40 +122,99 @@ class LitellmModel:
             e.message += " You can permanently set your API key with `mini-extra config set KEY VALUE`."
             raise e
 
-    def _query_non_streaming(self, messages: list[dict[str, str]], **kwargs):
+    async def _aquery(self, messages: list[dict[str, str]], **kwargs):
+        try:
+            if self.config.use_streaming:
+                return await self._aquery_streaming(messages, **kwargs)
+            return await self._aquery_non_streaming(messages, **kwargs)
+        except litellm.exceptions.AuthenticationError as e:
+            e.message += " You can permanently set your API key with `mini-extra config set KEY VALUE`."
+            raise e
+
+    def _rate_limited(self, messages: list[dict], send: Callable[[], Any]):
+        """Send one request through the shared rate limiter. ``send`` returns the complete response."""
+        response = self._rate_limiter.run(messages, send)
+        self._update_rate_limit_headers(response)
+        return response
+
+    async def _arate_limited(self, messages: list[dict], send: Callable[[], Awaitable[Any]]):
+        response = await self._rate_limiter.arun(messages, send)
+        self._update_rate_limit_headers(response)
+        return response
+
+    def _update_rate_limit_headers(self, response) -> None:
+        hidden_params = getattr(response, "_hidden_params", None)
+        if isinstance(hidden_params, dict):
+            self._rate_limiter.update_from_headers(hidden_params.get("additional_headers"))
+
+    def _tools(self) -> list[dict]:
+        return [BASH_TOOL_WITH_REASONING] if self.config.require_reasoning else [BASH_TOOL]
+
+    def _completion_kwargs(self, messages: list[dict[str, str]], *, tool_choice: Any | None = None, **kwargs) -> dict:
+        """Request kwargs; a per-call ``tool_choice`` overrides the configured one."""
         request_kwargs = self.config.model_kwargs | kwargs
-        tool_choice = self.config.tool_choice
+        if tool_choice is None:
+            tool_choice = self.config.tool_choice
         if tool_choice is not None:
             request_kwargs["tool_choice"] = tool_choice
-        return litellm.completion(
-            model=self.config.model_name,
-            messages=messages,
-            tools=[BASH_TOOL_WITH_REASONING] if self.config.require_reasoning else [BASH_TOOL],
+        return {
+            "model": self.config.model_name,
+            "messages": messages,
+            "tools": self._tools(),
             **request_kwargs,
-        )
+        }
 
-    def _query_streaming(self, messages: list[dict[str, str]], **kwargs):
-        stream_kwargs = self.config.model_kwargs | kwargs
-        tool_choice = self.config.tool_choice
-        if tool_choice is not None:
-            stream_kwargs["tool_choice"] = tool_choice
+    def _streaming_completion_kwargs(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        stream_kwargs = self._completion_kwargs(messages, **kwargs)
         if self.config.stream_include_usage:
             stream_options = dict(stream_kwargs.get("stream_options") or {})
             stream_options.setdefault("include_usage", True)
             stream_kwargs["stream_options"] = stream_options
-        stream = litellm.completion(
-            model=self.config.model_name,
-            messages=messages,
-            tools=[BASH_TOOL_WITH_REASONING] if self.config.require_reasoning else [BASH_TOOL],
-            stream=True,
-            **stream_kwargs,
+        stream_kwargs["stream"] = True
+        return stream_kwargs
+
+    def _query_non_streaming(self, messages: list[dict[str, str]], **kwargs):
+        return self._rate_limited(messages, lambda: litellm.completion(**self._completion_kwargs(messages, **kwargs)))
+
+    async def _aquery_non_streaming(self, messages: list[dict[str, str]], **kwargs):
+        return await self._arate_limited(
+            messages, lambda: litellm.acompletion(**self._completion_kwargs(messages, **kwargs))
         )
-        response = self._reconstruct_stream_response(stream)
+
+    def _query_streaming(self, messages: list[dict[str, str]], **kwargs):
+        reassembler = self._stream_reassembler()
+
+        def send():
+            stream = litellm.completion(**self._streaming_completion_kwargs(messages, **kwargs))
+            return self._reconstruct_stream_response(stream, reassembler)
+
+        with self._no_retry_after_dispatch(reassembler):
+            response = self._rate_limited(messages, send)
         if self.config.stream_include_usage and not self._is_usage_valid(response.usage):
+            if reassembler.dispatched:
+                logger.warning("Streaming response missing usage after dispatching tool calls; estimating usage.")
+                return self._estimate_stream_usage(messages, response)
             logger.warning("Streaming response missing usage; retrying non-streaming completion for cost tracking.")
             return self._query_non_streaming(messages, **kwargs)
         return response
 
+    async def _aquery_streaming(self, messages: list[dict[str, str]], **kwargs):
+        reassembler = self._stream_reassembler()
+
+        async def send():
+            stream = await litellm.acompletion(**self._streaming_completion_kwargs(messages, **kwargs))
+            return await self._areconstruct_stream_response(stream, reassembler)
+
+        with self._no_retry_after_dispatch(reassembler):
+            response = await self._arate_limited(messages, send)
+        if self.config.stream_include_usage and not self._is_usage_valid(response.usage):
+            if reassembler.dispatched:
+                logger.warning("Streaming response missing usage after dispatching tool calls; estimating usage.")
+                return self._estimate_stream_usage(messages, response)
+            logger.warning("Streaming response missing usage; retrying non-streaming completion for cost tracking.")
+            return await self._aquery_non_streaming(messages, **kwargs)
+        return response
+
     @staticmethod
     def _is_usage_valid(usage: dict | None) -> bool:
         if not isinstance(usage, dict):
@@ -198,216 +225,177 @@ class LitellmModel:
                 return False
         return True
 
-    @staticmethod
-    def _normalize_usage(usage: Any) -> dict | None:
-        if usage is None:
-            return None
-        if isinstance(usage, dict):
-            return usage
-        if hasattr(usage, "model_dump"):
-            return usage.model_dump()
-        if hasattr(usage, "__dict__"):
-            return usage.__dict__
-        return None
-
-    @staticmethod
-    def _normalize_tool_call_delta(tool_call: Any) -> dict | None:
-        if tool_call is None:
-            return None
-        if isinstance(tool_call, dict):
-            return tool_call
-        if hasattr(tool_call, "model_dump"):
-            return tool_call.model_dump()
-        if hasattr(tool_call, "__dict__"):
-            return tool_call.__dict__
-        return None
-
-    def _accumulate_tool_calls(self, tool_calls_by_index: dict[int, dict], delta_tool_calls: list[Any]) -> None:
-        for raw_tool_call in delta_tool_calls:
-            tool_call = self._normalize_tool_call_delta(raw_tool_call)
-            if not tool_call:
-                continue
-            index = tool_call.get("index", 0)
-            entry = tool_calls_by_index.setdefault(
-                index, {"id": None, "type": None, "function": {"name": None, "arguments": ""}}
-            )
-            if tool_call.get("id"):
-                entry["id"] = tool_call["id"]
-            if tool_call.get("type"):
-                entry["type"] = tool_call["type"]
-            function = tool_call.get("function") or {}
-            if function.get("name"):
-                entry["function"]["name"] = function["name"]
-            if function.get("arguments"):
-                entry["function"]["arguments"] += function["arguments"]
-
-    def _build_tool_calls(self, tool_calls_by_index: dict[int, dict]) -> list:
-        tool_calls = []
-        for index in sorted(tool_calls_by_index):
-            data = tool_calls_by_index[index]
-            function = SimpleNamespace(
-                name=data["function"].get("name"),
-                arguments=data["function"].get("arguments", ""),
-            )
-            tool_call = SimpleNamespace(id=data.get("id"), function=function, type=data.get("type"))
-            tool_calls.append(tool_call)
-        return tool_calls
-
-    def _reconstruct_stream_response(self, stream) -> _StreamingResponse:
-        content_text = ""
-        tool_calls_by_index: dict[int, dict] = {}
-        usage: dict | None = None
-        finish_reason: str | None = None
-        role = "assistant"
-        model = None
-        response_id = None
-        created = None
-        for chunk in stream:
-            if chunk is None:
-                continue
-            model = getattr(chunk, "model", model)
-            response_id = getattr(chunk, "id", response_id)
-            created = getattr(chunk, "created", created)
-            chunk_usage = self._normalize_usage(getattr(chunk, "usage", None))
-            if chunk_usage is not None:
-                usage = chunk_usage
-            choices = getattr(chunk, "choices", None)
-            if not choices:
-                continue
-            choice = choices[0]
-            finish_reason = getattr(choice, "finish_reason", finish_reason)
-            delta = getattr(choice, "delta", None) or getattr(choice, "message", None)
-            if not delta:
-                continue
-            delta_role = getattr(delta, "role", None)
-            if delta_role:
-                role = delta_role
-            delta_tool_calls = getattr(delta, "tool_calls", None)
-            if delta_tool_calls:
-                self._accumulate_tool_calls(tool_calls_by_index, delta_tool_calls)
-            delta_content = getattr(delta, "content", None)
-            if delta_content:
-                content_text += delta_content
-                if self._should_trigger_stream_guard(content_text):
-                    content_text = self._truncate_stream_content(content_text)
-                    logger.warning("Stream guard triggered; truncating streamed content.")
-                    break
-
-        tool_calls = self._build_tool_calls(tool_calls_by_index) if tool_calls_by_index else []
-        content = content_text if content_text else None
-        message = _StreamingMessage(role=role, content=content, tool_calls=tool_calls)
-        choice = _StreamingChoice(index=0, message=message, finish_reason=finish_reason)
-        return _StreamingResponse(
-            choices=[choice],
-            usage=usage,
-            model=model,
-            id=response_id,
-            created=created,
+    def _stream_reassembler(self) -> StreamReassembler:
+        on_tool_call = self._on_streamed_tool_call if self.tool_call_listener is not None else None
+        if not self.config.stream_guard_enabled:
+            return StreamReassembler(on_tool_call=on_tool_call)
+        return StreamReassembler(
+            guard_window=self.config.stream_guard_window,
+            guard_threshold=self.config.stream_guard_tag_threshold,
+            on_tool_call=on_tool_call,
         )
 
-    def _should_trigger_stream_guard(self, content: str) -> bool:
-        if not self.config.stream_guard_enabled:
+    def _on_streamed_tool_call(self, tool_call_id: str, name: str | None, arguments: dict) -> bool:
+        """Forward a completed tool call to the listener if `parse_toolcall_actions` would accept it."""
+        if name != "bash" or "command" not in arguments:
             return False
-        window_size = self.config.stream_guard_window
-        threshold = self.config.stream_guard_tag_threshold
-        if window_size <= 0 or threshold <= 0:
+        if self.config.require_reasoning and not _reasoning_is_valid(arguments.get("reasoning")):
             return False
-        window = content[-window_size:] if len(content) > window_size else content
-        matches = list(CLOSING_TAG_RE.finditer(window))
-        return len(matches) >= threshold
-
-    def _truncate_stream_content(self, content: str) -> str:
-        window_size = self.config.stream_guard_window
-        threshold = self.config.stream_guard_tag_threshold
-        if window_size <= 0 or threshold <= 0:
-            return content
-        window = content[-window_size:] if len(content) > window_size else content
-        matches = list(CLOSING_TAG_RE.finditer(window))
-        if len(matches) < threshold:
-            return content
-        cutoff = len(content) - len(window) + matches[threshold - 1].start()
-        return content[:cutoff]
+        self.tool_call_listener({"command": arguments["command"], "tool_call_id": tool_call_id})
+        return True
+
+    def _estimate_stream_usage(self, messages: list[dict], response: _StreamingResponse) -> _StreamingResponse:
+        """Fill in missing usage from token counts instead of re-querying after actions were dispatched."""
+        message = response.choices[0].message
+        completion = (message.content or "") + "".join(tc.function.arguments or "" for tc in message.tool_calls)
+        prompt_tokens = litellm.token_counter(model=self.config.model_name, messages=messages)
+        completion_tokens = litellm.token_counter(model=self.config.model_name, text=completion)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        response["usage"] = response.usage = usage
+        return response
+
+    def _reconstruct_stream_response(self, stream, reassembler: StreamReassembler) -> _StreamingResponse:
+        for chunk in stream:
+            if reassembler.add(chunk):
+                logger.warning("Stream guard triggered; truncating streamed content.")
+                break
+        response = reassembler.build()
+        response._hidden_params = getattr(stream, "_hidden_params", None)
+        return response
+
+    async def _areconstruct_stream_response(self, stream, reassembler: StreamReassembler) -> _StreamingResponse:
+        async for chunk in stream:
+            if reassembler.add(chunk):
+                logger.warning("Stream guard triggered; truncating streamed content.")
+                break
+        response = reassembler.build()
+        response._hidden_params = getattr(stream, "_hidden_params", None)
+        return response
 
     def _prepare_messages_for_api(self, messages: list[dict]) -> list[dict]:
-        prepared = [{k: v for k, v in msg.items() if k != "extra"} for msg in messages]
-        prepared = _reorder_anthropic_thinking_blocks(prepared)
-        return set_cache_control(prepared, mode=self.config.set_cache_control)
+        return self._message_preparer.prepare(messages, cache_control=self.config.set_cache_control)
 
-    def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
+    def _query_with_retries(self, messages: list[dict[str, str]], **kwargs):
         for attempt in retry(logger=logger, abort_exceptions=self.abort_exceptions):
             with attempt:
                 response = self._query(self._prepare_messages_for_api(messages), **kwargs)
-        cost_output = self._calculate_cost(response)
-        GLOBAL_MODEL_STATS.add(cost_output["cost"])
-        message = response.choices[0].message.model_dump()
+        return response
+
+    async def _aquery_with_retries(self, messages: list[dict[str, str]], **kwargs):
+        async for attempt in aretry(logger=logger, abort_exceptions=self.abort_exceptions):
+            with attempt:
+                response = await self._aquery(self._prepare_messages_for_api(messages), **kwargs)
+        return response
+
+    @staticmethod
+    @contextmanager
+    def _no_retry_after_dispatch(reassembler: StreamReassembler) -> Iterator[None]:
+        """Turn a failure of a stream that already dispatched tool calls into `StreamInterruptedAfterDispatch`.
+
+        The count lives on the per-call ``reassembler``, so concurrent queries of one model do not mix it up.
+        """
+        try:
+            yield
+        except Exception as e:
+            if reassembler.dispatched:
+                msg = f"Stream failed after dispatching {reassembler.dispatched} tool call(s): {e}"
+                raise StreamInterruptedAfterDispatch(msg) from e
+            raise
+
+    def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        response = self._query_with_retries(messages, **kwargs)
+        cost_output = self._track_cost(response)
         try:
-            actions = self._parse_actions(response)
+            return self._response_to_message(response, cost_output)
         except FormatError as e:
-            # Check if eligible for graceful retry (missing tool calls only)
-            original_tool_calls = response.choices[0].message.tool_calls
-            if (
-                not original_tool_calls
-                and self.config.retry_missing_tool_calls
-                and self.config.tool_choice != "required"
-                and self.config.model_kwargs.get("tool_choice") != "required"
-            ):
+            if self._should_retry_missing_tool_calls(response):
                 # Append failed response + nudge to conversation (visible in trajectory)
-                nudge_messages = [
-                    {"role": "assistant", "content": message.get("content")},
-                    {"role": "user", "content": "You must respond using the bash tool."},
-                ]
-                messages.extend(nudge_messages)
-                try:
-                    # Retry with tool_choice="required" (one-shot override)
-                    saved_tool_choice = self.config.tool_choice
-                    self.config.tool_choice = "required"
-                    try:
-                        for retry_attempt in retry(
-                            logger=logger, abort_exceptions=self.abort_exceptions
-                        ):
-                            with retry_attempt:
-                                retry_response = self._query(
-                                    self._prepare_messages_for_api(messages), **kwargs
-                                )
-                    finally:
-                        self.config.tool_choice = saved_tool_choice
-                    retry_cost = self._calculate_cost(retry_response)
-                    GLOBAL_MODEL_STATS.add(retry_cost["cost"])
-                    retry_message = retry_response.choices[0].message.model_dump()
-                    retry_actions = self._parse_actions(retry_response)
-                    # Retry succeeded
-                    retry_message["extra"] = {
-                        "actions": retry_actions,
-                        "response": retry_response.model_dump(),
-                        "cost": cost_output["cost"] + retry_cost["cost"],
-                        "timestamp": time.time(),
-                    }
-                    return retry_message
-                except FormatError:
-                    # Retry also failed — undo message modifications, fall through
-                    del messages[-2:]
-
-            # Original error path (unchanged)
-            debug_message = {
-                "role": "assistant",
-                "content": message.get("content"),
-                "tool_calls": message.get("tool_calls"),
-                "extra": {
-                    "parse_error": True,
-                    "response": response.model_dump(),
-                    **cost_output,
-                    "timestamp": time.time(),
-                },
-            }
-            raise FormatError(debug_message, *e.messages) from e
+                messages.extend(self._missing_tool_calls_nudge(response))
+                retry_response = self._query_with_retries(messages, tool_choice="required", **kwargs)
+                if (message := self._retried_message(messages, cost_output, retry_response)) is not None:
+                    return message
+            raise self._format_error(response, cost_output, e) from e
+
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        """Async variant of `query` with the same retry, cost and action-parsing semantics."""
+        response = await self._aquery_with_retries(messages, **kwargs)
+        cost_output = self._track_cost(response)
+        try:
+            return self._response_to_message(response, cost_output)
+        except FormatError as e:
+            if self._should_retry_missing_tool_calls(response):
+                messages.extend(self._missing_tool_calls_nudge(response))
+                retry_response = await self._aquery_with_retries(messages, tool_choice="required", **kwargs)
+                if (message := self._retried_message(messages, cost_output, retry_response)) is not None:
+                    return message
+            raise self._format_error(response, cost_output, e) from e
+
+    def _track_cost(self, response) -> dict[str, float]:
+        cost_output = self._calculate_cost(response)
+        GLOBAL_MODEL_STATS.add(cost_output["cost"])
+        return cost_output
+
+    def _retried_message(self, messages: list[dict], cost_output: dict[str, float], retry_response) -> dict | None:
+        """The message for the ``tool_choice="required"`` retry, or None after undoing the nudge if it failed too.
+
+        ``tool_choice`` is passed per call rather than set on the shared config, so concurrent
+        queries of the same model keep their own tool choice.
+        """
+        retry_cost = self._track_cost(retry_response)
+        try:
+            return self._response_to_message(retry_response, {"cost": cost_output["cost"] + retry_cost["cost"]})
+        except FormatError:
+            del messages[-2:]
+            return None
+
+    def _response_to_message(self, response, cost_output: dict[str, float]) -> dict:
+        """Build the agent message for a response. Raises FormatError if actions can't be parsed."""
+        message = response.choices[0].message.model_dump()
         message["extra"] = {
-            "actions": actions,
+            "actions": self._parse_actions(response),
             "response": response.model_dump(),
             **cost_output,
             "timestamp": time.time(),
         }
+        time_to_first_token = getattr(response, "time_to_first_token", None)
+        if time_to_first_token is not None:
+            message["extra"]["timings"] = {"time_to_first_token": time_to_first_token}
         return message
 
+    def _should_retry_missing_tool_calls(self, response) -> bool:
+        """Only retry when the response had no tool calls at all and tool calls are not already forced."""
+        return (
+            not response.choices[0].message.tool_calls
+            and self.config.retry_missing_tool_calls
+            and self.config.tool_choice != "required"
+            and self.config.model_kwargs.get("tool_choice") != "required"
+        )
+
+    def _missing_tool_calls_nudge(self, response) -> list[dict]:
+        return [
+            {"role": "assistant", "content": response.choices[0].message.model_dump().get("content")},
+            {"role": "user", "content": "You must respond using the bash tool."},
+        ]
+
+    def _format_error(self, response, cost_output: dict[str, float], error: FormatError) -> FormatError:
+        message = response.choices[0].message.model_dump()
+        debug_message = {
+            "role": "assistant",
+            "content": message.get("content"),
+            "tool_calls": message.get("tool_calls"),
+            "extra": {
+                "parse_error": True,
+                "response": response.model_dump(),
+                **cost_output,
+                "timestamp": time.time(),
+            },
+        }
+        return FormatError(debug_message, *error.messages)
+
     def _calculate_cost(self, response) -> dict[str, float]:
         try:
             cost = litellm.cost_calculator.completion_cost(response, model=self.config.model_name)
@@ -451,6 +439,7 @@ class LitellmModel:
             observation_template=self.config.observation_template,
             template_vars=template_vars,
             multimodal_regex=self.config.multimodal_regex,
+            observation_max_tokens=self.config.observation_max_tokens,
         )
 
     def get_template_vars(self, **kwargs) -> dict[str, Any]:
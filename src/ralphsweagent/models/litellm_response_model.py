@@ -1,4 +1,6 @@
+import json
 import logging
+import re
 import time
 from collections.abc import Callable
 
@@ -6,6 +8,7 @@ import litellm
 
 from minisweagent.models import GLOBAL_MODEL_STATS
 from ralphsweagent.models.litellm_model import LitellmModel, LitellmModelConfig
+from ralphsweagent.utils.env import env_flag
 from ralphsweagent.models.utils.actions_toolcall_response import (
     BASH_TOOL_RESPONSE_API,
     BASH_TOOL_RESPONSE_API_WITH_REASONING,
@@ -14,57 +17,152 @@ from ralphsweagent.models.utils.actions_toolcall_response import (
 )
 from ralphsweagent.models.utils.openai_utils import coerce_responses_text
 from minisweagent.models.utils.retry import retry
+from ralphsweagent.models.utils.retry import aretry
+from ralphsweagent.models.utils.message_prep import (
+    PreparedMessageCache,
+    flatten_response_message,
+    prepare_response_items,
+)
 
 logger = logging.getLogger("litellm_response_model")
 
+PREVIOUS_RESPONSE_RE = re.compile(r"previous[_ ]response", re.IGNORECASE)
+
 
 class LitellmResponseModelConfig(LitellmModelConfig):
-    pass
+    stateful: bool = env_flag("MSWEA_RESPONSES_STATEFUL", False)
+    """Send only the items added since the last response together with `previous_response_id`
+    instead of the full history. Falls back to a full replay if the provider rejects the id."""
+
+
+def _is_previous_response_rejection(error: Exception) -> bool:
+    """Whether the provider refused the `previous_response_id` (unknown, expired or not stored)."""
+    if not isinstance(error, (litellm.exceptions.BadRequestError, litellm.exceptions.NotFoundError)):
+        return False
+    return PREVIOUS_RESPONSE_RE.search(str(error)) is not None
+
+
+def _input_chars(items: list[dict]) -> int:
+    return len(json.dumps(items, default=str))
 
 
 class LitellmResponseModel(LitellmModel):
     def __init__(self, *, config_class: Callable = LitellmResponseModelConfig, **kwargs):
         super().__init__(config_class=config_class, **kwargs)
         self._previous_response_id: str | None = None
+        self._message_cache = PreparedMessageCache(flatten_response_message)
 
     def _prepare_messages_for_api(self, messages: list[dict]) -> list[dict]:
         """Flatten response objects into their output items for stateless API calls."""
-        result = []
-        for msg in messages:
-            if msg.get("object") == "response":
-                for item in msg.get("output", []):
-                    result.append({k: v for k, v in item.items() if k != "extra"})
-            else:
-                result.append({k: v for k, v in msg.items() if k != "extra"})
-        return result
+        return self._message_cache.prepare(messages)
+
+    def _delta_input(self, messages: list[dict]) -> tuple[list[dict], str | None]:
+        """Return the items added after the last response and its id, or the full history and None."""
+        if self._previous_response_id:
+            for index in range(len(messages) - 1, -1, -1):
+                msg = messages[index]
+                if msg.get("object") == "response" and msg.get("id") == self._previous_response_id:
+                    return prepare_response_items(messages[index + 1 :]), self._previous_response_id
+        return self._prepare_messages_for_api(messages), None
+
+    def _tools(self) -> list[dict]:
+        return [BASH_TOOL_RESPONSE_API_WITH_REASONING] if self.config.require_reasoning else [BASH_TOOL_RESPONSE_API]
+
+    def _responses_kwargs(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        request_kwargs = self.config.model_kwargs | kwargs
+        if self._previous_response_id and not self.config.stateful:
+            request_kwargs.setdefault("previous_response_id", self._previous_response_id)
+        if self.config.tool_choice is not None:
+            request_kwargs["tool_choice"] = self.config.tool_choice
+        return {
+            "model": self.config.model_name,
+            "input": messages,
+            "tools": self._tools(),
+            **request_kwargs,
+        }
 
     def _query(self, messages: list[dict[str, str]], **kwargs):
         try:
-            request_kwargs = self.config.model_kwargs | kwargs
-            if self._previous_response_id:
-                request_kwargs.setdefault("previous_response_id", self._previous_response_id)
-            if self.config.tool_choice is not None:
-                request_kwargs["tool_choice"] = self.config.tool_choice
-            return litellm.responses(
-                model=self.config.model_name,
-                input=messages,
-                tools=(
-                    [BASH_TOOL_RESPONSE_API_WITH_REASONING]
-                    if self.config.require_reasoning
-                    else [BASH_TOOL_RESPONSE_API]
-                ),
-                **request_kwargs,
+            return self._rate_limited(messages, lambda: litellm.responses(**self._responses_kwargs(messages, **kwargs)))
+        except litellm.exceptions.AuthenticationError as e:
+            e.message += " You can permanently set your API key with `mini-extra config set KEY VALUE`."
+            raise e
+
+    async def _aquery(self, messages: list[dict[str, str]], **kwargs):
+        try:
+            return await self._arate_limited(
+                messages, lambda: litellm.aresponses(**self._responses_kwargs(messages, **kwargs))
             )
         except litellm.exceptions.AuthenticationError as e:
             e.message += " You can permanently set your API key with `mini-extra config set KEY VALUE`."
             raise e
 
+    def _query_stateful(self, messages: list[dict], **kwargs) -> tuple[object, dict]:
+        """Query with only the new items, replaying the full history if the response id is rejected."""
+        items, previous_response_id = self._delta_input(messages)
+        if previous_response_id is not None:
+            try:
+                response = self._query(items, previous_response_id=previous_response_id, **kwargs)
+                return response, self._input_stats(messages, items, replayed=False)
+            except Exception as e:
+                if not _is_previous_response_rejection(e):
+                    raise
+                logger.warning(f"previous_response_id {previous_response_id} rejected, replaying full history: {e}")
+                self._previous_response_id = None
+                items = self._prepare_messages_for_api(messages)
+        return self._query(items, **kwargs), self._input_stats(messages, items, replayed=True)
+
+    async def _aquery_stateful(self, messages: list[dict], **kwargs) -> tuple[object, dict]:
+        items, previous_response_id = self._delta_input(messages)
+        if previous_response_id is not None:
+            try:
+                response = await self._aquery(items, previous_response_id=previous_response_id, **kwargs)
+                return response, self._input_stats(messages, items, replayed=False)
+            except Exception as e:
+                if not _is_previous_response_rejection(e):
+                    raise
+                logger.warning(f"previous_response_id {previous_response_id} rejected, replaying full history: {e}")
+                self._previous_response_id = None
+                items = self._prepare_messages_for_api(messages)
+        return await self._aquery(items, **kwargs), self._input_stats(messages, items, replayed=True)
+
+    def _input_stats(self, messages: list[dict], sent: list[dict], *, replayed: bool) -> dict:
+        full = sent if replayed else self._prepare_messages_for_api(messages)
+        sent_chars, total_chars = _input_chars(sent), _input_chars(full)
+        return {
+            "items_sent": len(sent),
+            "items_total": len(full),
+            "chars_sent": sent_chars,
+            "chars_total": total_chars,
+            "saved_fraction": 1 - sent_chars / total_chars if total_chars else 0.0,
+            "full_replay": replayed,
+        }
+
     def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        input_stats = None
         for attempt in retry(logger=logger, abort_exceptions=self.abort_exceptions):
             with attempt:
-                response = self._query(self._prepare_messages_for_api(messages), **kwargs)
+                if self.config.stateful:
+                    response, input_stats = self._query_stateful(messages, **kwargs)
+                else:
+                    response = self._query(self._prepare_messages_for_api(messages), **kwargs)
+        cost_output = self._calculate_cost(response)
+        GLOBAL_MODEL_STATS.add(cost_output["cost"])
+        return self._response_to_message(response, cost_output, input_stats)
+
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        input_stats = None
+        async for attempt in aretry(logger=logger, abort_exceptions=self.abort_exceptions):
+            with attempt:
+                if self.config.stateful:
+                    response, input_stats = await self._aquery_stateful(messages, **kwargs)
+                else:
+                    response = await self._aquery(self._prepare_messages_for_api(messages), **kwargs)
         cost_output = self._calculate_cost(response)
         GLOBAL_MODEL_STATS.add(cost_output["cost"])
+        return self._response_to_message(response, cost_output, input_stats)
+
+    def _response_to_message(self, response, cost_output: dict[str, float], input_stats: dict | None = None) -> dict:
         message = response.model_dump() if hasattr(response, "model_dump") else dict(response)
         response_id = message.get("id")
         if response_id:
@@ -78,6 +176,8 @@ class LitellmResponseModel(LitellmModel):
             **cost_output,
             "timestamp": time.time(),
         }
+        if input_stats is not None:
+            message["extra"]["stateful_input"] = input_stats
         return message
 
     def _parse_actions(self, response) -> list[dict]:
@@ -98,4 +198,5 @@ class LitellmResponseModel(LitellmModel):
             observation_template=self.config.observation_template,
             template_vars=template_vars,
             multimodal_regex=self.config.multimodal_regex,
+            observation_max_tokens=self.config.observation_max_tokens,
         )
@@ -14,10 +14,16 @@ from ralphsweagent.models.utils.actions_toolcall import (
     format_toolcall_observation_messages,
     parse_toolcall_actions,
 )
-from minisweagent.models.utils.anthropic_utils import _reorder_anthropic_thinking_blocks
-from minisweagent.models.utils.cache_control import set_cache_control
+from ralphsweagent.models.litellm_model import OBSERVATION_MAX_TOKENS
+from ralphsweagent.utils.env import env_flag, env_int
+from ralphsweagent.models.context_window import ProviderContextWindowExceeded, is_context_window_error
+from ralphsweagent.models.utils.rate_limit import get_rate_limiter
+from ralphsweagent.models.utils.http_transport import get_async_http_transport, get_http_transport
+from ralphsweagent.models.utils.retry import aretry
+from ralphsweagent.models.utils.stream_reassembly import SSEStreamError, areassemble_sse, reassemble_sse
 from minisweagent.models.utils.openai_multimodal import expand_multimodal_content
 from minisweagent.models.utils.retry import retry
+from ralphsweagent.models.utils.message_prep import ChatMessagePreparer
 
 logger = logging.getLogger("openrouter_model")
 
@@ -42,6 +48,23 @@ class OpenRouterModelConfig(BaseModel):
     """Template used to render the observation after executing an action."""
     multimodal_regex: str = ""
     """Regex to extract multimodal content. Empty string disables multimodal processing."""
+    http_pool_maxsize: int = 32
+    """Maximum number of pooled connections kept to the provider (shared by all model instances)."""
+    http_keep_alive: bool = True
+    """Reuse connections across requests instead of opening a new one per call."""
+    http2: bool = False
+    """Use HTTP/2 for provider requests (requires `pip install 'httpx[http2]'`)."""
+    use_streaming: bool = env_flag("MSWEA_USE_STREAMING", False)
+    """Stream chat completions over SSE and reassemble them, so long responses are not cut off by the timeout."""
+    request_timeout: float = 60.0
+    """Connect and read timeout in seconds. It applies per read, so when streaming it bounds the idle time
+    between chunks rather than the whole response."""
+    requests_per_minute: int = env_int("MSWEA_RATE_LIMIT_RPM", 0)
+    """Requests per minute shared by all instances of this model in the process (0 = unlimited)."""
+    tokens_per_minute: int = env_int("MSWEA_RATE_LIMIT_TPM", 0)
+    """Tokens per minute shared by all instances of this model in the process (0 = unlimited)."""
+    observation_max_tokens: int = OBSERVATION_MAX_TOKENS
+    """Approximate tokens of command output kept per observation (0 = unlimited). Shrinks as the context fills up."""
 
 
 class OpenRouterAPIError(Exception):
@@ -57,53 +80,156 @@ class OpenRouterRateLimitError(Exception):
 
 
 class OpenRouterModel:
-    abort_exceptions: list[type[Exception]] = [OpenRouterAuthenticationError, KeyboardInterrupt]
+    abort_exceptions: list[type[Exception]] = [
+        OpenRouterAuthenticationError,
+        ProviderContextWindowExceeded,
+        KeyboardInterrupt,
+    ]
 
     def __init__(self, **kwargs):
         self.config = OpenRouterModelConfig(**kwargs)
+        self._message_preparer = ChatMessagePreparer()
         self._api_url = "https://openrouter.ai/api/v1/chat/completions"
         self._api_key = os.getenv("OPENROUTER_API_KEY", "")
+        self._transport = get_http_transport(
+            "openrouter",
+            self._api_url,
+            pool_maxsize=self.config.http_pool_maxsize,
+            keep_alive=self.config.http_keep_alive,
+            http2=self.config.http2,
+        )
+        self._rate_limiter = get_rate_limiter(
+            "openrouter",
+            self.config.model_name,
+            requests_per_minute=self.config.requests_per_minute,
+            tokens_per_minute=self.config.tokens_per_minute,
+        )
 
-    def _query(self, messages: list[dict[str, str]], **kwargs):
-        headers = {
+    def _headers(self) -> dict[str, str]:
+        return {
             "Authorization": f"Bearer {self._api_key}",
             "Content-Type": "application/json",
         }
 
+    def _tools(self) -> list[dict]:
+        return [BASH_TOOL_WITH_REASONING] if self.config.require_reasoning else [BASH_TOOL]
+
+    def _payload(self, messages: list[dict[str, str]], **kwargs) -> dict:
         payload = {
             "model": self.config.model_name,
             "messages": messages,
-            "tools": [BASH_TOOL_WITH_REASONING] if self.config.require_reasoning else [BASH_TOOL],
+            "tools": self._tools(),
             "usage": {"include": True},
             **(self.config.model_kwargs | kwargs),
         }
         if self.config.tool_choice is not None:
             payload["tool_choice"] = self.config.tool_choice
+        if self.config.use_streaming:
+            payload["stream"] = True
+        return payload
+
+    def _reassemble_stream(self, lines) -> dict:
+        return reassemble_sse(lines)
 
+    async def _areassemble_stream(self, lines) -> dict:
+        return await areassemble_sse(lines)
+
+    def _http_error(self, response, e: Exception) -> Exception:
+        if response.status_code == 401:
+            error_msg = "Authentication failed. You can permanently set your API key with `mini-extra config set OPENROUTER_API_KEY YOUR_KEY`."
+            return OpenRouterAuthenticationError(error_msg)
+        elif response.status_code == 429:
+            pause = self._rate_limiter.on_rate_limited(response.headers)
+            return OpenRouterRateLimitError(f"Rate limit exceeded, pausing requests for {pause:.1f}s")
+        elif is_context_window_error(response.status_code, response.text):
+            return ProviderContextWindowExceeded(f"HTTP {response.status_code}: {response.text}")
+        else:
+            return OpenRouterAPIError(f"HTTP {response.status_code}: {response.text}")
+
+    def _query(self, messages: list[dict[str, str]], **kwargs):
+        payload = self._payload(messages, **kwargs)
+        stream = bool(payload.get("stream"))
+        reserved = self._rate_limiter.acquire(messages)
         try:
-            response = requests.post(self._api_url, headers=headers, data=json.dumps(payload), timeout=60)
+            response = self._transport.post(
+                self._api_url,
+                headers=self._headers(),
+                data=json.dumps(payload),
+                timeout=self.config.request_timeout,
+                stream=stream,
+            )
             response.raise_for_status()
-            return response.json()
+            self._rate_limiter.update_from_headers(response.headers)
+            if not stream:
+                result = response.json()
+            else:
+                try:
+                    result = self._reassemble_stream(response.iter_lines(decode_unicode=True))
+                finally:
+                    response.close()
         except requests.exceptions.HTTPError as e:
-            if response.status_code == 401:
-                error_msg = "Authentication failed. You can permanently set your API key with `mini-extra config set OPENROUTER_API_KEY YOUR_KEY`."
-                raise OpenRouterAuthenticationError(error_msg) from e
-            elif response.status_code == 429:
-                raise OpenRouterRateLimitError("Rate limit exceeded") from e
+            raise self._http_error(response, e) from e
+        except SSEStreamError as e:
+            raise OpenRouterAPIError(f"Stream error: {e}") from e
+        except requests.exceptions.RequestException as e:
+            raise OpenRouterAPIError(f"Request failed: {e}") from e
+        self._rate_limiter.settle(reserved, result.get("usage"))
+        return result
+
+    async def _aquery(self, messages: list[dict[str, str]], **kwargs):
+        payload = self._payload(messages, **kwargs)
+        stream = bool(payload.get("stream"))
+        transport = get_async_http_transport(
+            "openrouter",
+            self._api_url,
+            pool_maxsize=self.config.http_pool_maxsize,
+            keep_alive=self.config.http_keep_alive,
+            http2=self.config.http2,
+        )
+        reserved = await self._rate_limiter.aacquire(messages)
+        try:
+            response = await transport.post(
+                self._api_url,
+                headers=self._headers(),
+                data=json.dumps(payload),
+                timeout=self.config.request_timeout,
+                stream=stream,
+            )
+            response.raise_for_status()
+            self._rate_limiter.update_from_headers(response.headers)
+            if not stream:
+                result = response.json()
             else:
-                raise OpenRouterAPIError(f"HTTP {response.status_code}: {response.text}") from e
+                try:
+                    result = await self._areassemble_stream(response.aiter_lines())
+                finally:
+                    await response.aclose()
+        except requests.exceptions.HTTPError as e:
+            raise self._http_error(response, e) from e
+        except SSEStreamError as e:
+            raise OpenRouterAPIError(f"Stream error: {e}") from e
         except requests.exceptions.RequestException as e:
             raise OpenRouterAPIError(f"Request failed: {e}") from e
+        self._rate_limiter.settle(reserved, result.get("usage"))
+        return result
 
     def _prepare_messages_for_api(self, messages: list[dict]) -> list[dict]:
-        prepared = [{k: v for k, v in msg.items() if k != "extra"} for msg in messages]
-        prepared = _reorder_anthropic_thinking_blocks(prepared)
-        return set_cache_control(prepared, mode=self.config.set_cache_control)
+        return self._message_preparer.prepare(messages, cache_control=self.config.set_cache_control)
 
     def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
         for attempt in retry(logger=logger, abort_exceptions=self.abort_exceptions):
             with attempt:
                 response = self._query(self._prepare_messages_for_api(messages), **kwargs)
+        return self._response_to_message(response)
+
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        """Async variant of `query` for driving many agents from one event loop."""
+        async for attempt in aretry(logger=logger, abort_exceptions=self.abort_exceptions):
+            with attempt:
+                response = await self._aquery(self._prepare_messages_for_api(messages), **kwargs)
+        return self._response_to_message(response)
+
+    def _response_to_message(self, response: dict) -> dict:
         cost_output = self._calculate_cost(response)
         GLOBAL_MODEL_STATS.add(cost_output["cost"])
         message = dict(response["choices"][0]["message"])
@@ -152,6 +278,7 @@ class OpenRouterModel:
             observation_template=self.config.observation_template,
             template_vars=template_vars,
             multimodal_regex=self.config.multimodal_regex,
+            observation_max_tokens=self.config.observation_max_tokens,
         )
 
     def get_template_vars(self, **kwargs) -> dict[str, Any]:
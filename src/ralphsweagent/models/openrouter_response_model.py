@@ -1,26 +1,15 @@
-import json
-import logging
 import time
 
-import requests
-
 from minisweagent.models import GLOBAL_MODEL_STATS
-from ralphsweagent.models.openrouter_model import (
-    OpenRouterAPIError,
-    OpenRouterAuthenticationError,
-    OpenRouterModel,
-    OpenRouterModelConfig,
-    OpenRouterRateLimitError,
-)
+from ralphsweagent.models.openrouter_model import OpenRouterModel, OpenRouterModelConfig
 from ralphsweagent.models.utils.actions_toolcall_response import (
     BASH_TOOL_RESPONSE_API,
     BASH_TOOL_RESPONSE_API_WITH_REASONING,
     format_toolcall_observation_messages,
     parse_toolcall_actions_response,
 )
-from minisweagent.models.utils.retry import retry
-
-logger = logging.getLogger("openrouter_response_model")
+from ralphsweagent.models.utils.message_prep import PreparedMessageCache, flatten_response_message
+from ralphsweagent.models.utils.stream_reassembly import areassemble_responses_sse, reassemble_responses_sse
 
 
 class OpenRouterResponseModelConfig(OpenRouterModelConfig):
@@ -39,38 +28,29 @@ class OpenRouterResponseModel(OpenRouterModel):
         super().__init__(**kwargs)
         self.config = OpenRouterResponseModelConfig(**kwargs)
         self._api_url = "https://openrouter.ai/api/v1/responses"
+        self._message_cache = PreparedMessageCache(flatten_response_message)
 
-    def _query(self, messages: list[dict[str, str]], **kwargs):
-        headers = {
-            "Authorization": f"Bearer {self._api_key}",
-            "Content-Type": "application/json",
-        }
+    def _tools(self) -> list[dict]:
+        return [BASH_TOOL_RESPONSE_API_WITH_REASONING] if self.config.require_reasoning else [BASH_TOOL_RESPONSE_API]
+
+    def _payload(self, messages: list[dict[str, str]], **kwargs) -> dict:
         payload = {
             "model": self.config.model_name,
             "input": messages,
-            "tools": (
-                [BASH_TOOL_RESPONSE_API_WITH_REASONING]
-                if self.config.require_reasoning
-                else [BASH_TOOL_RESPONSE_API]
-            ),
+            "tools": self._tools(),
             **(self.config.model_kwargs | kwargs),
         }
         if self.config.tool_choice is not None:
             payload["tool_choice"] = self.config.tool_choice
-        try:
-            response = requests.post(self._api_url, headers=headers, data=json.dumps(payload), timeout=60)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.HTTPError as e:
-            if response.status_code == 401:
-                error_msg = "Authentication failed. You can permanently set your API key with `mini-extra config set OPENROUTER_API_KEY YOUR_KEY`."
-                raise OpenRouterAuthenticationError(error_msg) from e
-            elif response.status_code == 429:
-                raise OpenRouterRateLimitError("Rate limit exceeded") from e
-            else:
-                raise OpenRouterAPIError(f"HTTP {response.status_code}: {response.text}") from e
-        except requests.exceptions.RequestException as e:
-            raise OpenRouterAPIError(f"Request failed: {e}") from e
+        if self.config.use_streaming:
+            payload["stream"] = True
+        return payload
+
+    def _reassemble_stream(self, lines) -> dict:
+        return reassemble_responses_sse(lines)
+
+    async def _areassemble_stream(self, lines) -> dict:
+        return await areassemble_responses_sse(lines)
 
     def _prepare_messages_for_api(self, messages: list[dict]) -> list[dict]:
         """Prepare messages for OpenRouter's stateless Responses API.
@@ -78,19 +58,9 @@ class OpenRouterResponseModel(OpenRouterModel):
         Flattens response objects into their output items since OpenRouter
         doesn't support previous_response_id.
         """
-        result = []
-        for msg in messages:
-            if msg.get("object") == "response":
-                for item in msg.get("output", []):
-                    result.append({k: v for k, v in item.items() if k != "extra"})
-            else:
-                result.append({k: v for k, v in msg.items() if k != "extra"})
-        return result
-
-    def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
-        for attempt in retry(logger=logger, abort_exceptions=self.abort_exceptions):
-            with attempt:
-                response = self._query(self._prepare_messages_for_api(messages), **kwargs)
+        return self._message_cache.prepare(messages)
+
+    def _response_to_message(self, response: dict) -> dict:
         cost_output = self._calculate_cost(response)
         GLOBAL_MODEL_STATS.add(cost_output["cost"])
         message = dict(response)
@@ -129,4 +99,5 @@ class OpenRouterResponseModel(OpenRouterModel):
             observation_template=self.config.observation_template,
             template_vars=template_vars,
             multimodal_regex=self.config.multimodal_regex,
+            observation_max_tokens=self.config.observation_max_tokens,
         )
@@ -2,6 +2,7 @@ import json
 import logging
 import os
 import time
+from collections.abc import Awaitable, Callable
 from pathlib import Path
 from typing import Any, Literal
 
@@ -15,15 +16,24 @@ from ralphsweagent.models.utils.actions_toolcall import (
     format_toolcall_observation_messages,
     parse_toolcall_actions,
 )
-from minisweagent.models.utils.anthropic_utils import _reorder_anthropic_thinking_blocks
-from minisweagent.models.utils.cache_control import set_cache_control
 from minisweagent.models.utils.openai_multimodal import expand_multimodal_content
 from minisweagent.models.utils.retry import retry
+from ralphsweagent.models.litellm_model import OBSERVATION_MAX_TOKENS
+from ralphsweagent.utils.env import env_flag, env_int
+from ralphsweagent.models.context_window import ProviderContextWindowExceeded, is_context_window_error
+from ralphsweagent.models.utils.rate_limit import get_rate_limiter
+from ralphsweagent.models.utils.retry import aretry
+from ralphsweagent.models.utils.stream_reassembly import (
+    StreamReassembler,
+    aiter_with_idle_timeout,
+    iter_with_idle_timeout,
+)
+from ralphsweagent.models.utils.message_prep import ChatMessagePreparer
 
 logger = logging.getLogger("portkey_model")
 
 try:
-    from portkey_ai import Portkey
+    from portkey_ai import AsyncPortkey, Portkey
 except ImportError:
     raise ImportError(
         "The portkey-ai package is required to use PortkeyModel. Please install it with: pip install portkey-ai"
@@ -64,13 +74,41 @@ class PortkeyModelConfig(BaseModel):
     """Template used to render the observation after executing an action."""
     multimodal_regex: str = ""
     """Regex to extract multimodal content. Empty string disables multimodal processing."""
+    use_streaming: bool = env_flag("MSWEA_USE_STREAMING", False)
+    """Stream chat completions and reassemble them, so long responses are not cut off by the timeout."""
+    request_timeout: float = 60.0
+    """When streaming, seconds allowed between chunks before the stream is abandoned and retried (0 = no limit)."""
+    stream_guard_enabled: bool = env_flag("MSWEA_STREAM_GUARD_ENABLED", False)
+    """Enable stream guard to stop pathological closing-tag repetition."""
+    stream_guard_window: int = env_int("MSWEA_STREAM_GUARD_WINDOW", 8192)
+    """Window size in characters for stream guard repetition detection."""
+    stream_guard_tag_threshold: int = env_int("MSWEA_STREAM_GUARD_TAG_THRESHOLD", 50)
+    """Closing-tag repetition threshold in the rolling window before truncation."""
+    requests_per_minute: int = env_int("MSWEA_RATE_LIMIT_RPM", 0)
+    """Requests per minute shared by all instances of this model in the process (0 = unlimited)."""
+    tokens_per_minute: int = env_int("MSWEA_RATE_LIMIT_TPM", 0)
+    """Tokens per minute shared by all instances of this model in the process (0 = unlimited)."""
+    observation_max_tokens: int = OBSERVATION_MAX_TOKENS
+    """Approximate tokens of command output kept per observation (0 = unlimited). Shrinks as the context fills up."""
 
 
 class PortkeyModel:
-    abort_exceptions: list[type[Exception]] = [KeyboardInterrupt, TypeError, ValueError]
+    abort_exceptions: list[type[Exception]] = [
+        ProviderContextWindowExceeded,
+        KeyboardInterrupt,
+        TypeError,
+        ValueError,
+    ]
 
     def __init__(self, *, config_class: type = PortkeyModelConfig, **kwargs):
         self.config = config_class(**kwargs)
+        self._message_preparer = ChatMessagePreparer()
+        self._rate_limiter = get_rate_limiter(
+            "portkey",
+            self.config.model_name,
+            requests_per_minute=self.config.requests_per_minute,
+            tokens_per_minute=self.config.tokens_per_minute,
+        )
         if self.config.litellm_model_registry and Path(self.config.litellm_model_registry).is_file():
             litellm.utils.register_model(json.loads(Path(self.config.litellm_model_registry).read_text()))
 
@@ -90,37 +128,123 @@ class PortkeyModel:
             # If no virtual key but provider is specified, pass it
             client_kwargs["provider"] = self.config.provider
 
+        self._client_kwargs = client_kwargs
         self.client = Portkey(**client_kwargs)
+        self._async_client = None
 
-    def _query(self, messages: list[dict[str, str]], **kwargs):
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = AsyncPortkey(**self._client_kwargs)
+        return self._async_client
+
+    def _request_kwargs(self, **kwargs) -> dict:
         request_kwargs = self.config.model_kwargs | kwargs
         if self.config.tool_choice is not None:
             request_kwargs["tool_choice"] = self.config.tool_choice
-        return self.client.chat.completions.create(
-            model=self.config.model_name,
-            messages=messages,
-            tools=[BASH_TOOL_WITH_REASONING] if self.config.require_reasoning else [BASH_TOOL],
-            **request_kwargs,
+        if self.config.use_streaming:
+            request_kwargs["stream"] = True
+            request_kwargs["stream_options"] = {"include_usage": True}
+        return request_kwargs
+
+    def _tools(self) -> list[dict]:
+        return [BASH_TOOL_WITH_REASONING] if self.config.require_reasoning else [BASH_TOOL]
+
+    def _query(self, messages: list[dict[str, str]], **kwargs):
+        request_kwargs = self._request_kwargs(**kwargs)
+
+        def send():
+            reassembler = self._stream_reassembler()
+            response = self.client.chat.completions.create(
+                model=self.config.model_name, messages=messages, tools=self._tools(), **request_kwargs
+            )
+            if not request_kwargs.get("stream"):
+                return response
+            for chunk in iter_with_idle_timeout(response, self.config.request_timeout):
+                if reassembler.add(chunk):
+                    logger.warning("Stream guard triggered; truncating streamed content.")
+                    break
+            return self._stream_response(reassembler)
+
+        return self._rate_limited(messages, send)
+
+    async def _aquery(self, messages: list[dict[str, str]], **kwargs):
+        request_kwargs = self._request_kwargs(**kwargs)
+
+        async def send():
+            reassembler = self._stream_reassembler()
+            response = await self.async_client.chat.completions.create(
+                model=self.config.model_name, messages=messages, tools=self._tools(), **request_kwargs
+            )
+            if not request_kwargs.get("stream"):
+                return response
+            async for chunk in aiter_with_idle_timeout(response, self.config.request_timeout):
+                if reassembler.add(chunk):
+                    logger.warning("Stream guard triggered; truncating streamed content.")
+                    break
+            return self._stream_response(reassembler)
+
+        return await self._arate_limited(messages, send)
+
+    def _stream_reassembler(self) -> StreamReassembler:
+        if not self.config.stream_guard_enabled:
+            return StreamReassembler()
+        return StreamReassembler(
+            guard_window=self.config.stream_guard_window, guard_threshold=self.config.stream_guard_tag_threshold
         )
 
+    @staticmethod
+    def _stream_response(reassembler: StreamReassembler) -> litellm.ModelResponse:
+        response = litellm.ModelResponse(**reassembler.build_dict())
+        response.time_to_first_token = reassembler.time_to_first_token
+        return response
+
+    def _rate_limited(self, messages: list[dict], send: Callable[[], Any]):
+        """Send one request through the shared rate limiter; ``send`` returns the complete (reassembled) response."""
+        try:
+            return self._rate_limiter.run(messages, send)
+        except Exception as e:
+            if is_context_window_error(getattr(e, "status_code", None), str(e)):
+                raise ProviderContextWindowExceeded(str(e)) from e
+            raise
+
+    async def _arate_limited(self, messages: list[dict], send: Callable[[], Awaitable[Any]]):
+        try:
+            return await self._rate_limiter.arun(messages, send)
+        except Exception as e:
+            if is_context_window_error(getattr(e, "status_code", None), str(e)):
+                raise ProviderContextWindowExceeded(str(e)) from e
+            raise
+
     def _prepare_messages_for_api(self, messages: list[dict]) -> list[dict]:
-        prepared = [{k: v for k, v in msg.items() if k != "extra"} for msg in messages]
-        prepared = _reorder_anthropic_thinking_blocks(prepared)
-        return set_cache_control(prepared, mode=self.config.set_cache_control)
+        return self._message_preparer.prepare(messages, cache_control=self.config.set_cache_control)
 
     def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
         for attempt in retry(logger=logger, abort_exceptions=self.abort_exceptions):
             with attempt:
                 response = self._query(self._prepare_messages_for_api(messages), **kwargs)
+        return self._response_to_message(response)
+
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        """Async variant of `query` for driving many agents from one event loop."""
+        async for attempt in aretry(logger=logger, abort_exceptions=self.abort_exceptions):
+            with attempt:
+                response = await self._aquery(self._prepare_messages_for_api(messages), **kwargs)
+        return self._response_to_message(response)
+
+    def _response_to_message(self, response) -> dict:
         cost_output = self._calculate_cost(response)
         GLOBAL_MODEL_STATS.add(cost_output["cost"])
         message = response.choices[0].message.model_dump()
+        time_to_first_token = getattr(response, "time_to_first_token", None)
         message["extra"] = {
             "actions": self._parse_actions(response),
-            "response": response.model_dump(),
+            "response": response.model_dump(exclude={"time_to_first_token"}),
             **cost_output,
             "timestamp": time.time(),
         }
+        if time_to_first_token is not None:
+            message["extra"]["timings"] = {"time_to_first_token": time_to_first_token}
         return message
 
     def _parse_actions(self, response) -> list[dict]:
@@ -146,6 +270,7 @@ class PortkeyModel:
             observation_template=self.config.observation_template,
             template_vars=template_vars,
             multimodal_regex=self.config.multimodal_regex,
+            observation_max_tokens=self.config.observation_max_tokens,
         )
 
     def get_template_vars(self, **kwargs) -> dict[str, Any]:
@@ -2,6 +2,7 @@ import json
 import logging
 import os
 import time
+from collections.abc import Awaitable, Callable
 from pathlib import Path
 from typing import Any, Literal
 
@@ -16,11 +17,17 @@ from ralphsweagent.models.utils.actions_toolcall_response import (
     parse_toolcall_actions_response,
 )
 from minisweagent.models.utils.retry import retry
+from ralphsweagent.models.litellm_model import OBSERVATION_MAX_TOKENS
+from ralphsweagent.utils.env import env_int
+from ralphsweagent.models.context_window import ProviderContextWindowExceeded, is_context_window_error
+from ralphsweagent.models.utils.rate_limit import get_rate_limiter
+from ralphsweagent.models.utils.retry import aretry
+from ralphsweagent.models.utils.message_prep import PreparedMessageCache, flatten_response_message
 
 logger = logging.getLogger("portkey_response_model")
 
 try:
-    from portkey_ai import Portkey
+    from portkey_ai import AsyncPortkey, Portkey
 except ImportError:
     raise ImportError(
         "The portkey-ai package is required to use PortkeyResponseAPIModel. Please install it with: pip install portkey-ai"
@@ -41,6 +48,9 @@ class PortkeyResponseAPIModelConfig(BaseModel):
         "<returncode>{{output.returncode}}</returncode>\n<output>\n{{output.output}}</output>"
     )
     multimodal_regex: str = ""
+    requests_per_minute: int = env_int("MSWEA_RATE_LIMIT_RPM", 0)
+    tokens_per_minute: int = env_int("MSWEA_RATE_LIMIT_TPM", 0)
+    observation_max_tokens: int = OBSERVATION_MAX_TOKENS
 
 
 class PortkeyResponseAPIModel:
@@ -50,10 +60,22 @@ class PortkeyResponseAPIModel:
     the full conversation history. previous_response_id is not used.
     """
 
-    abort_exceptions: list[type[Exception]] = [KeyboardInterrupt, TypeError, ValueError]
+    abort_exceptions: list[type[Exception]] = [
+        ProviderContextWindowExceeded,
+        KeyboardInterrupt,
+        TypeError,
+        ValueError,
+    ]
 
     def __init__(self, **kwargs):
         self.config = PortkeyResponseAPIModelConfig(**kwargs)
+        self._message_cache = PreparedMessageCache(flatten_response_message)
+        self._rate_limiter = get_rate_limiter(
+            "portkey",
+            self.config.model_name,
+            requests_per_minute=self.config.requests_per_minute,
+            tokens_per_minute=self.config.tokens_per_minute,
+        )
         if self.config.litellm_model_registry and Path(self.config.litellm_model_registry).is_file():
             litellm.utils.register_model(json.loads(Path(self.config.litellm_model_registry).read_text()))
 
@@ -70,41 +92,79 @@ class PortkeyResponseAPIModel:
         if virtual_key:
             client_kwargs["virtual_key"] = virtual_key
 
+        self._client_kwargs = client_kwargs
         self.client = Portkey(**client_kwargs)
+        self._async_client = None
 
-    def _query(self, messages: list[dict[str, str]], **kwargs):
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = AsyncPortkey(**self._client_kwargs)
+        return self._async_client
+
+    def _request_kwargs(self, **kwargs) -> dict:
         request_kwargs = self.config.model_kwargs | kwargs
         if self.config.tool_choice is not None:
             request_kwargs["tool_choice"] = self.config.tool_choice
-        return self.client.responses.create(
-            model=self.config.model_name,
-            input=messages,
-            tools=(
-                [BASH_TOOL_RESPONSE_API_WITH_REASONING]
-                if self.config.require_reasoning
-                else [BASH_TOOL_RESPONSE_API]
+        return request_kwargs
+
+    def _tools(self) -> list[dict]:
+        return [BASH_TOOL_RESPONSE_API_WITH_REASONING] if self.config.require_reasoning else [BASH_TOOL_RESPONSE_API]
+
+    def _query(self, messages: list[dict[str, str]], **kwargs):
+        return self._rate_limited(
+            messages,
+            lambda: self.client.responses.create(
+                model=self.config.model_name, input=messages, tools=self._tools(), **self._request_kwargs(**kwargs)
+            ),
+        )
+
+    async def _aquery(self, messages: list[dict[str, str]], **kwargs):
+        return await self._arate_limited(
+            messages,
+            lambda: self.async_client.responses.create(
+                model=self.config.model_name, input=messages, tools=self._tools(), **self._request_kwargs(**kwargs)
             ),
-            **request_kwargs,
         )
 
+    def _rate_limited(self, messages: list[dict], send: Callable[[], Any]):
+        """Send one request through the shared rate limiter; ``send`` returns the complete response."""
+        try:
+            return self._rate_limiter.run(messages, send)
+        except Exception as e:
+            if is_context_window_error(getattr(e, "status_code", None), str(e)):
+                raise ProviderContextWindowExceeded(str(e)) from e
+            raise
+
+    async def _arate_limited(self, messages: list[dict], send: Callable[[], Awaitable[Any]]):
+        try:
+            return await self._rate_limiter.arun(messages, send)
+        except Exception as e:
+            if is_context_window_error(getattr(e, "status_code", None), str(e)):
+                raise ProviderContextWindowExceeded(str(e)) from e
+            raise
+
     def _prepare_messages_for_api(self, messages: list[dict]) -> list[dict]:
         """Prepare messages for Portkey's stateless Responses API.
 
         Flattens response objects into their output items.
         """
-        result = []
-        for msg in messages:
-            if msg.get("object") == "response":
-                for item in msg.get("output", []):
-                    result.append({k: v for k, v in item.items() if k != "extra"})
-            else:
-                result.append({k: v for k, v in msg.items() if k != "extra"})
-        return result
+        return self._message_cache.prepare(messages)
 
     def query(self, messages: list[dict[str, str]], **kwargs) -> dict:
         for attempt in retry(logger=logger, abort_exceptions=self.abort_exceptions):
             with attempt:
                 response = self._query(self._prepare_messages_for_api(messages), **kwargs)
+        return self._response_to_message(response)
+
+    async def aquery(self, messages: list[dict[str, str]], **kwargs) -> dict:
+        """Async variant of `query` for driving many agents from one event loop."""
+        async for attempt in aretry(logger=logger, abort_exceptions=self.abort_exceptions):
+            with attempt:
+                response = await self._aquery(self._prepare_messages_for_api(messages), **kwargs)
+        return self._response_to_message(response)
+
+    def _response_to_message(self, response) -> dict:
         cost_output = self._calculate_cost(response)
         GLOBAL_MODEL_STATS.add(cost_output["cost"])
         message = response.model_dump() if hasattr(response, "model_dump") else dict(response)
@@ -161,6 +221,7 @@ class PortkeyResponseAPIModel:
             observation_template=self.config.observation_template,
             template_vars=template_vars,
             multimodal_regex=self.config.multimodal_regex,
+            observation_max_tokens=self.config.observation_max_tokens,
         )
 
     def get_template_vars(self, **kwargs) -> dict:
@@ -7,6 +7,7 @@ from jinja2 import StrictUndefined, Template
 
 from minisweagent.exceptions import FormatError
 from minisweagent.models.utils.openai_multimodal import expand_multimodal_content
+from ralphsweagent.models.utils.observation_budget import apply_observation_budget
 
 BASH_TOOL = {
     "type": "function",
@@ -103,14 +104,20 @@ def format_toolcall_observation_messages(
     observation_template: str,
     template_vars: dict | None = None,
     multimodal_regex: str = "",
+    observation_max_tokens: int = 0,
 ) -> list[dict]:
-    """Format execution outputs into tool result messages."""
+    """Format execution outputs into tool result messages.
+
+    Output longer than ``observation_max_tokens`` (scaled down by ``context_left_percent`` from
+    ``template_vars``) is elided in the middle; the full text is kept in ``extra.raw_output``.
+    """
     not_executed = {"output": "", "returncode": -1, "exception_info": "action was not executed"}
     padded_outputs = outputs + [not_executed] * (len(actions) - len(outputs))
     results = []
     for action, output in zip(actions, padded_outputs):
+        rendered_output = apply_observation_budget(output, observation_max_tokens, template_vars)
         content = Template(observation_template, undefined=StrictUndefined).render(
-            output=output, **(template_vars or {})
+            output=rendered_output, **(template_vars or {})
         )
         msg = {
             "content": content,
@@ -122,6 +129,11 @@ def format_toolcall_observation_messages(
                 **output.get("extra", {}),
             },
         }
+        if rendered_output is not output:
+            msg["extra"]["observation_truncated"] = {
+                "chars": len(output["output"]),
+                "kept_chars": len(rendered_output["output"]),
+            }
         if "tool_call_id" in action:
             msg["tool_call_id"] = action["tool_call_id"]
             msg["role"] = "tool"
@@ -6,6 +6,7 @@ import time
 from jinja2 import StrictUndefined, Template
 
 from minisweagent.exceptions import FormatError
+from ralphsweagent.models.utils.observation_budget import apply_observation_budget
 
 # OpenRouter/OpenAI Responses API uses a flat structure (no nested "function" key)
 BASH_TOOL_RESPONSE_API = {
@@ -109,14 +110,19 @@ def format_toolcall_observation_messages(
     observation_template: str,
     template_vars: dict | None = None,
     multimodal_regex: str = "",
+    observation_max_tokens: int = 0,
 ) -> list[dict]:
-    """Format execution outputs into function_call_output messages for Responses API."""
+    """Format execution outputs into function_call_output messages for Responses API.
+
+    Long output is elided like in `actions_toolcall.format_toolcall_observation_messages`.
+    """
     not_executed = {"output": "", "returncode": -1, "exception_info": "action was not executed"}
     padded_outputs = outputs + [not_executed] * (len(actions) - len(outputs))
     results = []
     for action, output in zip(actions, padded_outputs):
+        rendered_output = apply_observation_budget(output, observation_max_tokens, template_vars)
         content = Template(observation_template, undefined=StrictUndefined).render(
-            output=output, **(template_vars or {})
+            output=rendered_output, **(template_vars or {})
         )
         msg: dict = {
             "extra": {
@@ -127,6 +133,11 @@ def format_toolcall_observation_messages(
                 **output.get("extra", {}),
             },
         }
+        if rendered_output is not output:
+            msg["extra"]["observation_truncated"] = {
+                "chars": len(output["output"]),
+                "kept_chars": len(rendered_output["output"]),
+            }
         if "tool_call_id" in action:
             msg["type"] = "function_call_output"
             msg["call_id"] = action["tool_call_id"]
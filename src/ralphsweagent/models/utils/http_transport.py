@@ -0,0 +1,239 @@
+"""Shared, pooled HTTP transport for models that talk to provider APIs directly."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import weakref
+from typing import Any
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_TRANSPORTS: dict[tuple, "HttpTransport"] = {}
+_TRANSPORTS_LOCK = threading.Lock()
+_ASYNC_TRANSPORTS: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _httpx_timeout(timeout: float | tuple[float, float]):
+    import httpx
+
+    if isinstance(timeout, tuple):
+        connect_timeout, read_timeout = timeout
+        return httpx.Timeout(read_timeout, connect=connect_timeout)
+    return httpx.Timeout(timeout)
+
+
+def _httpx_limits(pool_maxsize: int, keep_alive: bool):
+    import httpx
+
+    return httpx.Limits(
+        max_connections=pool_maxsize,
+        max_keepalive_connections=pool_maxsize if keep_alive else 0,
+    )
+
+
+class _HttpxResponse:
+    """Adapt an ``httpx.Response`` to the subset of the ``requests.Response`` API used by the models."""
+
+    def __init__(self, response: Any):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+
+    @property
+    def text(self) -> str:
+        return self._response.text
+
+    def json(self) -> Any:
+        return self._response.json()
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"HTTP {self.status_code}", response=self)  # type: ignore[arg-type]
+
+    def iter_lines(self, decode_unicode: bool = True):
+        import httpx
+
+        try:
+            yield from self._response.iter_lines()
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+
+    async def aiter_lines(self):
+        import httpx
+
+        try:
+            async for line in self._response.aiter_lines():
+                yield line
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+
+    def close(self) -> None:
+        self._response.close()
+
+    async def aclose(self) -> None:
+        await self._response.aclose()
+
+
+class HttpTransport:
+    """Thread-safe pooled HTTP client for a single provider origin.
+
+    Uses a ``requests.Session`` with a sized connection pool by default. When ``http2`` is
+    enabled, an ``httpx.Client`` is used instead (requires ``pip install 'httpx[http2]'``);
+    its responses and errors are mapped onto the ``requests`` API so callers handle both alike.
+    """
+
+    def __init__(self, *, pool_maxsize: int = 32, keep_alive: bool = True, http2: bool = False):
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.http2 = http2
+        self._session: requests.Session | None = None
+        self._client: Any = None
+        if http2:
+            try:
+                import httpx
+            except ImportError:
+                raise ImportError(
+                    "The httpx package is required for http2 transports. Please install it with: "
+                    "pip install 'httpx[http2]'"
+                )
+            self._client = httpx.Client(http2=True, limits=_httpx_limits(pool_maxsize, keep_alive))
+        else:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            if not keep_alive:
+                session.headers["Connection"] = "close"
+            self._session = session
+
+    def post(
+        self,
+        url: str,
+        *,
+        headers: dict[str, str],
+        data: str | bytes,
+        timeout: float | tuple[float, float],
+        stream: bool = False,
+    ):
+        """POST ``data`` to ``url``. Returns a ``requests.Response`` (or a compatible adapter)."""
+        if self._session is not None:
+            return self._session.post(url, headers=headers, data=data, timeout=timeout, stream=stream)
+        return self._post_httpx(url, headers=headers, data=data, timeout=timeout, stream=stream)
+
+    def _post_httpx(self, url: str, *, headers: dict[str, str], data, timeout, stream: bool):
+        import httpx
+
+        if not self.keep_alive:
+            headers = {**headers, "Connection": "close"}
+        try:
+            request = self._client.build_request(
+                "POST", url, headers=headers, content=data, timeout=_httpx_timeout(timeout)
+            )
+            response = self._client.send(request, stream=stream)
+            if stream and response.status_code >= 400:
+                response.read()
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+        return _HttpxResponse(response)
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+        if self._client is not None:
+            self._client.close()
+
+
+class AsyncHttpTransport:
+    """Pooled ``httpx.AsyncClient`` for a single provider origin, bound to one event loop.
+
+    Responses and errors are mapped onto the ``requests`` API like `HttpTransport` does.
+    """
+
+    def __init__(self, *, pool_maxsize: int = 32, keep_alive: bool = True, http2: bool = False):
+        import httpx
+
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.http2 = http2
+        self._client = httpx.AsyncClient(http2=http2, limits=_httpx_limits(pool_maxsize, keep_alive))
+
+    async def post(
+        self,
+        url: str,
+        *,
+        headers: dict[str, str],
+        data: str | bytes,
+        timeout: float | tuple[float, float],
+        stream: bool = False,
+    ) -> _HttpxResponse:
+        """POST ``data`` to ``url``. With ``stream``, the body is read via `aiter_lines` and must be closed."""
+        import httpx
+
+        if not self.keep_alive:
+            headers = {**headers, "Connection": "close"}
+        try:
+            request = self._client.build_request(
+                "POST", url, headers=headers, content=data, timeout=_httpx_timeout(timeout)
+            )
+            response = await self._client.send(request, stream=stream)
+            if stream and response.status_code >= 400:
+                await response.aread()
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+        return _HttpxResponse(response)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+def get_http_transport(
+    provider: str, url: str, *, pool_maxsize: int = 32, keep_alive: bool = True, http2: bool = False
+) -> HttpTransport:
+    """Return the process-wide transport for ``provider`` and the origin of ``url``, creating it if needed."""
+    key = (provider, _origin(url), pool_maxsize, keep_alive, http2)
+    with _TRANSPORTS_LOCK:
+        transport = _TRANSPORTS.get(key)
+        if transport is None:
+            transport = HttpTransport(pool_maxsize=pool_maxsize, keep_alive=keep_alive, http2=http2)
+            _TRANSPORTS[key] = transport
+        return transport
+
+
+def close_http_transports() -> None:
+    """Close and forget all shared transports."""
+    with _TRANSPORTS_LOCK:
+        transports = list(_TRANSPORTS.values())
+        _TRANSPORTS.clear()
+    for transport in transports:
+        transport.close()
+
+
+def get_async_http_transport(
+    provider: str, url: str, *, pool_maxsize: int = 32, keep_alive: bool = True, http2: bool = False
+) -> AsyncHttpTransport:
+    """Return the async transport for ``provider`` and the origin of ``url`` on the running event loop."""
+    loop = asyncio.get_running_loop()
+    key = (provider, _origin(url), pool_maxsize, keep_alive, http2)
+    with _TRANSPORTS_LOCK:
+        transports = _ASYNC_TRANSPORTS.setdefault(loop, {})
+        transport = transports.get(key)
+        if transport is None:
+            transport = AsyncHttpTransport(pool_maxsize=pool_maxsize, keep_alive=keep_alive, http2=http2)
+            transports[key] = transport
+        return transport
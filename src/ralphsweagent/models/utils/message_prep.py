@@ -0,0 +1,114 @@
+"""Memoized preparation of conversation history for provider APIs."""
+
+from __future__ import annotations
+
+import copy
+import operator
+import threading
+from collections.abc import Callable
+from typing import Literal
+
+from minisweagent.models.utils.anthropic_utils import _reorder_anthropic_thinking_blocks
+from minisweagent.models.utils.cache_control import _clear_cache_control, set_cache_control
+
+
+def strip_extra(msg: dict) -> dict:
+    return {k: v for k, v in msg.items() if k != "extra"}
+
+
+def flatten_response_message(msg: dict) -> list[dict]:
+    """Responses API items for one message: response objects expand into their output items."""
+    if msg.get("object") == "response":
+        return [strip_extra(item) for item in msg.get("output", [])]
+    return [strip_extra(msg)]
+
+
+def prepare_response_items(messages: list[dict]) -> list[dict]:
+    return [item for msg in messages for item in flatten_response_message(msg)]
+
+
+class PreparedMessageCache:
+    """Prepare only the messages appended since the previous call.
+
+    Each message is prepared once by ``prepare_message`` (which returns its API items) and
+    reused while the same message dict, with the same number of keys, sits at the same
+    position. The first replaced, inserted, removed or grown message invalidates itself and
+    everything after it. Validating the prefix is one identity and size comparison per
+    message, done in C, so it stays cheap as the history grows. Returned items are shared
+    between calls and must not be mutated. Values reassigned in place on a message that was
+    already prepared are not detected: replace the message dict instead, or call `clear`.
+    """
+
+    def __init__(self, prepare_message: Callable[[dict], list[dict]]):
+        self._prepare_message = prepare_message
+        self._sources: list[dict] = []
+        self._sizes: list[int] = []
+        self._offsets: list[int] = []
+        self._items: list[dict] = []
+        self._lock = threading.Lock()
+        self.n_prepared = 0
+        """Number of messages prepared so far (cache misses)."""
+
+    def prepare(self, messages: list[dict]) -> list[dict]:
+        with self._lock:
+            keep = self._matching_prefix(messages)
+            if keep < len(self._sources):
+                del self._items[self._offsets[keep] :]
+                del self._offsets[keep:]
+                del self._sizes[keep:]
+                del self._sources[keep:]
+            for msg in messages[keep:]:
+                self._offsets.append(len(self._items))
+                self._sources.append(msg)
+                self._sizes.append(len(msg))
+                self._items.extend(self._prepare_message(msg))
+            self.n_prepared += len(messages) - keep
+            return list(self._items)
+
+    def _matching_prefix(self, messages: list[dict]) -> int:
+        limit = min(len(messages), len(self._sources))
+        head = messages[:limit]
+        if all(map(operator.is_, head, self._sources)) and list(map(len, head)) == self._sizes[:limit]:
+            return limit
+        for index, (msg, source, size) in enumerate(zip(head, self._sources, self._sizes)):
+            if msg is not source or len(msg) != size:
+                return index
+        return limit
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sources.clear()
+            self._sizes.clear()
+            self._offsets.clear()
+            self._items.clear()
+
+
+class ChatMessagePreparer:
+    """Memoized equivalent of strip ``extra`` -> reorder thinking blocks -> `set_cache_control`."""
+
+    def __init__(self):
+        self._mode: str | None = None
+        self._cache = PreparedMessageCache(self._prepare_message)
+
+    def _prepare_message(self, msg: dict) -> list[dict]:
+        prepared = _reorder_anthropic_thinking_blocks([strip_extra(msg)])[0]
+        if self._mode is not None:
+            prepared = copy.deepcopy(prepared)
+            _clear_cache_control(prepared)
+        return [prepared]
+
+    def prepare(self, messages: list[dict], *, cache_control: Literal["default_end"] | None) -> list[dict]:
+        if cache_control != self._mode:
+            self._cache.clear()
+            self._mode = cache_control
+        prepared = self._cache.prepare(messages)
+        if cache_control is not None and prepared:
+            prepared[-1] = set_cache_control(prepared[-1:], mode=cache_control)[0]
+        return prepared
+
+    @property
+    def n_prepared(self) -> int:
+        return self._cache.n_prepared
+
+    def clear(self) -> None:
+        self._cache.clear()
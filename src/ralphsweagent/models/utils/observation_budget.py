@@ -0,0 +1,44 @@
+"""Cap the size of command output rendered into observations."""
+
+from __future__ import annotations
+
+from ralphsweagent.models.utils.token_estimate import CHARS_PER_TOKEN
+
+ELISION_MARKER = "\n[... {n} characters elided ...]\n"
+
+MIN_BUDGET_FRACTION = 0.1
+"""The budget never shrinks below this fraction of ``max_tokens``, however full the context is."""
+
+
+def elide_middle(text: str, max_chars: int, marker: str = ELISION_MARKER) -> str:
+    """Keep the head and tail of ``text`` (``max_chars`` in total) around a marker with the elided count."""
+    if len(text) <= max_chars:
+        return text
+    head = max_chars // 2
+    tail = max_chars - head
+    return text[:head] + marker.format(n=len(text) - max_chars) + text[len(text) - tail :]
+
+
+def observation_char_budget(max_tokens: int, context_left_percent: int | None = None) -> int:
+    """Characters of output allowed in one observation (0 = unlimited).
+
+    Scales with the share of the context window that is still free, down to `MIN_BUDGET_FRACTION`.
+    """
+    if max_tokens <= 0:
+        return 0
+    fraction = 1.0
+    if context_left_percent is not None:
+        fraction = max(MIN_BUDGET_FRACTION, min(100, context_left_percent) / 100)
+    return int(max_tokens * CHARS_PER_TOKEN * fraction)
+
+
+def apply_observation_budget(output: dict, max_tokens: int, template_vars: dict | None = None) -> dict:
+    """Return ``output`` with ``output["output"]`` elided to the budget, or ``output`` itself if it fits.
+
+    The full text stays available as ``extra.raw_output`` on the observation message.
+    """
+    max_chars = observation_char_budget(max_tokens, (template_vars or {}).get("context_left_percent"))
+    text = output.get("output")
+    if not max_chars or not isinstance(text, str) or len(text) <= max_chars:
+        return output
+    return {**output, "output": elide_middle(text, max_chars)}
@@ -0,0 +1,283 @@
+"""Process-wide, provider-aware request/token rate limiting shared by all model instances."""
+
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import logging
+import re
+import threading
+import time
+from collections.abc import Awaitable, Callable, Mapping
+from typing import Any, TypeVar
+
+from ralphsweagent.models.utils.token_estimate import heuristic_token_count
+
+logger = logging.getLogger("rate_limit")
+
+T = TypeVar("T")
+
+_LIMITERS: dict[tuple[str, str], "RateLimiter"] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+DEFAULT_RATE_LIMIT_PAUSE = 5.0
+"""Seconds to pause a provider/model after a 429 that carries no usable reset information."""
+
+_MAX_SLEEP = 5.0
+_EPSILON = 1e-6
+_DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def estimate_request_tokens(messages: Any) -> int:
+    """Cheap token estimate for rate limiting; exactness is not needed since usage settles it."""
+    return heuristic_token_count(messages)
+
+
+def _normalize_headers(headers: Mapping | None) -> dict[str, str]:
+    if not isinstance(headers, Mapping):
+        return {}
+    normalized = {}
+    for key, value in headers.items():
+        key = str(key).lower()
+        if key.startswith("llm_provider-"):
+            key = key[len("llm_provider-") :]
+        normalized[key] = str(value)
+    return normalized
+
+
+def parse_reset_seconds(value: str | None, *, now: float | None = None) -> float | None:
+    """Seconds until a rate-limit window resets.
+
+    Accepts ``Retry-After`` style values (delta seconds or an HTTP date), OpenAI style
+    durations (``"6m0s"``, ``"20ms"``) and epoch timestamps in seconds or milliseconds.
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if not value:
+        return None
+    now = time.time() if now is None else now
+    try:
+        number = float(value)
+    except ValueError:
+        parts = _DURATION_PART_RE.findall(value)
+        if parts and "".join(n + u for n, u in parts) == value:
+            return sum(float(n) * _UNITS[u] for n, u in parts)
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - now)
+        except (TypeError, ValueError):
+            return None
+    if number > 1e12:
+        return max(0.0, number / 1000 - now)
+    if number > 1e9:
+        return max(0.0, number - now)
+    return max(0.0, number)
+
+
+def _usage_of(response: Any) -> Mapping | Any | None:
+    return response.get("usage") if isinstance(response, Mapping) else getattr(response, "usage", None)
+
+
+class _Bucket:
+    """Token bucket refilled continuously at ``per_minute / 60`` per second. Unlimited when 0."""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.per_minute <= 0:
+            return
+        self.level = min(float(self.per_minute), self.level + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if self.per_minute <= 0:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.per_minute)
+        deficit = amount - self.level
+        return 0.0 if deficit <= _EPSILON else deficit * 60 / self.per_minute
+
+    def take(self, amount: float, now: float) -> None:
+        if self.per_minute > 0:
+            self._refill(now)
+            self.level -= amount
+
+    def drain(self, now: float) -> None:
+        if self.per_minute > 0:
+            self._refill(now)
+            self.level = min(self.level, 0.0)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets plus a shared pause for one provider/model.
+
+    Callers `acquire` before sending; the limiter also learns from response headers
+    (`update_from_headers`) and 429s (`on_rate_limited`), pausing every caller until the
+    provider's window resets so instances queue here instead of failing and retrying.
+    """
+
+    def __init__(self, *, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self._lock = threading.Lock()
+        self._requests = _Bucket(requests_per_minute)
+        self._tokens = _Bucket(tokens_per_minute)
+        self._paused_until = 0.0
+
+    @property
+    def requests_per_minute(self) -> int:
+        return self._requests.per_minute
+
+    @property
+    def tokens_per_minute(self) -> int:
+        return self._tokens.per_minute
+
+    def configure(self, *, requests_per_minute: int, tokens_per_minute: int) -> None:
+        """Apply limits from a model config. Non-zero values win over unset (0) ones."""
+        with self._lock:
+            if requests_per_minute and requests_per_minute != self._requests.per_minute:
+                self._requests = _Bucket(requests_per_minute)
+            if tokens_per_minute and tokens_per_minute != self._tokens.per_minute:
+                self._tokens = _Bucket(tokens_per_minute)
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Take capacity and return 0, or return how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(
+                self._paused_until - now,
+                self._requests.wait_time(1, now),
+                self._tokens.wait_time(tokens, now),
+            )
+            if wait <= 0:
+                self._requests.take(1, now)
+                self._tokens.take(tokens, now)
+            return wait
+
+    def acquire(self, messages: Any = None) -> int:
+        """Block until a request for ``messages`` may be sent. Returns the reserved token estimate."""
+        tokens = estimate_request_tokens(messages) if self.tokens_per_minute and messages is not None else 0
+        while (wait := self._try_acquire(tokens)) > 0:
+            time.sleep(min(wait, _MAX_SLEEP))
+        return tokens
+
+    async def aacquire(self, messages: Any = None) -> int:
+        """Async variant of `acquire`."""
+        tokens = estimate_request_tokens(messages) if self.tokens_per_minute and messages is not None else 0
+        while (wait := self._try_acquire(tokens)) > 0:
+            await asyncio.sleep(min(wait, _MAX_SLEEP))
+        return tokens
+
+    def settle(self, reserved: int, usage: Mapping | Any | None) -> None:
+        """Correct the token bucket once the actual usage of a request is known."""
+        if not self.tokens_per_minute or usage is None:
+            return
+        total = usage.get("total_tokens") if isinstance(usage, Mapping) else getattr(usage, "total_tokens", None)
+        if not isinstance(total, int):
+            return
+        with self._lock:
+            self._tokens.take(total - reserved, time.monotonic())
+
+    def run(self, messages: Any, send: Callable[[], T]) -> T:
+        """`acquire`, call ``send`` and `settle` the usage of its response; a failure goes to `on_error`.
+
+        ``send`` must return the complete response: for a stream, the reassembled one, so that
+        its usage is known and errors raised while reading the stream reach `on_error`.
+        """
+        reserved = self.acquire(messages)
+        try:
+            response = send()
+        except Exception as e:
+            self.on_error(e)
+            raise
+        self.settle(reserved, _usage_of(response))
+        return response
+
+    async def arun(self, messages: Any, send: Callable[[], Awaitable[T]]) -> T:
+        """Async variant of `run`."""
+        reserved = await self.aacquire(messages)
+        try:
+            response = await send()
+        except Exception as e:
+            self.on_error(e)
+            raise
+        self.settle(reserved, _usage_of(response))
+        return response
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for ``seconds`` (never shortens an existing pause)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers: Mapping | None) -> None:
+        """Pause until the window resets when the provider reports no remaining requests or tokens."""
+        headers = _normalize_headers(headers)
+        for remaining_key, reset_key in (
+            ("x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+            ("x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+            ("x-ratelimit-remaining", "x-ratelimit-reset"),
+        ):
+            remaining = headers.get(remaining_key)
+            if remaining is None:
+                continue
+            try:
+                exhausted = float(remaining) <= 0
+            except ValueError:
+                continue
+            if exhausted and (reset := parse_reset_seconds(headers.get(reset_key))) is not None:
+                self.pause(reset)
+
+    def on_rate_limited(self, headers: Mapping | None) -> float:
+        """Record a 429 and pause all callers until it is safe to retry. Returns the pause in seconds."""
+        normalized = _normalize_headers(headers)
+        seconds = None
+        if "retry-after-ms" in normalized:
+            try:
+                seconds = float(normalized["retry-after-ms"]) / 1000
+            except ValueError:
+                pass
+        if seconds is None:
+            seconds = parse_reset_seconds(normalized.get("retry-after"))
+        if seconds is None:
+            resets = [
+                parse_reset_seconds(normalized.get(key))
+                for key in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens", "x-ratelimit-reset")
+            ]
+            seconds = max((r for r in resets if r is not None), default=DEFAULT_RATE_LIMIT_PAUSE)
+        with self._lock:
+            now = time.monotonic()
+            self._requests.drain(now)
+            self._paused_until = max(self._paused_until, now + seconds)
+        logger.warning("Rate limited; pausing requests for %.1fs", seconds)
+        return seconds
+
+    def on_error(self, error: BaseException) -> None:
+        """Feed a provider SDK exception: 429s (by ``status_code``) pause all callers."""
+        if getattr(error, "status_code", None) != 429:
+            return
+        response = getattr(error, "response", None)
+        headers = getattr(error, "litellm_response_headers", None) or getattr(response, "headers", None)
+        self.on_rate_limited(headers)
+
+
+def get_rate_limiter(
+    provider: str, model_name: str, *, requests_per_minute: int = 0, tokens_per_minute: int = 0
+) -> RateLimiter:
+    """Return the process-wide limiter for ``provider`` and ``model_name``, creating it if needed."""
+    key = (provider, model_name)
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(key)
+        if limiter is None:
+            limiter = RateLimiter(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+            _LIMITERS[key] = limiter
+        else:
+            limiter.configure(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+        return limiter
+
+
+def reset_rate_limiters() -> None:
+    """Forget all shared limiters."""
+    with _LIMITERS_LOCK:
+        _LIMITERS.clear()
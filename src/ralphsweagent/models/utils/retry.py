@@ -0,0 +1,17 @@
+"""Async counterpart of mini-swe-agent's model retry helper."""
+
+import logging
+import os
+
+from tenacity import AsyncRetrying, before_sleep_log, retry_if_not_exception_type, stop_after_attempt, wait_exponential
+
+
+def aretry(*, logger: logging.Logger, abort_exceptions: list[type[Exception]]) -> AsyncRetrying:
+    """Same policy as `minisweagent.models.utils.retry.retry`, for use with `async for`."""
+    return AsyncRetrying(
+        reraise=True,
+        stop=stop_after_attempt(int(os.getenv("MSWEA_MODEL_RETRY_STOP_AFTER_ATTEMPT", "10"))),
+        wait=wait_exponential(multiplier=1, min=4, max=60),
+        before_sleep=before_sleep_log(logger, logging.WARNING),
+        retry=retry_if_not_exception_type(tuple(abort_exceptions)),
+    )
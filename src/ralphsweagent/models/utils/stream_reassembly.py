@@ -0,0 +1,474 @@
+"""Incremental reassembly of streamed chat completion chunks."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import queue
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from collections.abc import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator
+from types import SimpleNamespace
+from typing import Any
+
+CLOSING_TAG_RE = re.compile(r"</[^>]+>")
+SSE_DONE = object()
+
+
+class SSEStreamError(Exception):
+    """The provider reported an error inside an otherwise successful event stream."""
+
+
+class StreamIdleTimeout(Exception):
+    """No chunk of a streamed response arrived within the allowed idle time."""
+
+
+class _StreamingMessage:
+    def __init__(self, *, role: str, content: str | None, tool_calls: list):
+        self.role = role
+        self.content = content
+        self.tool_calls = tool_calls
+
+    def model_dump(self) -> dict:
+        return {
+            "role": self.role,
+            "content": self.content,
+            "tool_calls": self.tool_calls,
+        }
+
+
+class _StreamingChoice:
+    def __init__(self, *, index: int, message: _StreamingMessage, finish_reason: str | None):
+        self.index = index
+        self.message = message
+        self.finish_reason = finish_reason
+
+    def model_dump(self) -> dict:
+        return {
+            "index": self.index,
+            "message": self.message.model_dump(),
+            "finish_reason": self.finish_reason,
+        }
+
+
+class _StreamingResponse(dict):
+    def __init__(self, *, choices: list[_StreamingChoice], usage: dict | None, model: str | None, **kwargs):
+        data: dict[str, Any] = {"choices": choices, **kwargs}
+        if usage is not None:
+            data["usage"] = usage
+        if model is not None:
+            data["model"] = model
+        super().__init__(data)
+        self.choices = choices
+        self.usage = usage
+        self.model = model
+        self.time_to_first_token: float | None = None
+
+    def model_dump(self) -> dict:
+        data = dict(self)
+        data["choices"] = [choice.model_dump() for choice in self.choices]
+        return data
+
+
+def _get(obj: Any, name: str, default: Any = None) -> Any:
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def _as_dict(value: Any) -> dict | None:
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return value
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if hasattr(value, "__dict__"):
+        return value.__dict__
+    return None
+
+
+class ClosingTagWindow:
+    """Count closing tags in the last ``window`` characters of a growing text.
+
+    Equivalent to ``CLOSING_TAG_RE.finditer(text[-window:])`` on the full text after every
+    `feed`, but each call only scans the new characters. Matches are tracked on the full
+    text; the one match that can straddle the window start is re-resolved the way a scan
+    starting inside it would see it (from the first ``</`` opening inside the window).
+    """
+
+    def __init__(self, window: int, threshold: int):
+        self.window = window
+        self.threshold = threshold
+        self.length = 0
+        self._carry = ""
+        self._pos = 0
+        self._open_start: int | None = None
+        self._open_inner: list[int] = []
+        self._matches: deque[tuple[int, int, list[int]]] = deque()
+
+    @property
+    def window_start(self) -> int:
+        return max(0, self.length - self.window)
+
+    def feed(self, delta: str) -> None:
+        base = self.length - len(self._carry)
+        seg = self._carry + delta
+        i = self._pos - base
+        while True:
+            if self._open_start is None:
+                j = seg.find("</", i)
+                if j < 0:
+                    i = max(i, len(seg) - 1)
+                    break
+                if j + 2 >= len(seg):
+                    i = j
+                    break
+                if seg[j + 2] == ">":
+                    i = j + 1
+                    continue
+                self._open_start = base + j
+                self._open_inner = []
+                i = j + 2
+            else:
+                end = seg.find(">", i)
+                limit = end if end >= 0 else len(seg)
+                inner = seg.find("</", i, limit)
+                while inner >= 0:
+                    self._open_inner.append(base + inner)
+                    inner = seg.find("</", inner + 1, limit)
+                if end < 0:
+                    i = max(i, len(seg) - 1)
+                    break
+                close = base + end
+                inner_openings = [p for p in self._open_inner if p + 2 < close]
+                self._matches.append((self._open_start, close + 1, inner_openings))
+                self._open_start = None
+                i = end + 1
+        self.length += len(delta)
+        self._pos = base + i
+        self._carry = seg[-2:]
+        start = self.window_start
+        while self._matches and self._matches[0][1] <= start:
+            self._matches.popleft()
+
+    def _window_match_starts(self):
+        start = self.window_start
+        for match_start, _, inner in self._matches:
+            if match_start >= start:
+                yield match_start
+                continue
+            index = bisect_left(inner, start)
+            if index < len(inner):
+                yield inner[index]
+
+    def count(self) -> int:
+        count = len(self._matches)
+        if count and self._matches[0][0] < self.window_start:
+            inner = self._matches[0][2]
+            if bisect_left(inner, self.window_start) == len(inner):
+                count -= 1
+        return count
+
+    def triggered(self) -> bool:
+        return self.count() >= self.threshold
+
+    def cutoff(self) -> int | None:
+        """Start of the ``threshold``-th closing tag in the window, or None if there are fewer."""
+        for n, match_start in enumerate(self._window_match_starts(), start=1):
+            if n == self.threshold:
+                return match_start
+        return None
+
+
+class StreamReassembler:
+    """Accumulate streamed completion chunks (objects or dicts) into a single `_StreamingResponse`.
+
+    Content and tool-call argument deltas are kept as chunk lists and joined once in `build`,
+    so per-chunk cost is proportional to the delta size. With ``guard_window`` and
+    ``guard_threshold`` > 0, `add` reports when the closing-tag stream guard trips and the
+    content is truncated before the ``guard_threshold``-th closing tag in the window.
+
+    ``on_tool_call(tool_call_id, name, arguments)`` is called once per tool call, as soon as its
+    streamed arguments form a complete JSON object; it returns whether it dispatched the call,
+    and `dispatched` counts the calls of this stream that it did. `time_to_first_token` is measured from
+    ``started_at`` (a `time.monotonic` value, default: construction) to the first content or
+    tool-call delta.
+    """
+
+    def __init__(
+        self,
+        *,
+        guard_window: int = 0,
+        guard_threshold: int = 0,
+        on_tool_call: Callable[[str, str | None, dict], bool] | None = None,
+        started_at: float | None = None,
+    ):
+        self.started_at = time.monotonic() if started_at is None else started_at
+        self.first_token_at: float | None = None
+        self._content: list[str] = []
+        self._on_tool_call = on_tool_call
+        self.dispatched = 0
+        self._guard = ClosingTagWindow(guard_window, guard_threshold) if guard_window > 0 and guard_threshold > 0 else None
+        self._truncated: str | None = None
+        self.tool_calls_by_index: dict[int, dict] = {}
+        self.usage: dict | None = None
+        self.finish_reason: str | None = None
+        self.role = "assistant"
+        self.model_name = None
+        self.response_id = None
+        self.created = None
+
+    @property
+    def time_to_first_token(self) -> float | None:
+        return None if self.first_token_at is None else self.first_token_at - self.started_at
+
+    @property
+    def content(self) -> str:
+        if self._truncated is not None:
+            return self._truncated
+        return "".join(self._content)
+
+    def add(self, chunk) -> bool:
+        """Add one chunk. Returns True if the stream guard triggered and the stream should be abandoned."""
+        if chunk is None:
+            return False
+        self.model_name = _get(chunk, "model", self.model_name)
+        self.response_id = _get(chunk, "id", self.response_id)
+        self.created = _get(chunk, "created", self.created)
+        chunk_usage = _as_dict(_get(chunk, "usage"))
+        if chunk_usage is not None:
+            self.usage = chunk_usage
+        choices = _get(chunk, "choices")
+        if not choices:
+            return False
+        choice = choices[0]
+        self.finish_reason = _get(choice, "finish_reason", self.finish_reason)
+        delta = _get(choice, "delta") or _get(choice, "message")
+        if not delta:
+            return False
+        delta_role = _get(delta, "role")
+        if delta_role:
+            self.role = delta_role
+        delta_tool_calls = _get(delta, "tool_calls")
+        delta_content = _get(delta, "content")
+        if self.first_token_at is None and (delta_tool_calls or delta_content):
+            self.first_token_at = time.monotonic()
+        if delta_tool_calls:
+            self._add_tool_calls(delta_tool_calls)
+        if delta_content:
+            self._content.append(delta_content)
+            if self._guard is not None:
+                self._guard.feed(delta_content)
+                if self._guard.triggered():
+                    self._truncated = "".join(self._content)[: self._guard.cutoff()]
+                    return True
+        return False
+
+    def _add_tool_calls(self, delta_tool_calls: list[Any]) -> None:
+        for raw_tool_call in delta_tool_calls:
+            tool_call = _as_dict(raw_tool_call)
+            if not tool_call:
+                continue
+            index = tool_call.get("index", 0)
+            entry = self.tool_calls_by_index.setdefault(
+                index, {"id": None, "type": None, "name": None, "arguments": [], "notified": False}
+            )
+            if tool_call.get("id"):
+                entry["id"] = tool_call["id"]
+            if tool_call.get("type"):
+                entry["type"] = tool_call["type"]
+            function = _as_dict(tool_call.get("function")) or {}
+            if function.get("name"):
+                entry["name"] = function["name"]
+            if function.get("arguments"):
+                entry["arguments"].append(function["arguments"])
+                if self._on_tool_call is not None and function["arguments"].rstrip().endswith("}"):
+                    self._notify_tool_call(entry)
+
+    def _notify_tool_call(self, entry: dict) -> None:
+        if entry["notified"] or not entry["id"]:
+            return
+        try:
+            arguments = json.loads("".join(entry["arguments"]))
+        except ValueError:
+            return
+        if isinstance(arguments, dict):
+            entry["notified"] = True
+            if self._on_tool_call(entry["id"], entry["name"], arguments):
+                self.dispatched += 1
+
+    def _build_tool_calls(self) -> list:
+        tool_calls = []
+        for index in sorted(self.tool_calls_by_index):
+            data = self.tool_calls_by_index[index]
+            function = SimpleNamespace(name=data["name"], arguments="".join(data["arguments"]))
+            tool_calls.append(SimpleNamespace(id=data["id"], function=function, type=data["type"]))
+        return tool_calls
+
+    def build(self) -> _StreamingResponse:
+        content = self.content or None
+        message = _StreamingMessage(role=self.role, content=content, tool_calls=self._build_tool_calls())
+        choice = _StreamingChoice(index=0, message=message, finish_reason=self.finish_reason)
+        response = _StreamingResponse(
+            choices=[choice],
+            usage=self.usage,
+            model=self.model_name,
+            id=self.response_id,
+            created=self.created,
+        )
+        response.time_to_first_token = self.time_to_first_token
+        return response
+
+    def build_dict(self) -> dict:
+        """Like `build`, but as a plain JSON-serializable chat completion dict."""
+        message: dict[str, Any] = {"role": self.role, "content": self.content or None}
+        tool_calls = [
+            {
+                "id": tool_call.id,
+                "type": tool_call.type or "function",
+                "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments},
+            }
+            for tool_call in self._build_tool_calls()
+        ]
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        response: dict[str, Any] = {
+            "id": self.response_id,
+            "created": self.created,
+            "model": self.model_name,
+            "choices": [{"index": 0, "message": message, "finish_reason": self.finish_reason}],
+        }
+        if self.usage is not None:
+            response["usage"] = self.usage
+        return response
+
+
+def parse_sse_line(line: str | bytes) -> Any:
+    """Return the JSON payload of an SSE ``data:`` line, `SSE_DONE` for ``[DONE]``, or None otherwise."""
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return SSE_DONE
+    if not data:
+        return None
+    payload = json.loads(data)
+    if isinstance(payload, dict) and payload.get("error"):
+        raise SSEStreamError(str(payload["error"]))
+    return payload
+
+
+def reassemble_sse(lines: Iterable[str | bytes]) -> dict:
+    """Reassemble an OpenAI-compatible chat completion event stream into a response dict."""
+    reassembler = StreamReassembler()
+    for line in lines:
+        data = parse_sse_line(line)
+        if data is SSE_DONE:
+            break
+        reassembler.add(data)
+    return reassembler.build_dict()
+
+
+async def areassemble_sse(lines: AsyncIterable[str | bytes]) -> dict:
+    reassembler = StreamReassembler()
+    async for line in lines:
+        data = parse_sse_line(line)
+        if data is SSE_DONE:
+            break
+        reassembler.add(data)
+    return reassembler.build_dict()
+
+
+def _completed_response(data: Any) -> dict | None:
+    """The final response of a Responses API stream event, or None if ``data`` is not the final event."""
+    if not isinstance(data, dict):
+        return None
+    event_type = data.get("type")
+    if event_type in ("response.completed", "response.incomplete"):
+        return data["response"]
+    if event_type in ("response.failed", "error"):
+        raise SSEStreamError(str((data.get("response") or {}).get("error") or data.get("message") or data))
+    return None
+
+
+def reassemble_responses_sse(lines: Iterable[str | bytes]) -> dict:
+    """The response of a Responses API event stream, taken from its ``response.completed`` event."""
+    for line in lines:
+        data = parse_sse_line(line)
+        if data is SSE_DONE:
+            break
+        if (response := _completed_response(data)) is not None:
+            return response
+    raise SSEStreamError("Stream ended without a completed response")
+
+
+async def areassemble_responses_sse(lines: AsyncIterable[str | bytes]) -> dict:
+    async for line in lines:
+        data = parse_sse_line(line)
+        if data is SSE_DONE:
+            break
+        if (response := _completed_response(data)) is not None:
+            return response
+    raise SSEStreamError("Stream ended without a completed response")
+
+def iter_with_idle_timeout(stream: Iterable, timeout: float) -> Iterator:
+    """Yield the chunks of ``stream``, raising `StreamIdleTimeout` if one takes more than ``timeout`` seconds.
+
+    The stream is read on a helper thread, so a stalled read cannot block the caller. When the
+    caller stops early or gives up, the stream is closed if it has a ``close()`` method, which
+    also ends the blocked read. ``timeout`` <= 0 reads the stream directly.
+    """
+    if timeout <= 0:
+        yield from stream
+        return
+    chunks: queue.Queue = queue.Queue()
+    end = object()
+
+    def read() -> None:
+        try:
+            for chunk in stream:
+                chunks.put((chunk, None))
+        except Exception as e:
+            chunks.put((end, e))
+        else:
+            chunks.put((end, None))
+
+    threading.Thread(target=read, name="stream-reader", daemon=True).start()
+    finished = False
+    try:
+        while True:
+            try:
+                chunk, error = chunks.get(timeout=timeout)
+            except queue.Empty:
+                raise StreamIdleTimeout(f"No stream chunk received for {timeout}s") from None
+            if chunk is end:
+                finished = True
+                if error is not None:
+                    raise error
+                return
+            yield chunk
+    finally:
+        if not finished and callable(close := getattr(stream, "close", None)):
+            close()
+
+
+async def aiter_with_idle_timeout(stream: AsyncIterable, timeout: float) -> AsyncIterator:
+    """Async variant of `iter_with_idle_timeout`; a stalled read is cancelled instead."""
+    chunks = stream.__aiter__()
+    while True:
+        try:
+            if timeout > 0:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+            else:
+                chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            return
+        except asyncio.TimeoutError:
+            raise StreamIdleTimeout(f"No stream chunk received for {timeout}s") from None
+        yield chunk
@@ -0,0 +1,66 @@
+"""Client-side prompt token estimates, so context-window overflows are caught before sending."""
+
+from __future__ import annotations
+
+import functools
+import json
+import logging
+from collections.abc import Callable
+from typing import Any
+
+from ralphsweagent.models.utils.message_prep import PreparedMessageCache, strip_extra
+
+logger = logging.getLogger("token_estimate")
+
+CHARS_PER_TOKEN = 4
+"""Characters per token assumed by the heuristic fallback."""
+
+
+def heuristic_token_count(obj: Any) -> int:
+    """Fast tokenizer-free estimate: serialized length / `CHARS_PER_TOKEN`."""
+    return len(json.dumps(obj, default=str)) // CHARS_PER_TOKEN + 1
+
+
+@functools.lru_cache(maxsize=64)
+def get_message_token_counter(model_name: str) -> Callable[[dict], int]:
+    """Token counter for one message, using the model's tokenizer via litellm when it is usable.
+
+    Cached per model name, so the tokenizer is selected and loaded once per process.
+    """
+    try:
+        import litellm
+
+        litellm.token_counter(model=model_name, messages=[{"role": "user", "content": "probe"}])
+    except Exception as e:
+        logger.debug("No tokenizer for %s, estimating tokens from characters: %s", model_name, e)
+        return heuristic_token_count
+
+    def count(message: dict) -> int:
+        try:
+            return litellm.token_counter(model=model_name, messages=[message])
+        except Exception:
+            return heuristic_token_count(message)
+
+    return count
+
+
+class PromptTokenEstimator:
+    """Estimated prompt tokens of a conversation for ``model_name``.
+
+    Each message is counted once and memoized like prepared API input (see
+    `PreparedMessageCache`), so estimating every step only costs the new messages.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._count = get_message_token_counter(model_name)
+        self._cache = PreparedMessageCache(lambda msg: [self._count(strip_extra(msg))])
+
+    def estimate(self, messages: list[dict], *, tools: list[dict] | None = None) -> int:
+        total = sum(self._cache.prepare(messages))
+        if tools:
+            total += heuristic_token_count(tools)
+        return total
+
+    def clear(self) -> None:
+        self._cache.clear()
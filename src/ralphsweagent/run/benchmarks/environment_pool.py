@@ -0,0 +1,136 @@
+"""Start the environments of upcoming batch instances before their workers need them.
+
+The pool follows the batch queue and keeps up to ``depth`` environments either starting or
+started and waiting for their instance. When a worker asks for its instance's environment,
+a started one is health-checked and handed over. An unhealthy one is cleaned up and the
+worker starts a fresh environment itself, as it does for instances the pool has not reached.
+`close` cleans up every environment that was not handed over. It waits a bounded time for
+ones still starting; any that finish later are cleaned up as soon as they are up.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from collections import Counter
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any
+
+logger = logging.getLogger("environment_pool")
+
+
+def _cleanup(env) -> None:
+    if hasattr(env, "cleanup"):
+        try:
+            env.cleanup()
+        except Exception as e:
+            logger.warning("Cleaning up a pooled environment raised %s: %s", type(e).__name__, e)
+
+
+class EnvironmentPool:
+    """Warm environments for the instance ids in ``queue``, created by ``factory(instance_id)``."""
+
+    def __init__(self, queue: list[str], factory: Callable[[str], Any], *, depth: int = 2):
+        self.queue = queue
+        self.factory = factory
+        self.depth = depth
+        self.health_check_command = "true"
+        self._claimed: set[str] = set()
+        self._cursor = 0
+        self._warm: dict[str, Future] = {}
+        self._closed = False
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max(1, depth), thread_name_prefix="environment-pool")
+        self.stats = Counter()
+
+    def start(self) -> None:
+        with self._lock:
+            self._fill()
+
+    def _fill(self) -> None:
+        """Start environments for the next unclaimed instances until ``depth`` are warm. Needs ``_lock``."""
+        while not self._closed and len(self._warm) < self.depth and self._cursor < len(self.queue):
+            instance_id = self.queue[self._cursor]
+            self._cursor += 1
+            if instance_id in self._claimed:
+                continue
+            future = self._executor.submit(self.factory, instance_id)
+            future.add_done_callback(self._on_started)
+            self._warm[instance_id] = future
+
+    def _on_started(self, future: Future) -> None:
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.warning("Pre-starting an environment failed: %s", future.exception())
+            return
+        with self._lock:
+            self.stats["started"] += 1
+
+    def _discard(self, future: Future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+        _cleanup(future.result())
+        with self._lock:
+            self.stats["discarded"] += 1
+
+    def _healthy(self, env) -> bool:
+        try:
+            return env.execute({"command": self.health_check_command}).get("returncode") == 0
+        except Exception as e:
+            logger.warning("Health check of a pooled environment raised %s: %s", type(e).__name__, e)
+            return False
+
+    def acquire(self, instance_id: str):
+        """The pre-started environment for ``instance_id``, waiting if it is still starting.
+
+        Returns None if the pool has none for it, it failed to start or it failed its health
+        check. The caller then starts one itself.
+        """
+        with self._lock:
+            if self._closed:
+                return None
+            self._claimed.add(instance_id)
+            future = self._warm.pop(instance_id, None)
+            self._fill()
+        if future is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        try:
+            env = future.result()
+        except Exception:
+            with self._lock:
+                self.stats["failed"] += 1
+            return None
+        if not self._healthy(env):
+            _cleanup(env)
+            with self._lock:
+                self.stats["unhealthy"] += 1
+            return None
+        with self._lock:
+            self.stats["hits"] += 1
+        return env
+
+    def close(self, timeout: float | None = 60.0) -> None:
+        """Stop pre-starting and clean up every environment that was not handed to a worker.
+
+        Waits up to ``timeout`` seconds for environments that are still starting and cleans
+        them up before returning. Any still starting after that are cleaned up on the pool's
+        thread when they finish; the interpreter waits for those threads before exiting.
+        """
+        with self._lock:
+            self._closed = True
+            warm, self._warm = list(self._warm.values()), {}
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        done, pending = wait(warm, timeout=timeout)
+        for future in done:
+            self._discard(future)
+        if pending:
+            logger.warning("%d pooled environments are still starting; cleaning them up once started", len(pending))
+        for future in pending:
+            future.add_done_callback(self._discard)
+
+    def summary(self) -> str:
+        return ", ".join(f"{key}={value}" for key, value in sorted(self.stats.items())) or "nothing pre-started"
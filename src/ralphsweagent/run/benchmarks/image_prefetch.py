@@ -0,0 +1,211 @@
+"""Pull the docker images of upcoming batch instances in the background.
+
+The prefetcher follows the batch queue: it pulls the images of the next ``lookahead``
+instances that have not started yet, at most ``max_pulls`` at a time. Once every queued
+instance that uses an image has finished, the image is removed again, but only if the
+prefetcher pulled it itself. With a disk budget, no new pull starts while the images the
+prefetcher pulled (and has not removed yet) take up more than the budget. Running pulls count
+at the mean size of the completed ones, so the budget is approximate.
+"""
+
+from __future__ import annotations
+
+import logging
+import subprocess
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("image_prefetch")
+
+
+class ImagePrefetcher:
+    """Background image pulls for the instances in ``queue``, a list of (instance_id, image)."""
+
+    def __init__(
+        self,
+        queue: list[tuple[str, str]],
+        *,
+        lookahead: int = 8,
+        max_pulls: int = 2,
+        disk_budget_bytes: int = 0,
+        evict: bool = True,
+        executable: str = "docker",
+        pull_timeout: float = 3600,
+    ):
+        self.queue = queue
+        self.lookahead = lookahead
+        self.max_pulls = max_pulls
+        self.disk_budget_bytes = disk_budget_bytes
+        self.evict = evict
+        self.executable = executable
+        self.pull_timeout = pull_timeout
+        self.evict_retries = 6
+        self.evict_retry_delay = 10.0
+        self._positions = {instance_id: index for index, (instance_id, _) in enumerate(queue)}
+        self._remaining = Counter(image for _, image in queue)
+        self._started: set[str] = set()
+        self._cursor = 0
+        self._state: dict[str, str] = {}
+        self._done: dict[str, threading.Event] = {}
+        self._pulled_bytes: dict[str, int] = {}
+        self._closed = False
+        self._cond = threading.Condition()
+        self._pulls = ThreadPoolExecutor(max(1, max_pulls), thread_name_prefix="image-prefetch")
+        self._evictions = ThreadPoolExecutor(1, thread_name_prefix="image-evict")
+        self.stats = Counter()
+
+    def _run(self, *args: str, timeout: float | None = None) -> subprocess.CompletedProcess:
+        return subprocess.run([self.executable, *args], capture_output=True, text=True, timeout=timeout)
+
+    def start(self) -> None:
+        with self._cond:
+            self._schedule()
+
+    def _schedule(self) -> None:
+        """Start pulls for the images of the next ``lookahead`` unstarted instances. Needs ``_cond``."""
+        if self._closed:
+            return
+        while self._cursor < len(self.queue) and self.queue[self._cursor][0] in self._started:
+            self._cursor += 1
+        window: dict[str, None] = {}
+        upcoming = 0
+        for instance_id, image in self.queue[self._cursor :]:
+            if upcoming >= self.lookahead:
+                break
+            if instance_id not in self._started:
+                window[image] = None
+                upcoming += 1
+        for image in window:
+            if image in self._state:
+                continue
+            if sum(state == "pulling" for state in self._state.values()) >= self.max_pulls:
+                return
+            if self.disk_budget_bytes and self._expected_bytes() >= self.disk_budget_bytes:
+                self.stats["budget_stalls"] += 1
+                return
+            self._state[image] = "pulling"
+            self._done[image] = threading.Event()
+            self._pulls.submit(self._pull, image)
+
+    def _expected_bytes(self) -> int:
+        """Size of the prefetched images on disk, counting running pulls at the mean size so far."""
+        sizes = [size for size in self._pulled_bytes.values() if size]
+        pulling = sum(state == "pulling" for state in self._state.values())
+        return sum(sizes) + pulling * (sum(sizes) // len(sizes) if sizes else 0)
+
+    def _pull(self, image: str) -> None:
+        state, size = "failed", 0
+        try:
+            if self._run("image", "inspect", image, timeout=60).returncode == 0:
+                state = "present"
+            else:
+                started = time.monotonic()
+                result = self._run("pull", image, timeout=self.pull_timeout)
+                if result.returncode == 0:
+                    state = "pulled"
+                    self._count_layers(result.stdout)
+                    size = self._image_size(image)
+                    logger.info("Prefetched %s in %.1fs", image, time.monotonic() - started)
+                else:
+                    logger.warning("Prefetching %s failed: %s", image, result.stderr.strip())
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning("Prefetching %s failed: %s", image, e)
+        with self._cond:
+            self._state[image] = state
+            self.stats[state] += 1
+            if state == "pulled":
+                self._pulled_bytes[image] = size
+            self._done[image].set()
+            if state == "pulled" and self._remaining[image] <= 0:
+                self._evict_later(image)
+            self._schedule()
+
+    def _count_layers(self, pull_output: str) -> None:
+        """Count layers the pull found on disk already (``layers_reused``) or downloaded (``layers_pulled``)."""
+        reused = sum(line.endswith("Already exists") for line in pull_output.splitlines())
+        pulled = sum(line.endswith("Pull complete") for line in pull_output.splitlines())
+        with self._cond:
+            self.stats["layers_reused"] += reused
+            self.stats["layers_pulled"] += pulled
+
+    def layer_cache_hit_rate(self) -> float | None:
+        """Share of the layers of prefetched images that were already on disk, or None before any pull."""
+        total = self.stats["layers_reused"] + self.stats["layers_pulled"]
+        return self.stats["layers_reused"] / total if total else None
+
+    def _image_size(self, image: str) -> int:
+        result = self._run("image", "inspect", "--format", "{{.Size}}", image, timeout=60)
+        try:
+            return int(result.stdout.strip())
+        except ValueError:
+            return 0
+
+    def wait(self, instance_id: str, image: str) -> float:
+        """Mark ``instance_id`` as started and wait for a running pull of its image. Returns seconds waited.
+
+        Images that are not being prefetched are left to the environment to pull.
+        """
+        with self._cond:
+            if instance_id in self._positions:
+                self._started.add(instance_id)
+            self._schedule()
+            done = self._done.get(image) if self._state.get(image) == "pulling" else None
+        if done is None:
+            return 0.0
+        started = time.monotonic()
+        done.wait()
+        with self._cond:
+            self.stats["waits"] += 1
+        return time.monotonic() - started
+
+    def release(self, instance_id: str, image: str) -> None:
+        """``instance_id`` has finished; remove its image if no queued instance needs it anymore."""
+        with self._cond:
+            if instance_id not in self._positions:
+                return
+            self._remaining[image] -= 1
+            if self._remaining[image] <= 0 and self._state.get(image) == "pulled":
+                self._evict_later(image)
+
+    def _evict_later(self, image: str) -> None:
+        if self.evict and not self._closed:
+            self._state[image] = "evicting"
+            self._evictions.submit(self._evict, image)
+
+    def _evict(self, image: str) -> None:
+        """Remove ``image``, retrying while the finished instance's container is still stopping."""
+        for attempt in range(self.evict_retries):
+            if attempt:
+                time.sleep(self.evict_retry_delay)
+            try:
+                if self._run("rmi", image, timeout=120).returncode == 0:
+                    break
+            except (OSError, subprocess.SubprocessError):
+                pass
+        else:
+            logger.warning("Could not remove prefetched image %s", image)
+            with self._cond:
+                self._state[image] = "pulled"
+            return
+        with self._cond:
+            self._state[image] = "evicted"
+            self._pulled_bytes.pop(image, None)
+            self.stats["evicted"] += 1
+            self._schedule()
+
+    def close(self) -> None:
+        """Stop starting pulls and evictions, and stop making workers wait.
+
+        Pulls and evictions that are already running are not interrupted.
+        """
+        with self._cond:
+            self._closed = True
+            for done in self._done.values():
+                done.set()
+        self._pulls.shutdown(wait=False, cancel_futures=True)
+        self._evictions.shutdown(wait=False, cancel_futures=True)
+
+    def summary(self) -> str:
+        return ", ".join(f"{key}={value}" for key, value in sorted(self.stats.items())) or "nothing prefetched"
@@ -0,0 +1,90 @@
+"""Append-only predictions log (``preds.jsonl``) folded into ``preds.json`` on demand.
+
+Workers append one line per event instead of rewriting ``preds.json``:
+
+* ``{"instance_id": ..., "prediction": {...}}``: the instance's prediction, replacing any earlier one.
+* ``{"instance_id": ..., "removed": true}``: the instance is being (re)run; drop its prediction.
+
+`materialize_predictions` applies the events in order to ``preds.json``, writes it atomically
+and empties the log. Appends and materialization hold an advisory lock on the log file, so
+several workers and processes can share one output directory.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from ralphsweagent.utils.fs import atomic_write_text, locked_open
+
+logger = logging.getLogger("preds_log")
+
+PREDS_LOG_NAME = "preds.jsonl"
+
+
+def get_preds_log_path(preds_path: Path) -> Path:
+    return preds_path.with_name(PREDS_LOG_NAME)
+
+
+def _append(preds_path: Path, record: dict) -> None:
+    with locked_open(get_preds_log_path(preds_path), "a") as handle:
+        handle.write(json.dumps(record) + "\n")
+
+
+def record_prediction(preds_path: Path, instance_id: str, model_name: str, result: str) -> None:
+    """Log the prediction of a finished instance; same entry as upstream ``update_preds_file``."""
+    prediction = {"model_name_or_path": model_name, "instance_id": instance_id, "model_patch": result}
+    _append(preds_path, {"instance_id": instance_id, "prediction": prediction})
+
+
+def remove_prediction(preds_path: Path, instance_id: str) -> None:
+    """Log that ``instance_id`` no longer has a prediction, e.g. because it is being rerun."""
+    _append(preds_path, {"instance_id": instance_id, "removed": True})
+
+
+def _read_events(lines: list[str], log_path: Path) -> Iterator[dict]:
+    for line_number, line in enumerate(lines, 1):
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning("Ignoring unreadable line %s:%d", log_path, line_number)
+
+
+def _read_predictions(preds_path: Path) -> dict[str, dict]:
+    return json.loads(preds_path.read_text()) if preds_path.exists() else {}
+
+
+def fold_predictions(predictions: dict[str, dict], events: Iterable[dict]) -> dict[str, dict]:
+    """Apply log ``events`` in order to ``predictions`` (modified in place and returned)."""
+    for event in events:
+        instance_id = event.get("instance_id")
+        if instance_id is None:
+            continue
+        if event.get("removed"):
+            predictions.pop(instance_id, None)
+        elif "prediction" in event:
+            predictions[instance_id] = event["prediction"]
+    return predictions
+
+
+def materialize_predictions(preds_path: Path) -> dict[str, dict]:
+    """Fold ``preds.jsonl`` into ``preds.json`` and empty the log. Returns the predictions.
+
+    Without a log, ``preds.json`` is only read. Folding is idempotent, so a crash between
+    writing ``preds.json`` and emptying the log loses nothing.
+    """
+    log_path = get_preds_log_path(preds_path)
+    if not log_path.exists():
+        return _read_predictions(preds_path)
+    with locked_open(log_path, "r+") as handle:
+        predictions = _read_predictions(preds_path)
+        lines = handle.read().splitlines()
+        if not lines:
+            return predictions
+        fold_predictions(predictions, _read_events(lines, log_path))
+        atomic_write_text(preds_path, json.dumps(predictions, indent=2))
+        handle.seek(0)
+        handle.truncate()
+    return predictions
@@ -0,0 +1,168 @@
+"""Order the instances of a batch run before they are handed to the workers.
+
+Workers take instances from one shared queue in order, so the order is the schedule.
+
+* ``dataset``: dataset order (after ``--filter``, ``--slice`` and ``--shuffle``).
+* ``locality``: instances grouped by repo family (repo and version), whose images share
+  most of their layers, largest family first. Instances of one family run back to back,
+  on all workers at once, so their shared layers are pulled once and stay cached.
+* ``lpt``: longest predicted duration first. Predictions come from earlier runs (see
+  `load_history`). An idle worker always takes the next instance from the shared queue,
+  which is the greedy list scheduling LPT relies on; there are no per-worker queues.
+"""
+
+from __future__ import annotations
+
+import heapq
+import json
+import logging
+import statistics
+from collections import deque
+from collections.abc import Callable
+from pathlib import Path
+
+logger = logging.getLogger("scheduling")
+
+SCHEDULES = ("dataset", "locality", "lpt")
+
+DEFAULT_SECONDS_PER_STEP = 30.0
+"""Assumed step duration for trajectories without step timings, if no other trajectory has them."""
+
+STEP_PHASES = ("context_check", "model", "environment", "observation_render")
+"""Disjoint phases of a step; ``time_to_first_token`` is part of ``model``, so it is not summed."""
+
+REPORT_KEYS = frozenset({"schedule", "instances_started", "family_cache_hit_rate", "instance_seconds"})
+"""Keys that mark a JSON file as a ``schedule.json`` report rather than a bare history map."""
+
+
+def repo_family(instance: dict) -> str:
+    """``repo@version``; without a ``repo`` field, the instance id up to its last ``-``."""
+    repo = instance.get("repo") or instance["instance_id"].rsplit("-", 1)[0]
+    return f"{repo}@{instance.get('version', '')}"
+
+
+def locality_order(instances: list[dict], image_name: Callable[[dict], str]) -> list[dict]:
+    """Instances grouped by repo family, largest family first, then by image and instance id."""
+    families: dict[str, list[dict]] = {}
+    for instance in instances:
+        families.setdefault(repo_family(instance), []).append(instance)
+    ordered = sorted(families.items(), key=lambda item: (-len(item[1]), item[0]))
+    return [
+        instance
+        for _, members in ordered
+        for instance in sorted(members, key=lambda item: (image_name(item), item["instance_id"]))
+    ]
+
+
+def _trajectory_stats(data: dict) -> tuple[float | None, int]:
+    """Seconds spent in the `STEP_PHASES` of each step (None without step timings) and API calls of a trajectory."""
+    messages = data.get("messages") or []
+    timings = [msg["extra"]["timings"] for msg in messages if msg.get("extra", {}).get("timings")]
+    seconds = sum(
+        value for phases in timings for phase in STEP_PHASES if isinstance(value := phases.get(phase), int | float)
+    )
+    api_calls = (data.get("info") or {}).get("model_stats", {}).get("api_calls") or len(timings)
+    return (seconds if timings else None), api_calls
+
+
+def _history_from_trajectories(run_dir: Path) -> dict[str, float]:
+    """Durations from the ``<id>/<id>.traj.json`` files of a previous run.
+
+    Trajectories without step timings are estimated from their API calls, at the mean
+    seconds per step of the ones that have them.
+    """
+    timed: dict[str, float] = {}
+    steps: dict[str, int] = {}
+    for path in sorted(run_dir.glob("*/*.traj.json")):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, json.JSONDecodeError):
+            logger.warning("Ignoring unreadable trajectory %s", path)
+            continue
+        instance_id = data.get("instance_id") or path.parent.name
+        seconds, api_calls = _trajectory_stats(data)
+        steps[instance_id] = api_calls
+        if seconds is not None:
+            timed[instance_id] = seconds
+    timed_steps = sum(steps[instance_id] for instance_id in timed)
+    per_step = sum(timed.values()) / timed_steps if timed_steps else DEFAULT_SECONDS_PER_STEP
+    return {instance_id: timed.get(instance_id, api_calls * per_step) for instance_id, api_calls in steps.items()}
+
+
+def load_history(path: Path) -> dict[str, float]:
+    """Predicted seconds per instance id from ``path``.
+
+    ``path`` is a previous run's output directory (its trajectories, overridden by the measured
+    durations in its ``schedule.json``), a ``schedule.json`` file (only its ``instance_seconds``
+    are used), or a JSON object mapping instance ids to seconds.
+    """
+    if path.is_dir():
+        return _history_from_trajectories(path) | load_history(path / "schedule.json")
+    if not path.exists():
+        return {}
+    data = json.loads(path.read_text())
+    if REPORT_KEYS & data.keys():
+        data = data.get("instance_seconds") or {}
+    return {instance_id: float(seconds) for instance_id, seconds in data.items() if isinstance(seconds, int | float)}
+
+
+def predict_durations(instances: list[dict], history: dict[str, float]) -> dict[str, float]:
+    """Seconds per instance id: from ``history``, else the mean of its repo family, else the overall median."""
+    by_family: dict[str, list[float]] = {}
+    for instance in instances:
+        if instance["instance_id"] in history:
+            by_family.setdefault(repo_family(instance), []).append(history[instance["instance_id"]])
+    known = [seconds for family in by_family.values() for seconds in family]
+    fallback = statistics.median(known) if known else 0.0
+    predicted = {}
+    for instance in instances:
+        family = by_family.get(repo_family(instance))
+        predicted[instance["instance_id"]] = history.get(
+            instance["instance_id"], statistics.fmean(family) if family else fallback
+        )
+    return predicted
+
+
+def lpt_order(instances: list[dict], predicted: dict[str, float]) -> list[dict]:
+    """Instances by predicted duration, longest first, then by instance id."""
+    return sorted(instances, key=lambda item: (-predicted.get(item["instance_id"], 0.0), item["instance_id"]))
+
+
+def simulate_makespan(durations: list[float], workers: int) -> float:
+    """Makespan of running ``durations`` in order, each on the first worker to become idle."""
+    finish_times = [0.0] * max(1, workers)
+    for seconds in durations:
+        heapq.heapreplace(finish_times, finish_times[0] + seconds)
+    return max(finish_times)
+
+
+def order_instances(
+    instances: list[dict],
+    schedule: str,
+    *,
+    image_name: Callable[[dict], str],
+    predicted: dict[str, float] | None = None,
+) -> list[dict]:
+    if schedule == "dataset":
+        return instances
+    if schedule == "locality":
+        return locality_order(instances, image_name)
+    if schedule == "lpt":
+        return lpt_order(instances, predicted or {})
+    msg = f"Unknown schedule: {schedule} (available: {', '.join(SCHEDULES)})"
+    raise ValueError(msg)
+
+
+def family_cache_hit_rate(families: list[str], window: int) -> float:
+    """Share of starts whose repo family was among the previous ``window`` starts.
+
+    A proxy for how often an instance finds its shared layers already on disk.
+    """
+    if not families:
+        return 0.0
+    recent: deque[str] = deque(maxlen=max(1, window))
+    hits = 0
+    for family in families:
+        hits += family in recent
+        recent.append(family)
+    return hits / len(families)
@@ -2,23 +2,88 @@
 
 from __future__ import annotations
 
+import inspect
+import json
+import os
+import platform
+import threading
+import time
 import traceback
 from pathlib import Path
 
+import typer
+
 from ralphsweagent._bootstrap import ensure_vendor_minisweagent_on_path
 
 ensure_vendor_minisweagent_on_path()
 
 from ralphsweagent.agents import resolve_agent_class
 from ralphsweagent.agents.enhancements import register_agent_enhancements
+from ralphsweagent.agents.resume import load_resume_state
+from ralphsweagent.agents.timings import collect_step_timings, write_timing_summary
+from ralphsweagent.agents.trajectory_log import get_partial_trajectory_path
+from ralphsweagent.environments.deferred import DeferredEnvironment
 from ralphsweagent.models import register_model_overrides
+from ralphsweagent.run.benchmarks.environment_pool import EnvironmentPool
+from ralphsweagent.run.benchmarks.image_prefetch import ImagePrefetcher
+from ralphsweagent.run.benchmarks.preds_log import materialize_predictions, record_prediction, remove_prediction
+from ralphsweagent.run.benchmarks.scheduling import (
+    SCHEDULES,
+    family_cache_hit_rate,
+    load_history,
+    order_instances,
+    predict_durations,
+    repo_family,
+    simulate_makespan,
+)
+from ralphsweagent.utils.env import env_flag, env_float, env_int
 
+from minisweagent.environments import get_environment_class
 from minisweagent.models import get_model
 from minisweagent.run.benchmarks import swebench as base_swebench
 from minisweagent.utils.log import logger
 
 app = base_swebench.app
 
+_resume = False
+"""Set by ``--resume``: continue interrupted instances from their trajectory files."""
+
+_schedule = "dataset"
+"""Set by ``--schedule``: the order in which instances are handed to the workers."""
+_history: Path | None = None
+"""Set by ``--history`` (default: the output directory): where ``--schedule lpt`` reads past durations."""
+
+_step_timings: list[dict] = []
+_step_timings_lock = threading.Lock()
+
+_deferred_environment = env_flag("MSWEA_DEFERRED_ENVIRONMENT", False)
+"""Start the environment in the background while the first model query runs."""
+
+_image_prefetch = env_int("MSWEA_IMAGE_PREFETCH", 0)
+"""How many upcoming instances to pull docker images for in the background (0 disables prefetching)."""
+_image_prefetch_pulls = env_int("MSWEA_IMAGE_PREFETCH_PULLS", 2)
+"""How many images to pull at the same time."""
+_image_prefetch_disk_gb = env_float("MSWEA_IMAGE_PREFETCH_DISK_GB", 0.0)
+"""Start no new pull while prefetched images take up more than this (0 for no limit)."""
+_image_prefetch_evict = env_flag("MSWEA_IMAGE_PREFETCH_EVICT", True)
+"""Remove prefetched images once every instance that uses them has finished."""
+
+_environment_pool = env_int("MSWEA_ENVIRONMENT_POOL", 0)
+"""How many environments of upcoming instances to keep started ahead of the workers (0 disables the pool)."""
+
+_batch_queue: list[dict] = []
+"""Instances the current batch will run, in the order they are submitted to the workers."""
+_skip_instance_ids: set[str] = set()
+_dataset_order: list[str] = []
+"""Instance ids of the batch queue in dataset order, before ``--schedule`` reorders them."""
+_predicted_seconds: dict[str, float] = {}
+_instance_started_at: dict[str, float] = {}
+"""Monotonic start time per instance id, in start order."""
+_instance_ended_at: dict[str, float] = {}
+_prefetcher: ImagePrefetcher | None = None
+_pool: EnvironmentPool | None = None
+_batch_lock = threading.Lock()
+
 
 def _wrap_with_progress(agent_class: type) -> type:
     if issubclass(agent_class, base_swebench.ProgressTrackingAgent):
@@ -39,6 +104,99 @@ def _wrap_with_progress(agent_class: type) -> type:
     return ProgressAgent
 
 
+def _get_prefetcher(config: dict) -> ImagePrefetcher | None:
+    """The batch's image prefetcher, started on first use, or None if prefetching does not apply."""
+    global _prefetcher
+    env_config = config.get("environment", {})
+    if not _image_prefetch or env_config.get("environment_class", "docker") != "docker":
+        return None
+    with _batch_lock:
+        if _prefetcher is None and _batch_queue:
+            queue = [(item["instance_id"], base_swebench.get_swebench_docker_image_name(item)) for item in _batch_queue]
+            _prefetcher = ImagePrefetcher(
+                queue,
+                lookahead=_image_prefetch,
+                max_pulls=_image_prefetch_pulls,
+                disk_budget_bytes=int(_image_prefetch_disk_gb * 1024**3),
+                evict=_image_prefetch_evict,
+                executable=env_config.get("executable") or os.getenv("MSWEA_DOCKER_EXECUTABLE", "docker"),
+            )
+            _prefetcher.start()
+        return _prefetcher
+
+
+def _get_sb_environment(config: dict, instance: dict):
+    """``get_sb_environment``, after waiting for a background pull of the instance's image."""
+    if (prefetcher := _get_prefetcher(config)) is not None:
+        prefetcher.wait(instance["instance_id"], base_swebench.get_swebench_docker_image_name(instance))
+    return base_swebench.get_sb_environment(config, instance)
+
+
+def _get_pool(config: dict) -> EnvironmentPool | None:
+    """The batch's environment pool, started on first use, or None if it is disabled."""
+    global _pool
+    if not _environment_pool:
+        return None
+    with _batch_lock:
+        if _pool is None and _batch_queue:
+            instances = {item["instance_id"]: item for item in _batch_queue}
+            _pool = EnvironmentPool(
+                list(instances),
+                lambda instance_id: _get_sb_environment(config, instances[instance_id]),
+                depth=_environment_pool,
+            )
+            _pool.start()
+        return _pool
+
+
+def _acquire_environment(config: dict, instance: dict):
+    """A healthy pre-started environment from the pool if there is one for ``instance``, else a new one."""
+    if (pool := _get_pool(config)) is not None and (env := pool.acquire(instance["instance_id"])) is not None:
+        return env
+    return _get_sb_environment(config, instance)
+
+
+def _early_template_vars(config: dict, instance: dict) -> dict | None:
+    """The template variables the instance's environment will report, without starting it.
+
+    The environment config is completed as in ``get_sb_environment`` and validated by the resolved
+    environment class's config class. Like the environments' own ``get_template_vars``, the result
+    is the dumped config plus the host's ``platform.uname()`` (and ``os.environ`` for ``local``).
+    None if the class has no ``config_class`` or the config is invalid; the real environment then
+    answers once it is up.
+    """
+    env_config = {**config.get("environment", {})}
+    environment_class = env_config.pop("environment_class", "docker")
+    image_name = base_swebench.get_swebench_docker_image_name(instance)
+    if environment_class in ["docker", "swerex_modal"]:
+        env_config["image"] = image_name
+    elif environment_class in ["singularity", "contree"]:
+        env_config["image"] = "docker://" + image_name
+    try:
+        cls = get_environment_class(environment_class)
+        config_class = inspect.signature(cls).parameters["config_class"].default
+        template_vars = config_class(**env_config).model_dump() | platform.uname()._asdict()
+    except Exception as e:
+        logger.debug(f"No early template variables for {instance['instance_id']}: {e}")
+        return None
+    if environment_class == "local":
+        template_vars |= os.environ
+    return template_vars
+
+
+def _start_environment(config: dict, instance: dict):
+    """The instance's environment, started in the background when deferred environments are enabled.
+
+    Until the container is up, template variables come from `_early_template_vars`.
+    """
+    if not _deferred_environment:
+        return _acquire_environment(config, instance)
+    return DeferredEnvironment(
+        lambda: _acquire_environment(config, instance),
+        template_vars=_early_template_vars(config, instance),
+    )
+
+
 def process_instance(
     instance: dict,
     output_dir: Path,
@@ -50,22 +208,28 @@ def process_instance(
     instance_dir = output_dir / instance_id
     instance_dir.mkdir(parents=True, exist_ok=True)
     live_traj_path = instance_dir / f"{instance_id}.traj.jsonl"
-    base_swebench.remove_from_preds_file(output_dir / "preds.json", instance_id)
-    (instance_dir / f"{instance_id}.traj.json").unlink(missing_ok=True)
+    traj_path = instance_dir / f"{instance_id}.traj.json"
+    resume_state = load_resume_state(traj_path, live_traj_path) if _resume else None
+    remove_prediction(output_dir / "preds.json", instance_id)
+    traj_path.unlink(missing_ok=True)
+    get_partial_trajectory_path(traj_path).unlink(missing_ok=True)
     live_traj_path.unlink(missing_ok=True)
     model = get_model(config=config.get("model", {}))
     task = instance["problem_statement"]
 
     progress_manager.on_instance_start(instance_id)
+    with _batch_lock:
+        _instance_started_at[instance_id] = time.monotonic()
     progress_manager.update_instance_status(instance_id, "Pulling/starting docker")
 
     agent = None
+    env = None
     exit_status = None
     result = None
     extra_info = {}
 
     try:
-        env = base_swebench.get_sb_environment(config, instance)
+        env = _start_environment(config, instance)
         agent_config = dict(config.get("agent", {}))
         agent_class_spec = agent_config.pop("agent_class", None)
         base_agent_class = resolve_agent_class(agent_class_spec, default=base_swebench.ProgressTrackingAgent)
@@ -77,6 +241,9 @@ def process_instance(
             instance_id=instance_id,
             **agent_config,
         )
+        if resume_state is not None:
+            progress_manager.update_instance_status(instance_id, f"Replaying {len(resume_state.actions)} actions")
+            agent.restore_trajectory(resume_state)
         agent.set_live_trajectory_path(live_traj_path)
         info = agent.run(task)
         exit_status = info.get("exit_status")
@@ -100,15 +267,189 @@ def process_instance(
                 },
             )
             logger.info(f"Saved trajectory to '{traj_path}'")
+            with _step_timings_lock:
+                _step_timings.extend(collect_step_timings(agent.messages))
+                if isinstance(env, DeferredEnvironment) and env.ready:
+                    _step_timings.append(
+                        {"environment_startup": env.startup_seconds, "environment_wait": env.wait_seconds}
+                    )
+            agent.close_live_trajectory()
             live_traj_path.unlink(missing_ok=True)
-        base_swebench.update_preds_file(output_dir / "preds.json", instance_id, model.config.model_name, result)
+        record_prediction(output_dir / "preds.json", instance_id, model.config.model_name, result)
+        with _batch_lock:
+            _instance_ended_at[instance_id] = time.monotonic()
         progress_manager.on_instance_end(instance_id, exit_status)
+        try:
+            if env is not None and hasattr(env, "cleanup"):
+                env.cleanup()
+        except Exception as e:
+            logger.warning(f"Cleaning up the environment of {instance_id} raised {type(e).__name__}: {e}")
+        try:
+            if (prefetcher := _get_prefetcher(config)) is not None:
+                prefetcher.release(instance_id, base_swebench.get_swebench_docker_image_name(instance))
+        except Exception as e:
+            logger.warning(f"Releasing the image of {instance_id} raised {type(e).__name__}: {e}")
+
+
+_upstream_filter_instances = base_swebench.filter_instances
+
+
+def _filter_instances(instances: list[dict], **kwargs) -> list[dict]:
+    """Upstream ``filter_instances``, reordered by ``--schedule``.
+
+    Also records the batch queue, without the instances upstream skips.
+    """
+    instances = _upstream_filter_instances(instances, **kwargs)
+    _dataset_order[:] = [instance["instance_id"] for instance in instances]
+    _predicted_seconds.clear()
+    if _schedule == "lpt" and _history is not None:
+        _predicted_seconds.update(predict_durations(instances, load_history(_history)))
+    instances = order_instances(
+        instances,
+        _schedule,
+        image_name=base_swebench.get_swebench_docker_image_name,
+        predicted=_predicted_seconds,
+    )
+    _batch_queue[:] = [instance for instance in instances if instance["instance_id"] not in _skip_instance_ids]
+    return instances
+
+
+def _schedule_report(workers: int) -> dict:
+    """Cache-hit rates and makespans of the instances started, for the schedule used and for dataset order.
+
+    Makespans are predicted with ``simulate_makespan`` (``--schedule lpt`` only) and measured from
+    the first instance start to the last instance end. ``instance_seconds`` can serve as ``--history``.
+    """
+    families = {instance["instance_id"]: repo_family(instance) for instance in _batch_queue}
+    started = [instance_id for instance_id in _instance_started_at if instance_id in families]
+    started_set = set(started)
+    in_dataset_order = [instance_id for instance_id in _dataset_order if instance_id in started_set]
+    window = 2 * max(1, workers)
+    report = {
+        "schedule": _schedule,
+        "instances_started": len(started),
+        "family_cache_hit_rate": family_cache_hit_rate([families[i] for i in started], window),
+        "dataset_order_family_cache_hit_rate": family_cache_hit_rate([families[i] for i in in_dataset_order], window),
+    }
+    if _prefetcher is not None and (layer_rate := _prefetcher.layer_cache_hit_rate()) is not None:
+        report["layer_cache_hit_rate"] = layer_rate
+    if _predicted_seconds:
+        report["predicted_makespan"] = simulate_makespan([_predicted_seconds[i] for i in started], workers)
+        report["dataset_order_predicted_makespan"] = simulate_makespan(
+            [_predicted_seconds[i] for i in in_dataset_order], workers
+        )
+    ended = [instance_id for instance_id in started if instance_id in _instance_ended_at]
+    if ended:
+        first_start = min(_instance_started_at[i] for i in started)
+        report["actual_makespan"] = max(_instance_ended_at[i] for i in ended) - first_start
+        report["instance_seconds"] = {i: _instance_ended_at[i] - _instance_started_at[i] for i in ended}
+    return report
+
+
+_upstream_main = base_swebench.main
 
 
+def _patched_main(*args, resume: bool = False, schedule: str = "dataset", history: str = "", **kwargs) -> None:
+    """Upstream ``main`` plus ``--resume``, ``--schedule``/``--history`` and ``timings.json``/``schedule.json``.
+
+    Workers append to ``preds.jsonl``; it is folded into ``preds.json`` before the run (so
+    upstream skips instances an interrupted run finished) and again when the run ends.
+    """
+    global _resume, _schedule, _history, _prefetcher, _pool
+    if schedule not in SCHEDULES:
+        raise typer.BadParameter(f"--schedule must be one of: {', '.join(SCHEDULES)}")
+    _resume = resume
+    _schedule = schedule
+    _history = Path(history or kwargs.get("output", ""))
+    _step_timings.clear()
+    _instance_started_at.clear()
+    _instance_ended_at.clear()
+    preds_path = Path(kwargs.get("output", "")) / "preds.json"
+    predictions = materialize_predictions(preds_path) if preds_path.parent.is_dir() else {}
+    _skip_instance_ids.clear()
+    if not kwargs.get("redo_existing"):
+        _skip_instance_ids.update(predictions)
+    try:
+        _upstream_main(*args, **kwargs)
+    finally:
+        output_path = Path(kwargs.get("output", ""))
+        if _instance_started_at and output_path.is_dir():
+            report = _schedule_report(kwargs.get("workers", 1))
+            (output_path / "schedule.json").write_text(json.dumps(report, indent=2))
+            logger.info(
+                f"Schedule '{_schedule}': repo-family cache hits {report['family_cache_hit_rate']:.1%} "
+                f"(dataset order: {report['dataset_order_family_cache_hit_rate']:.1%})"
+            )
+            if "predicted_makespan" in report and "actual_makespan" in report:
+                logger.info(
+                    f"Makespan: predicted {report['predicted_makespan']:.0f}s "
+                    f"(dataset order: {report['dataset_order_predicted_makespan']:.0f}s), "
+                    f"actual {report['actual_makespan']:.0f}s"
+                )
+        if _pool is not None:
+            _pool.close()
+            logger.info(f"Environment pool: {_pool.summary()}")
+            _pool = None
+        if _prefetcher is not None:
+            _prefetcher.close()
+            logger.info(f"Image prefetch: {_prefetcher.summary()}")
+            _prefetcher = None
+        _batch_queue.clear()
+        if preds_path.parent.is_dir():
+            materialize_predictions(preds_path)
+            logger.info(f"Saved predictions to '{preds_path}'")
+        if _step_timings:
+            timings_path = output_path / "timings.json"
+            write_timing_summary(timings_path, _step_timings)
+            logger.info(f"Saved step timing summary to '{timings_path}'")
+
+
+_EXTRA_OPTIONS = {
+    "resume": typer.Option(
+        False,
+        "--resume",
+        help="Continue interrupted instances from their trajectory files instead of starting over",
+        rich_help_panel="Data selection",
+    ),
+    "schedule": typer.Option(
+        "dataset",
+        "--schedule",
+        help=f"Order in which instances are run ({', '.join(SCHEDULES)})",
+        rich_help_panel="Data selection",
+    ),
+    "history": typer.Option(
+        "",
+        "--history",
+        help="Previous run directory or JSON file of instance durations for --schedule lpt (default: output directory)",
+        rich_help_panel="Data selection",
+    ),
+}
+_patched_main.__annotations__ = {
+    **_upstream_main.__annotations__,
+    "resume": "bool",
+    "schedule": "str",
+    "history": "str",
+}
+_patched_main.__signature__ = inspect.signature(_upstream_main).replace(
+    parameters=[
+        *inspect.signature(_upstream_main).parameters.values(),
+        *(
+            inspect.Parameter(
+                name, inspect.Parameter.KEYWORD_ONLY, annotation=_patched_main.__annotations__[name], default=option
+            )
+            for name, option in _EXTRA_OPTIONS.items()
+        ),
+    ]
+)
+
 # Monkeypatch upstream runner so `mini-extra swebench` options/behavior stay compatible.
 register_model_overrides()
 register_agent_enhancements()
 base_swebench.process_instance = process_instance
+base_swebench.filter_instances = _filter_instances
+for _command in app.registered_commands:
+    if _command.callback is _upstream_main:
+        _command.callback = _patched_main
 
 # Preserve docker_image fallback for SWE-bench-Live MultiLang datasets.
 # Upstream dropped the docker_image field check; we restore it here so that
@@ -13,6 +13,7 @@ ensure_vendor_minisweagent_on_path()
 
 from ralphsweagent.agents import resolve_agent_class
 from ralphsweagent.agents.enhancements import register_agent_enhancements
+from ralphsweagent.agents.resume import load_resume_state
 from ralphsweagent.models import register_model_overrides
 
 from minisweagent import global_config_dir
@@ -60,6 +61,7 @@ def main(
     environment_class: str | None = typer.Option(None, "--environment-class", rich_help_panel="Advanced"),
     exit_immediately: bool = typer.Option(False, "--exit-immediately", help="Exit immediately when the agent wants to finish instead of prompting.", rich_help_panel="Basic"),
     output: Path = typer.Option(DEFAULT_OUTPUT_FILE, "-o", "--output", help="Output trajectory file", rich_help_panel="Basic"),
+    resume: bool = typer.Option(False, "--resume", help="Continue an interrupted run from the trajectory files at --output", rich_help_panel="Basic"),
 ) -> None:
     # fmt: on
     register_model_overrides()
@@ -85,6 +87,8 @@ def main(
     configs.append({"agent": {"output_path": output}})
     config = recursive_merge(*configs)
 
+    live_path = _get_live_trajectory_path(output)
+    resume_state = load_resume_state(output, live_path) if resume else None
     env = get_sb_environment(config, instance)
     agent_config = dict(config.get("agent", {}))
     agent_class_spec = agent_config.pop("agent_class", None)
@@ -94,8 +98,16 @@ def main(
         env,
         **agent_config,
     )
-    agent.set_live_trajectory_path(_get_live_trajectory_path(output))
-    agent.run(instance["problem_statement"])
+    if resume_state is not None:
+        logger.info(f"Resuming from {resume_state.source} after {resume_state.n_calls} steps")
+        agent.restore_trajectory(resume_state)
+    elif resume:
+        logger.info(f"Nothing to resume at {output}, starting a new run")
+    agent.set_live_trajectory_path(live_path)
+    try:
+        agent.run(instance["problem_statement"])
+    finally:
+        agent.close_live_trajectory()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,45 @@
+"""Compact partial trajectory logs (``*.traj.json.partial.jsonl``) into ``.traj.json`` files."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import typer
+
+from ralphsweagent._bootstrap import ensure_vendor_minisweagent_on_path
+
+ensure_vendor_minisweagent_on_path()
+
+from ralphsweagent.agents.trajectory_log import PARTIAL_SUFFIX, compact_partial_trajectory
+
+from minisweagent.utils.log import logger
+
+app = typer.Typer(add_completion=False)
+
+
+def _find_partial_logs(paths: list[Path]) -> list[Path]:
+    found = []
+    for path in paths:
+        if path.is_dir():
+            found.extend(sorted(path.rglob(f"*{PARTIAL_SUFFIX}")))
+        else:
+            found.append(path)
+    return found
+
+
+# fmt: off
+@app.command()
+def main(
+    paths: list[Path] = typer.Argument(..., help="Partial trajectory logs, or directories to search for them"),
+    output: Path | None = typer.Option(None, "-o", "--output", help="Output trajectory file (only with a single log)"),
+) -> None:
+    # fmt: on
+    logs = _find_partial_logs(paths)
+    if output is not None and len(logs) != 1:
+        raise typer.BadParameter("--output requires exactly one partial trajectory log")
+    for log in logs:
+        logger.info(f"Compacted '{log}' into '{compact_partial_trajectory(log, output)}'")
+
+
+if __name__ == "__main__":
+    app()
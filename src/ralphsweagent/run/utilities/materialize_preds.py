@@ -0,0 +1,33 @@
+"""Fold ``preds.jsonl`` predictions logs into their ``preds.json`` files."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import typer
+
+from ralphsweagent._bootstrap import ensure_vendor_minisweagent_on_path
+
+ensure_vendor_minisweagent_on_path()
+
+from ralphsweagent.run.benchmarks.preds_log import materialize_predictions
+
+from minisweagent.utils.log import logger
+
+app = typer.Typer(add_completion=False)
+
+
+# fmt: off
+@app.command()
+def main(
+    paths: list[Path] = typer.Argument(..., help="Batch output directories, or their preds.json files"),
+) -> None:
+    # fmt: on
+    for path in paths:
+        preds_path = path / "preds.json" if path.is_dir() else path
+        predictions = materialize_predictions(preds_path)
+        logger.info(f"Materialized {len(predictions)} predictions into '{preds_path}'")
+
+
+if __name__ == "__main__":
+    app()
@@ -23,6 +23,16 @@ subcommands = [
         ["swebench-single"],
         "Evaluate on SWE-bench (single instance)",
     ),
+    (
+        "ralphsweagent.run.utilities.compact_trajectory",
+        ["compact-trajectory", "compact"],
+        "Compact partial trajectory logs into .traj.json files",
+    ),
+    (
+        "ralphsweagent.run.utilities.materialize_preds",
+        ["materialize-preds"],
+        "Fold preds.jsonl predictions logs into preds.json",
+    ),
 ]
 
 
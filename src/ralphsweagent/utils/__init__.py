@@ -0,0 +1 @@
+"""Small helpers shared across ralphsweagent packages."""
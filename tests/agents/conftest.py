@@ -0,0 +1,59 @@
+"""Shared fixtures for agent tests: a minimal agent config and a scripted model stub."""
+
+import copy
+from types import SimpleNamespace
+
+import pytest
+
+AGENT_CONFIG = {
+    "system_template": "You are a test assistant.",
+    "instance_template": "Task: {{task}}",
+    "step_limit": 5,
+    "cost_limit": 5.0,
+}
+
+
+class StubModel:
+    """Model for `DefaultAgent` tests: every query returns ``content`` with a copy of ``extra``.
+
+    ``seen`` records the messages of each query. Observations become one ``observation_role``
+    message per output. Keyword arguments other than these are set on ``config``.
+    """
+
+    def __init__(self, *, content: str = "", extra: dict | None = None, observation_role: str = "user", **config):
+        self.config = SimpleNamespace(model_name="gpt-4o", **config)
+        self.content = content
+        self.extra = {"actions": [], "cost": 0.0} if extra is None else extra
+        self.observation_role = observation_role
+        self.seen: list[list[dict]] = []
+
+    def query(self, messages, **kwargs):
+        self.seen.append(list(messages))
+        return self.reply(messages)
+
+    def reply(self, messages) -> dict:
+        return {"role": "assistant", "content": self.content, "extra": copy.deepcopy(self.extra)}
+
+    def format_message(self, **kwargs):
+        return kwargs
+
+    def format_observation_messages(self, message, outputs, template_vars=None):
+        return [{"role": self.observation_role, "content": output["output"]} for output in outputs]
+
+    def get_template_vars(self, **kwargs):
+        return {}
+
+    def serialize(self):
+        return {}
+
+
+@pytest.fixture
+def agent_config() -> dict:
+    """Keyword arguments for `DefaultAgent`; tests override ``step_limit`` where it matters."""
+    return dict(AGENT_CONFIG)
+
+
+@pytest.fixture
+def stub_model() -> type[StubModel]:
+    """The `StubModel` class, to build models with the responses a test needs."""
+    return StubModel
@@ -0,0 +1,163 @@
+"""Tests for context compaction of the agent history."""
+
+import pytest
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.environments.local import LocalEnvironment
+
+from ralphsweagent.agents.compaction import SummaryCompactor, TruncationCompactor, get_compactor, split_history
+from ralphsweagent.agents.enhancements import register_agent_enhancements
+
+register_agent_enhancements()
+
+
+def _history(turns: int, output: str = "x" * 5000) -> list[dict]:
+    messages = [{"role": "system", "content": "system"}, {"role": "user", "content": "task"}]
+    for index in range(turns):
+        messages.append(
+            {
+                "role": "assistant",
+                "content": f"step {index}",
+                "reasoning_content": "thinking " * 100,
+                "tool_calls": [{"id": f"call_{index}"}],
+            }
+        )
+        messages.append({"role": "tool", "tool_call_id": f"call_{index}", "content": output})
+    return messages
+
+
+def test_split_history_keeps_tool_results_with_their_assistant_message():
+    messages = _history(4)
+    start, end = split_history(messages, keep_recent=3)
+    assert start == 2
+    assert messages[end]["role"] == "assistant"
+    assert len(messages) - end == 4
+
+
+def test_truncation_elides_old_observations_without_editing_messages():
+    messages = _history(4)
+    original = [dict(msg) for msg in messages]
+    compacted, details = TruncationCompactor(keep_recent=2, observation_chars=1000).compact(messages, level=1)
+
+    assert messages == original
+    assert compacted[:2] == messages[:2]
+    assert compacted[-2:] == messages[-2:]
+    old_observation = compacted[3]
+    assert len(old_observation["content"]) < 1100
+    assert "characters elided by context compaction" in old_observation["content"]
+    assert old_observation["content"].startswith("x" * 500) and old_observation["content"].endswith("x" * 500)
+    assert old_observation["extra"]["compacted"] is True
+    assert "reasoning_content" not in compacted[2]
+    assert details["messages_compacted"] == 6
+
+
+def test_truncation_level_increases_aggressiveness_and_stops_when_nothing_changes():
+    messages = _history(4)
+    compactor = TruncationCompactor(keep_recent=2, observation_chars=2000)
+    level_one, _ = compactor.compact(messages, level=1)
+    level_two, details = compactor.compact(level_one, level=2)
+    assert len(level_two[3]["content"]) < len(level_one[3]["content"])
+    assert details["observation_chars"] == 1000
+    assert compactor.compact(level_two, level=2) is None
+
+
+def test_truncation_handles_responses_api_items():
+    messages = [
+        {"role": "system", "content": "system"},
+        {"role": "user", "content": "task"},
+        {"object": "response", "id": "resp_1", "output": [{"type": "reasoning"}, {"type": "function_call"}]},
+        {"type": "function_call_output", "call_id": "call_1", "output": "y" * 5000},
+        {"object": "response", "id": "resp_2", "output": [{"type": "message"}]},
+    ]
+    compacted, _ = TruncationCompactor(keep_recent=1, observation_chars=500).compact(messages, level=1)
+    assert compacted[2]["output"] == [{"type": "function_call"}]
+    assert len(compacted[3]["output"]) < 600
+    assert compacted[4] is messages[4]
+
+
+def test_summary_compactor_replaces_middle_with_summary(monkeypatch):
+    compactor = SummaryCompactor("cheap-model", keep_recent=2)
+    monkeypatch.setattr(compactor, "_summarize", lambda transcript: ("did things", 0.01))
+    messages = _history(4)
+    compacted, details = compactor.compact(messages, level=1)
+    assert compacted[:2] == messages[:2]
+    assert compacted[2]["role"] == "user" and "did things" in compacted[2]["content"]
+    assert compacted[3:] == messages[-2:]
+    assert details == {"messages_compacted": 6, "summary_model": "cheap-model", "cost": 0.01}
+
+
+def test_summary_compactor_falls_back_to_truncation(monkeypatch):
+    compactor = SummaryCompactor("cheap-model", keep_recent=2)
+
+    def fail(transcript):
+        raise RuntimeError("no such model")
+
+    monkeypatch.setattr(compactor, "_summarize", fail)
+    compacted, details = compactor.compact(_history(4), level=1)
+    assert "observation_chars" in details
+    assert len(compacted) == len(_history(4))
+
+
+def test_get_compactor_validates_strategy():
+    assert isinstance(get_compactor("truncate", keep_recent=2, observation_chars=100), TruncationCompactor)
+    with pytest.raises(ValueError, match="summary model"):
+        get_compactor("summarize", keep_recent=2, observation_chars=100)
+    with pytest.raises(ValueError, match="Unknown compaction strategy"):
+        get_compactor("drop-everything", keep_recent=2, observation_chars=100)
+
+
+def _model(stub_model):
+    usage = {"prompt_tokens": 100, "completion_tokens": 1, "total_tokens": 101}
+    model = stub_model(content="ok", extra={"actions": [], "cost": 0.0, "response": {"usage": usage}})
+    model._previous_response_id = "resp_old"
+    return model
+
+
+def _agent(model, agent_config, **attributes) -> DefaultAgent:
+    agent = DefaultAgent(model=model, env=LocalEnvironment(), **agent_config)
+    for name, value in {"compaction_thresholds": (30, 15), "compaction_keep_recent": 2, **attributes}.items():
+        setattr(agent, name, value)
+    agent.context_window_max = 128000
+    agent.messages = _history(4)
+    return agent
+
+
+def test_crossing_threshold_compacts_before_query_and_records_event(agent_config, stub_model):
+    model = _model(stub_model)
+    agent = _agent(model, agent_config)
+    agent.context_left_percent = 25
+    agent.query()
+
+    assert "characters elided" in model.seen[0][3]["content"]
+    assert model._previous_response_id is None
+    [event] = agent.compaction_events
+    assert event["level"] == 1
+    assert event["strategy"] == "truncate"
+    assert event["estimated_tokens_after"] < event["estimated_tokens_before"]
+    assert agent.serialize()["info"]["compaction"] == [event]
+
+
+def test_no_compaction_above_thresholds_or_when_disabled(agent_config, stub_model):
+    agent = _agent(_model(stub_model), agent_config)
+    agent.context_left_percent = 40
+    agent.query()
+    disabled = _agent(_model(stub_model), agent_config, compaction_thresholds=())
+    disabled.context_left_percent = 5
+    disabled.query()
+    assert agent.compaction_events == disabled.compaction_events == []
+    assert "compaction" not in agent.serialize()["info"]
+
+
+def test_context_budget_exceeded_compacts_instead_of_exiting(agent_config, stub_model):
+    agent = _agent(_model(stub_model), agent_config)
+    assert agent.handle_context_budget_exceeded(RuntimeError("over budget"))
+    assert agent.compaction_events[-1]["reason"] == "over budget"
+
+
+def test_run_exits_when_compaction_cannot_shrink_the_task(agent_config, stub_model):
+    model = _model(stub_model)
+    agent = DefaultAgent(model=model, env=LocalEnvironment(), **agent_config)
+    agent.compaction_thresholds = (30,)
+    agent.context_window_max = 50
+    result = agent.run("word " * 1000)
+    assert result["exit_status"] == "ContextWindowExceeded"
+    assert model.seen == []
@@ -1,9 +1,12 @@
 """Tests for context window tracking on DefaultAgent via agent enhancements."""
 
+import litellm
+import pytest
 from minisweagent.agents.default import DefaultAgent
 from minisweagent.environments.local import LocalEnvironment
 
 from ralphsweagent.agents.enhancements import register_agent_enhancements
+from ralphsweagent.models.context_window import ContextWindowBudgetExceeded, ProviderContextWindowExceeded
 
 # Apply enhancements before tests run.
 register_agent_enhancements()
@@ -73,3 +76,80 @@ def test_context_window_in_template_vars():
     assert "context_window_max" in vars_
     assert "context_window_prompt_tokens" in vars_
     assert "context_left_percent" in vars_
+
+
+class _CountingModel(_UsageModel):
+    """Mock model without usage data that records how often it was queried."""
+
+    def __init__(self, error: Exception | None = None):
+        super().__init__()
+        self.calls = 0
+        self.error = error
+
+    def query(self, messages, **kwargs):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return {"role": "assistant", "content": "ok", "extra": {"actions": [], "cost": 0.0, "timestamp": 0.0}}
+
+
+def test_query_exposes_estimated_prompt_tokens_without_usage():
+    agent = DefaultAgent(model=_CountingModel(), env=LocalEnvironment(), **_AGENT_CONFIG)
+    agent.add_messages({"role": "system", "content": "system"}, {"role": "user", "content": "word " * 1000})
+    message = agent.query()
+    estimate = agent.context_window_estimated_tokens
+    assert 900 < estimate < 1200
+    assert message["extra"]["estimated_prompt_tokens"] == estimate
+    assert agent.context_window_prompt_tokens == estimate
+    assert agent.get_template_vars()["context_window_estimated_tokens"] == estimate
+
+
+def test_preflight_check_raises_before_sending_oversized_prompt():
+    model = _CountingModel()
+    agent = DefaultAgent(model=model, env=LocalEnvironment(), **_AGENT_CONFIG)
+    agent.context_window_max = 500
+    agent.add_messages({"role": "system", "content": "system"}, {"role": "user", "content": "word " * 1000})
+    with pytest.raises(ContextWindowBudgetExceeded) as exc_info:
+        agent.query()
+    assert model.calls == 0
+    assert agent.n_calls == 0
+    assert exc_info.value.context_window_max == 500
+    assert exc_info.value.estimated_tokens > 500
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        litellm.exceptions.ContextWindowExceededError("too long", model="test-model", llm_provider="openai"),
+        ProviderContextWindowExceeded("HTTP 400: prompt is too long"),
+    ],
+)
+def test_provider_context_window_error_becomes_recoverable(error):
+    model = _CountingModel(error)
+    agent = DefaultAgent(model=model, env=LocalEnvironment(), **_AGENT_CONFIG)
+    agent.add_messages({"role": "system", "content": "system"}, {"role": "user", "content": "user"})
+    with pytest.raises(ContextWindowBudgetExceeded, match="Provider rejected the prompt") as exc_info:
+        agent.query()
+    assert exc_info.value.__cause__ is error
+
+
+def test_run_ends_cleanly_when_context_budget_is_exceeded():
+    agent = DefaultAgent(model=_CountingModel(), env=LocalEnvironment(), **_AGENT_CONFIG)
+    agent.context_window_max = 50
+    result = agent.run("word " * 1000)
+    assert result["exit_status"] == "ContextWindowExceeded"
+    assert agent.model.calls == 0
+
+
+def test_run_continues_after_handler_shortens_history():
+    class _TrimmingAgent(DefaultAgent):
+        def handle_context_budget_exceeded(self, exc):
+            self.messages = [self.messages[0], {"role": "user", "content": "short task"}]
+            return True
+
+    model = _CountingModel()
+    agent = _TrimmingAgent(model=model, env=LocalEnvironment(), **_AGENT_CONFIG)
+    agent.context_window_max = 200
+    result = agent.run("word " * 1000)
+    assert result["exit_status"] == "LimitsExceeded"
+    assert model.calls == _AGENT_CONFIG["step_limit"]
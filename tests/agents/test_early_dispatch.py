@@ -0,0 +1,160 @@
+"""Tests for early tool-call dispatch on DefaultAgent via agent enhancements."""
+
+import threading
+
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.exceptions import FormatError
+
+from ralphsweagent.agents.enhancements import register_agent_enhancements
+from ralphsweagent.models.litellm_model import StreamInterruptedAfterDispatch
+from tests.agents.conftest import StubModel
+
+register_agent_enhancements()
+
+
+class _RecordingEnvironment(LocalEnvironment):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.executed: list[str] = []
+        self.started = threading.Event()
+
+    def execute(self, action, *args, **kwargs):
+        self.executed.append(action["command"])
+        self.started.set()
+        return super().execute(action, *args, **kwargs)
+
+
+class _StreamingModel(StubModel):
+    """Stub model that hands each action to the listener before returning, like a streamed response."""
+
+    def __init__(self, turns, *, early_tool_dispatch=True):
+        super().__init__(observation_role="tool", use_streaming=True, early_tool_dispatch=early_tool_dispatch)
+        self.tool_call_listener = None
+        self.turns = list(turns)
+        self.env: _RecordingEnvironment | None = None
+        self.started_before_return: list[bool] = []
+
+    def reply(self, messages) -> dict:
+        actions = [{"command": command, "tool_call_id": f"call_{i}"} for i, command in enumerate(self.turns.pop(0))]
+        if self.tool_call_listener is not None:
+            self.env.started.clear()
+            for action in actions:
+                self.tool_call_listener(dict(action))
+            self.started_before_return.append(self.env.started.wait(5))
+        return {
+            "role": "assistant",
+            "content": "",
+            "extra": {"actions": actions, "cost": 0.0, "timestamp": 0.0},
+        }
+
+
+class _FailingStreamModel(_StreamingModel):
+    """Dispatches the first turn's actions, then raises ``error`` instead of returning a message."""
+
+    def __init__(self, turns, error):
+        super().__init__(turns)
+        self.error = error
+
+    def query(self, messages, **kwargs):
+        if self.error is None:
+            return super().query(messages, **kwargs)
+        error, self.error = self.error, None
+        for i, command in enumerate(self.turns.pop(0)):
+            self.tool_call_listener({"command": command, "tool_call_id": f"call_{i}"})
+        raise error
+
+
+def _run_failing_agent(error, agent_config):
+    model = _FailingStreamModel([["echo one"], ["echo COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT"]], error)
+    env = _RecordingEnvironment()
+    model.env = env
+    agent = DefaultAgent(model=model, env=env, **agent_config)
+    result = agent.run("task")
+    return agent, env, result
+
+
+def _make_agent(turns, agent_config, **model_kwargs):
+    model = _StreamingModel(turns, **model_kwargs)
+    env = _RecordingEnvironment()
+    model.env = env
+    return DefaultAgent(model=model, env=env, **agent_config), model, env
+
+
+def test_dispatched_actions_start_during_query_and_keep_order(agent_config):
+    agent, model, env = _make_agent([["echo one", "echo two"]], agent_config)
+    agent.add_messages({"role": "system", "content": "system"}, {"role": "user", "content": "user"})
+    agent.step()
+
+    assert model.started_before_return == [True]
+    assert env.executed == ["echo one", "echo two"]
+    assert [m["role"] for m in agent.messages] == ["system", "user", "assistant", "tool", "tool"]
+    assert [m["content"] for m in agent.messages[3:]] == ["one\n", "two\n"]
+    assert agent.messages[2]["extra"]["early_dispatch"] == {"reused": 2, "unclaimed": []}
+    assert model.tool_call_listener is None
+
+
+def test_dispatch_through_cached_model(tmp_path, agent_config):
+    from ralphsweagent.models.cached_model import CachedModel
+    from ralphsweagent.models.utils.response_cache import close_response_caches
+
+    inner = _StreamingModel([["echo one"]])
+    env = _RecordingEnvironment()
+    inner.env = env
+    model = CachedModel(model=inner, cache_path=str(tmp_path / "cache.sqlite"))
+    agent = DefaultAgent(model=model, env=env, **agent_config)
+    agent.add_messages({"role": "system", "content": "system"}, {"role": "user", "content": "user"})
+    try:
+        agent.step()
+    finally:
+        close_response_caches()
+
+    assert inner.started_before_return == [True]
+    assert env.executed == ["echo one"]
+    assert agent.messages[2]["extra"]["early_dispatch"] == {"reused": 1, "unclaimed": []}
+    assert inner.tool_call_listener is None
+
+
+def test_submission_stops_later_dispatched_actions(agent_config):
+    agent, _, env = _make_agent([["echo COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT", "echo never"]], agent_config)
+    result = agent.run("task")
+
+    assert result["exit_status"] == "Submitted"
+    assert env.executed == ["echo COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT"]
+    assert [m["role"] for m in agent.messages] == ["system", "user", "assistant", "exit"]
+
+
+def test_disabled_by_default(agent_config):
+    agent, model, env = _make_agent([["echo one"]], agent_config, early_tool_dispatch=False)
+    agent.add_messages({"role": "system", "content": "system"}, {"role": "user", "content": "user"})
+    agent.step()
+
+    assert model.started_before_return == []
+    assert env.executed == ["echo one"]
+    assert "early_dispatch" not in agent.messages[2]["extra"]
+
+
+def test_format_error_after_dispatch_records_the_executed_actions(agent_config):
+    error = FormatError(
+        {"role": "assistant", "content": "", "extra": {"parse_error": True, "cost": 0.0}},
+        {"role": "user", "content": "Unknown tool 'python'.", "extra": {"interrupt_type": "FormatError"}},
+    )
+    agent, env, result = _run_failing_agent(error, agent_config)
+
+    assert result["exit_status"] == "Submitted"
+    assert env.executed == ["echo one", "echo COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT"]
+    notice = agent.messages[3]
+    assert notice["content"].startswith("Unknown tool 'python'.")
+    assert "<command>echo one</command>" in notice["content"] and "one\n" in notice["content"]
+    assert notice["extra"]["early_dispatch"]["executed"][0]["output"]["output"] == "one\n"
+
+
+def test_stream_failure_after_dispatch_records_the_executed_actions(agent_config):
+    agent, env, result = _run_failing_agent(StreamInterruptedAfterDispatch("connection reset"), agent_config)
+
+    assert result["exit_status"] == "Submitted"
+    assert env.executed == ["echo one", "echo COMPLETE_TASK_AND_SUBMIT_FINAL_OUTPUT"]
+    assert [m["role"] for m in agent.messages] == ["system", "user", "user", "assistant", "exit"]
+    notice = agent.messages[2]
+    assert notice["extra"]["interrupt_type"] == "InterruptedAfterDispatch"
+    assert "connection reset" in notice["content"] and "<command>echo one</command>" in notice["content"]
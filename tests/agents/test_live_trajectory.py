@@ -0,0 +1,68 @@
+import json
+import time
+
+from ralphsweagent.agents import live_trajectory
+from ralphsweagent.agents.live_trajectory import LiveTrajectorySink, close_live_trajectory_sinks
+
+
+def _lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_writes_are_tailable_within_flush_interval(tmp_path):
+    path = tmp_path / "nested" / "run.traj.jsonl"
+    sink = LiveTrajectorySink(path, flush_interval=0.05)
+    sink.write([{"role": "system", "content": "s"}, {"role": "user", "content": "u"}])
+    sink.write([{"role": "assistant", "content": "a"}])
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline and (not path.exists() or len(path.read_text().splitlines()) < 3):
+        time.sleep(0.01)
+    assert [m["role"] for m in _lines(path)] == ["system", "user", "assistant"]
+    sink.close()
+
+
+def test_messages_are_snapshotted_when_written(tmp_path):
+    path = tmp_path / "run.traj.jsonl"
+    sink = LiveTrajectorySink(path, flush_interval=10)
+    message = {"role": "assistant", "content": "before"}
+    sink.write([message])
+    message["content"] = "after"
+    assert sink.flush(timeout=5)
+    assert _lines(path) == [{"role": "assistant", "content": "before"}]
+    sink.close()
+
+
+def test_bounded_queue_keeps_order_and_close_flushes(tmp_path):
+    path = tmp_path / "run.traj.jsonl"
+    sink = LiveTrajectorySink(path, flush_interval=10, max_queue=1)
+    for i in range(50):
+        sink.write([{"role": "user", "content": str(i)}])
+    sink.close()
+    sink.close()
+    sink.write([{"role": "user", "content": "ignored"}])
+    assert [m["content"] for m in _lines(path)] == [str(i) for i in range(50)]
+    assert sink._handle is None
+
+
+def test_fsync_policy(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(live_trajectory.os, "fsync", synced.append)
+    on_flush = LiveTrajectorySink(tmp_path / "flush.jsonl", fsync="flush")
+    on_flush.write([{"role": "user", "content": "x"}])
+    on_flush.flush(timeout=5)
+    assert len(synced) == 1
+    on_close = LiveTrajectorySink(tmp_path / "close.jsonl", fsync="close")
+    on_close.write([{"role": "user", "content": "x"}])
+    on_close.flush(timeout=5)
+    assert len(synced) == 1
+    on_close.write([{"role": "user", "content": "y"}])
+    close_live_trajectory_sinks()
+    assert len(synced) == 2
+
+
+def test_unwritable_path_only_warns(tmp_path, caplog):
+    sink = LiveTrajectorySink(tmp_path, flush_interval=0)
+    sink.write([{"role": "user", "content": "x"}])
+    assert sink.flush(timeout=5)
+    sink.close()
+    assert "Failed to write live trajectory" in caplog.text
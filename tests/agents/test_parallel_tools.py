@@ -0,0 +1,110 @@
+"""Tests for concurrent execution of read-only tool calls."""
+
+import threading
+
+import pytest
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.environments.local import LocalEnvironment
+from minisweagent.exceptions import Submitted
+
+from ralphsweagent.agents.enhancements import register_agent_enhancements
+from ralphsweagent.agents.parallel_tools import execute_actions_concurrently, is_read_only_command
+
+register_agent_enhancements()
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        "cat src/app.py",
+        "grep -rn 'def main' src | head -20",
+        "ls -la",
+        "find . -name '*.py' 2>/dev/null",
+        "git diff HEAD~1",
+        "git --no-pager show HEAD:README.md",
+        "sort -u names.txt | uniq -c",
+        "uniq -c names.txt",
+        "rg -n pattern src",
+        "git grep -n pattern",
+    ],
+)
+def test_read_only_commands(command):
+    assert is_read_only_command(command)
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        "",
+        "cat a > b",
+        "sed -i s/a/b/ file.py",
+        "python -c 'print(1)'",
+        "ls; rm -rf build",
+        "grep x file && touch y",
+        "find . -name '*.pyc' -delete",
+        "find . -exec rm {} +",
+        "git checkout main",
+        "git diff --output=patch.diff",
+        "cat $(ls)",
+        "sort -o out.txt in.txt",
+        "echo 'unterminated",
+        "uniq in.txt out.txt",
+        "tree -o listing.txt",
+        "rg --pre ./script.sh pattern",
+        "rg --pre=./script.sh pattern",
+        "git grep -O pattern",
+        "git grep -nOvim pattern",
+        "git grep --open-files-in-pager=vim pattern",
+    ],
+)
+def test_commands_that_may_write(command):
+    assert not is_read_only_command(command)
+
+
+class _BarrierEnvironment:
+    """Records the order of execution; read-only commands wait for each other on a barrier."""
+
+    def __init__(self, parties: int):
+        self.barrier = threading.Barrier(parties, timeout=5)
+        self.events: list[str] = []
+        self.lock = threading.Lock()
+
+    def execute(self, action):
+        command = action["command"]
+        if command.startswith("cat"):
+            self.barrier.wait()
+        with self.lock:
+            self.events.append(command)
+        if command == "cat submit":
+            raise Submitted({"role": "exit", "content": "", "extra": {"exit_status": "Submitted"}})
+        return {"output": command, "returncode": 0}
+
+
+def test_read_only_actions_run_concurrently_and_keep_order():
+    env = _BarrierEnvironment(parties=3)
+    actions = [{"command": c} for c in ["cat a", "cat b", "cat c", "touch d", "ls"]]
+    outputs = execute_actions_concurrently(env, actions, max_workers=4)
+
+    assert [output["output"] for output in outputs] == ["cat a", "cat b", "cat c", "touch d", "ls"]
+    assert sorted(env.events[:3]) == ["cat a", "cat b", "cat c"]
+    assert env.events[3:] == ["touch d", "ls"]
+
+
+def test_exception_stops_later_actions():
+    env = _BarrierEnvironment(parties=2)
+    actions = [{"command": c} for c in ["cat submit", "cat b", "touch never"]]
+    with pytest.raises(Submitted):
+        execute_actions_concurrently(env, actions)
+    assert "touch never" not in env.events
+
+
+def test_agent_runs_tool_calls_concurrently_when_enabled(tmp_path, agent_config, stub_model):
+    for name in ("a", "b"):
+        (tmp_path / name).write_text(f"{name}\n")
+    actions = [{"command": command, "tool_call_id": f"call_{i}"} for i, command in enumerate(["cat a", "cat b", "pwd"])]
+    model = stub_model(extra={"actions": actions, "cost": 0.0}, observation_role="tool")
+    agent = DefaultAgent(model=model, env=LocalEnvironment(cwd=str(tmp_path)), **agent_config)
+    agent.parallel_tool_calls = True
+    agent.add_messages({"role": "system", "content": "system"}, {"role": "user", "content": "user"})
+    agent.step()
+    assert [m["content"] for m in agent.messages[3:]] == ["a\n", "b\n", f"{tmp_path}\n"]
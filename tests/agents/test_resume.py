@@ -0,0 +1,75 @@
+import json
+
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.environments.local import LocalEnvironment
+
+from ralphsweagent.agents.enhancements import register_agent_enhancements
+from ralphsweagent.agents.resume import load_resume_state
+from ralphsweagent.agents.trajectory_log import TrajectoryLog
+
+register_agent_enhancements()
+
+
+def _step(command: str, cost: float = 0.5) -> list[dict]:
+    return [
+        {"role": "assistant", "content": "", "extra": {"actions": [{"command": command}], "cost": cost}},
+        {"role": "user", "content": "observation"},
+    ]
+
+
+_START = [{"role": "system", "content": "system"}, {"role": "user", "content": "task"}]
+
+
+def test_resume_from_partial_log_uses_saved_stats(tmp_path):
+    output = tmp_path / "run.traj.json"
+    log = TrajectoryLog(output)
+    log.save({"info": {"model_stats": {"instance_cost": 2.5, "api_calls": 3}}, "messages": _START + _step("ls")})
+    log.close()
+    (tmp_path / "run.traj.jsonl").write_text(json.dumps(_START[0]) + "\n")
+
+    state = load_resume_state(output, tmp_path / "run.traj.jsonl")
+
+    assert state.source == log.path
+    assert (state.n_calls, state.cost) == (3, 2.5)
+    assert state.actions == [{"command": "ls"}]
+
+
+def test_resume_from_live_jsonl_recounts_stats_and_drops_unfinished_step(tmp_path):
+    live = tmp_path / "run.traj.jsonl"
+    messages = _START + _step("ls") + _step("pwd")[:1]
+    live.write_text("".join(json.dumps(msg) + "\n" for msg in messages) + '{"role": "us')
+
+    state = load_resume_state(tmp_path / "run.traj.json", live)
+
+    assert state.messages == _START + _step("ls")
+    assert (state.n_calls, state.cost) == (2, 1.0)
+
+
+def test_finished_or_missing_runs_are_not_resumed(tmp_path):
+    output = tmp_path / "run.traj.json"
+    assert load_resume_state(output, tmp_path / "run.traj.jsonl") is None
+    output.write_text(json.dumps({"messages": [*_START, {"role": "exit", "content": "", "extra": {}}]}))
+    assert load_resume_state(output) is None
+
+
+def test_agent_replays_actions_and_continues(tmp_path, agent_config, stub_model):
+    live = tmp_path / "run.traj.jsonl"
+    messages = _START + _step("echo restored > marker")
+    live.write_text("".join(json.dumps(msg) + "\n" for msg in messages))
+    state = load_resume_state(tmp_path / "run.traj.json", live)
+
+    model = stub_model(extra={"actions": [{"command": "cat marker"}], "cost": 0.5})
+    agent_config["step_limit"] = 4
+    agent = DefaultAgent(model=model, env=LocalEnvironment(cwd=str(tmp_path)), **agent_config)
+    agent.restore_trajectory(state)
+    agent.set_live_trajectory_path(live)
+    result = agent.run("task")
+    agent.close_live_trajectory()
+
+    assert result["exit_status"] == "LimitsExceeded"
+    assert model.seen[0] == messages
+    assert agent.messages[len(messages) + 1]["content"] == "restored\n"
+    assert len(model.seen) == agent_config["step_limit"] - 1
+    assert agent.cost == 0.5 * agent_config["step_limit"]
+    live_messages = [json.loads(line) for line in live.read_text().splitlines()]
+    assert [(m["role"], m["content"]) for m in live_messages] == [(m["role"], m["content"]) for m in agent.messages]
@@ -0,0 +1,67 @@
+import json
+
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.environments.local import LocalEnvironment
+
+from ralphsweagent.agents.enhancements import register_agent_enhancements
+from ralphsweagent.agents.timings import collect_step_timings, summarize_timings
+from ralphsweagent.agents.trajectory_log import get_partial_trajectory_path, read_partial_trajectory
+
+register_agent_enhancements()
+
+
+def test_summary_reports_percentiles_per_phase():
+    steps = [{"model": float(seconds), "environment": 1.0} for seconds in range(1, 21)]
+    steps.append({"model": 100.0, "time_to_first_token": 0.5, "note": "ignored"})
+    summary = summarize_timings(steps)
+
+    assert list(summary) == ["environment", "model", "time_to_first_token"]
+    assert summary["model"] == {"count": 21, "total": 310.0, "p50": 11.0, "p95": 20.0, "max": 100.0}
+    assert summary["environment"]["p95"] == 1.0
+    assert summary["time_to_first_token"]["count"] == 1
+
+
+def _model(stub_model):
+    extra = {"actions": [{"command": "echo hi"}], "cost": 0.0, "timings": {"time_to_first_token": 0.25}}
+    return stub_model(extra=extra)
+
+
+def test_each_step_records_phase_durations(tmp_path, agent_config, stub_model):
+    agent_config["step_limit"] = 2
+    agent = DefaultAgent(
+        model=_model(stub_model), env=LocalEnvironment(), output_path=tmp_path / "run.traj.json", **agent_config
+    )
+    agent.run("task")
+
+    steps = collect_step_timings(agent.messages)
+    assert len(steps) == agent_config["step_limit"]
+    for timings in steps:
+        assert set(timings) == {
+            "context_check",
+            "model",
+            "time_to_first_token",
+            "environment",
+            "observation_render",
+            "save",
+        }
+        assert all(seconds >= 0 for seconds in timings.values())
+        assert timings["time_to_first_token"] == 0.25
+
+
+def test_live_jsonl_and_partial_log_get_the_complete_timings(tmp_path, monkeypatch, agent_config, stub_model):
+    output = tmp_path / "run.traj.json"
+    agent_config["step_limit"] = 2
+    agent = DefaultAgent(model=_model(stub_model), env=LocalEnvironment(), output_path=output, **agent_config)
+    agent.set_live_trajectory_path(tmp_path / "run.traj.jsonl")
+    # Keep the partial log, which is otherwise compacted into run.traj.json at exit.
+    monkeypatch.setattr(agent, "_finalize_trajectory", lambda path: None)
+    agent.run("task")
+    agent.close_live_trajectory()
+
+    expected = collect_step_timings(agent.messages)
+    assert all("save" in timings for timings in expected)
+    partial = read_partial_trajectory(get_partial_trajectory_path(output))
+    assert collect_step_timings(partial["messages"]) == expected
+    live = [json.loads(line) for line in (tmp_path / "run.traj.jsonl").read_text().splitlines()]
+    assert [message["role"] for message in live] == [message["role"] for message in agent.messages]
+    assert collect_step_timings(live) == expected
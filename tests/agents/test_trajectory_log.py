@@ -0,0 +1,105 @@
+import json
+
+from minisweagent.agents.default import DefaultAgent
+from minisweagent.environments.local import LocalEnvironment
+from typer.testing import CliRunner
+
+from ralphsweagent.agents.enhancements import register_agent_enhancements
+from ralphsweagent.agents.trajectory_log import (
+    TrajectoryLog,
+    compact_partial_trajectory,
+    get_partial_trajectory_path,
+    read_partial_trajectory,
+)
+from ralphsweagent.run.utilities.compact_trajectory import app as compact_app
+
+register_agent_enhancements()
+
+
+def _records(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_log_appends_only_changes(tmp_path):
+    log = TrajectoryLog(tmp_path / "run.traj.json")
+    messages = [{"role": "system", "content": "s"}, {"role": "user", "content": "u"}]
+    log.save({"info": {"calls": 0, "config": {"a": 1}}, "messages": messages})
+    messages.append({"role": "assistant", "content": "a"})
+    log.save({"info": {"calls": 1, "config": {"a": 1}}, "messages": messages})
+    log.save({"info": {"calls": 1, "config": {"a": 1}}, "messages": messages})
+    messages[1] = {"role": "user", "content": "summary"}
+    log.save({"info": {"calls": 1}, "messages": messages})
+    log.close()
+
+    records = _records(log.path)
+    assert records[2:] == [
+        {"start": 2, "messages": [{"role": "assistant", "content": "a"}]},
+        {"meta": {"info": {"calls": 1}}},
+        {"start": 1, "messages": [{"role": "user", "content": "summary"}, {"role": "assistant", "content": "a"}]},
+        {"meta": {"info": {"calls": 1}, "messages": None}, "replace": True},
+    ]
+    assert read_partial_trajectory(log.path) == {"info": {"calls": 1}, "messages": messages}
+
+
+def test_truncated_last_record_is_ignored(tmp_path):
+    log = TrajectoryLog(tmp_path / "run.traj.json")
+    log.save({"info": {}, "messages": [{"role": "user", "content": "u"}]})
+    log.close()
+    with log.path.open("a") as handle:
+        handle.write('{"start": 1, "messages": [{"ro')
+    assert read_partial_trajectory(log.path)["messages"] == [{"role": "user", "content": "u"}]
+
+
+def test_run_saves_steps_incrementally_and_compacts_at_exit(tmp_path, monkeypatch, agent_config, stub_model):
+    output = tmp_path / "run.traj.json"
+    model = stub_model(content="ok", extra={"actions": [], "cost": 0.1, "timestamp": 0.0})
+    agent_config["step_limit"] = 3
+    agent = DefaultAgent(model=model, env=LocalEnvironment(), output_path=output, **agent_config)
+    full_saves = []
+    original_save = agent.save
+    monkeypatch.setattr(agent, "save", lambda path, *extra: full_saves.append(path) or original_save(path, *extra))
+
+    result = agent.run("do it")
+
+    assert result["exit_status"] == "LimitsExceeded"
+    assert full_saves == [output]
+    assert not get_partial_trajectory_path(output).exists()
+    data = json.loads(output.read_text())
+    assert data == json.loads(json.dumps(agent.serialize()))
+    assert list(data) == list(agent.serialize())
+
+
+def test_incremental_trajectory_can_be_disabled(tmp_path, monkeypatch, agent_config, stub_model):
+    monkeypatch.setattr(DefaultAgent, "incremental_trajectory", False)
+    output = tmp_path / "run.traj.json"
+    model = stub_model(content="ok", extra={"actions": [], "cost": 0.1, "timestamp": 0.0})
+    agent_config["step_limit"] = 3
+    agent = DefaultAgent(model=model, env=LocalEnvironment(), output_path=output, **agent_config)
+    full_saves = []
+    original_save = agent.save
+    monkeypatch.setattr(agent, "save", lambda path, *extra: full_saves.append(path) or original_save(path, *extra))
+    agent.run("do it")
+    assert len(full_saves) == 4
+
+
+def test_compact_command_rebuilds_trajectories(tmp_path):
+    for name in ("a", "b"):
+        log = TrajectoryLog(tmp_path / name / f"{name}.traj.json")
+        log.save({"info": {"exit_status": ""}, "messages": [{"role": "user", "content": name}]})
+        log.close()
+
+    result = CliRunner().invoke(compact_app, [str(tmp_path)])
+
+    assert result.exit_code == 0, result.output
+    for name in ("a", "b"):
+        data = json.loads((tmp_path / name / f"{name}.traj.json").read_text())
+        assert data["messages"] == [{"role": "user", "content": name}]
+        assert not get_partial_trajectory_path(tmp_path / name / f"{name}.traj.json").exists()
+
+
+def test_compact_to_explicit_output(tmp_path):
+    log = TrajectoryLog(tmp_path / "run.traj.json")
+    log.save({"messages": [{"role": "user", "content": "u"}]})
+    log.close()
+    assert compact_partial_trajectory(log.path, tmp_path / "out.json") == tmp_path / "out.json"
+    assert json.loads((tmp_path / "out.json").read_text())["messages"] == [{"role": "user", "content": "u"}]
@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from minisweagent.environments.local import LocalEnvironment
+
+from ralphsweagent.environments.deferred import DeferredEnvironment
+
+
+def test_template_vars_are_available_before_startup_finishes(tmp_path):
+    release = threading.Event()
+
+    def factory():
+        release.wait(5)
+        return LocalEnvironment(cwd=str(tmp_path))
+
+    env = DeferredEnvironment(factory, template_vars={"cwd": "/testbed", "system": "Linux"})
+    assert not env.ready
+    assert env.get_template_vars(extra=1) == {"cwd": "/testbed", "system": "Linux", "extra": 1}
+
+    release.set()
+    assert env.execute({"command": "echo hi"})["output"] == "hi\n"
+    assert env.ready
+    assert env.get_template_vars()["cwd"] == str(tmp_path)
+    assert env.serialize()["info"]["config"]["environment"]["cwd"] == str(tmp_path)
+    assert env.config.cwd == str(tmp_path)
+    assert env.startup_seconds is not None and env.wait_seconds > 0
+
+
+def test_startup_error_is_raised_when_the_environment_is_used():
+    def factory():
+        raise RuntimeError("image not found")
+
+    env = DeferredEnvironment(factory, template_vars={"cwd": "/testbed"})
+    with pytest.raises(RuntimeError, match="image not found"):
+        env.execute({"command": "ls"})
+    assert env.get_template_vars() == {"cwd": "/testbed"}
+    assert env.serialize() == {}
+
+
+def test_template_vars_wait_for_startup_without_early_vars(tmp_path):
+    release = threading.Event()
+
+    def factory():
+        release.wait(5)
+        return LocalEnvironment(cwd=str(tmp_path))
+
+    env = DeferredEnvironment(factory)
+    threading.Timer(0.1, release.set).start()
+    assert env.get_template_vars()["cwd"] == str(tmp_path)
+    assert env.wait_seconds > 0
+
+
+class _RecordingEnvironment:
+    def __init__(self):
+        self.cleaned_up = threading.Event()
+
+    def cleanup(self):
+        self.cleaned_up.set()
+
+
+def test_cleanup_waits_for_startup_and_tears_down_the_environment():
+    release = threading.Event()
+    started = _RecordingEnvironment()
+
+    def factory():
+        release.wait(5)
+        return started
+
+    env = DeferredEnvironment(factory)
+    assert not env._thread.daemon
+    threading.Timer(0.1, release.set).start()
+    env.cleanup(timeout=5)
+    assert started.cleaned_up.is_set()
+
+
+def test_cleanup_after_timeout_tears_down_once_startup_finishes():
+    release = threading.Event()
+    started = _RecordingEnvironment()
+
+    def factory():
+        release.wait(5)
+        return started
+
+    env = DeferredEnvironment(factory)
+    env.cleanup(timeout=0.01)
+    assert not started.cleaned_up.is_set()
+    release.set()
+    assert started.cleaned_up.wait(5)
@@ -147,6 +147,60 @@ class TestFormatToolcallObservationMessages:
         assert result[0]["extra"]["exception_info"] == "Error occurred"
         assert result[0]["extra"]["detail"] == "more"
 
+    def test_long_output_is_elided_and_kept_raw(self):
+        actions = [{"command": "cat log", "tool_call_id": "call_1"}]
+        output = "HEAD" + "x" * 10000 + "TAIL"
+        result = format_toolcall_observation_messages(
+            actions=actions,
+            outputs=[{"output": output, "returncode": 0}],
+            observation_template="{{ output.output }}",
+            observation_max_tokens=100,
+        )
+        content = result[0]["content"]
+        assert content.startswith("HEAD") and content.endswith("TAIL")
+        assert "characters elided" in content
+        assert len(content) < 500
+        assert result[0]["extra"]["raw_output"] == output
+        assert result[0]["extra"]["observation_truncated"] == {"chars": len(output), "kept_chars": len(content)}
+
+    def test_budget_shrinks_with_context_left(self):
+        actions = [{"command": "cat log", "tool_call_id": "call_1"}]
+        outputs = [{"output": "x" * 10000, "returncode": 0}]
+        sizes = [
+            len(
+                format_toolcall_observation_messages(
+                    actions=actions,
+                    outputs=outputs,
+                    observation_template="{{ output.output }}",
+                    template_vars={"context_left_percent": left},
+                    observation_max_tokens=1000,
+                )[0]["content"]
+            )
+            for left in (100, 50, 0)
+        ]
+        assert sizes[0] > sizes[1] > sizes[2] > 0
+
+    def test_short_output_and_zero_budget_are_untouched(self):
+        actions = [{"command": "ls", "tool_call_id": "call_1"}]
+        for output, budget in (("short", 100), ("x" * 10000, 0)):
+            result = format_toolcall_observation_messages(
+                actions=actions,
+                outputs=[{"output": output, "returncode": 0}],
+                observation_template="{{ output.output }}",
+                observation_max_tokens=budget,
+            )
+            assert result[0]["content"] == output
+            assert "observation_truncated" not in result[0]["extra"]
+
+    def test_model_configs_default_to_no_budget(self):
+        from ralphsweagent.models.litellm_model import OBSERVATION_MAX_TOKENS, LitellmModelConfig
+        from ralphsweagent.models.openrouter_model import OpenRouterModelConfig
+        from ralphsweagent.models.requesty_model import RequestyModelConfig
+
+        assert OBSERVATION_MAX_TOKENS == 0
+        for config_class in (LitellmModelConfig, OpenRouterModelConfig, RequestyModelConfig):
+            assert config_class(model_name="test").observation_max_tokens == 0
+
 
 class TestBashTool:
     def test_bash_tool_structure(self):
@@ -4,6 +4,7 @@ from minisweagent.exceptions import FormatError
 from ralphsweagent.models.utils.actions_toolcall_response import (
     BASH_TOOL_RESPONSE_API,
     BASH_TOOL_RESPONSE_API_WITH_REASONING,
+    format_toolcall_observation_messages,
     parse_toolcall_actions_response,
 )
 
@@ -51,3 +52,18 @@ class TestBashToolResponseApi:
         required = BASH_TOOL_RESPONSE_API_WITH_REASONING["parameters"]["required"]
         assert "command" in required
         assert "reasoning" in required
+
+
+def test_long_function_call_output_is_elided_and_kept_raw():
+    output = "x" * 10000
+    [msg] = format_toolcall_observation_messages(
+        actions=[{"command": "cat log", "tool_call_id": "call_1"}],
+        outputs=[{"output": output, "returncode": 0}],
+        observation_template="{{ output.output }}",
+        template_vars={"context_left_percent": 50},
+        observation_max_tokens=200,
+    )
+    assert msg["type"] == "function_call_output"
+    assert "characters elided" in msg["output"]
+    assert len(msg["output"]) < 500
+    assert msg["extra"]["raw_output"] == output
@@ -0,0 +1,142 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from ralphsweagent.models.cached_model import CachedModel, ResponseCacheMiss
+from ralphsweagent.models.utils.response_cache import ResponseCache, close_response_caches
+
+
+class _CountingModel:
+    def __init__(self, **config):
+        defaults = {"model_name": "test-model", "model_kwargs": {}, "tool_choice": None, "require_reasoning": False}
+        self.config = SimpleNamespace(**(defaults | config))
+        self.calls = 0
+
+    def _tools(self) -> list[dict]:
+        return [{"name": "bash", "reasoning": self.config.require_reasoning}]
+
+    def _prepare_messages_for_api(self, messages):
+        return [{k: v for k, v in msg.items() if k != "extra"} for msg in messages]
+
+    def query(self, messages, **kwargs):
+        self.calls += 1
+        return {
+            "role": "assistant",
+            "content": f"reply {self.calls}",
+            "extra": {"actions": [{"command": "ls", "tool_call_id": "call_1"}], "cost": 0.5, "timestamp": 0.0},
+        }
+
+    async def aquery(self, messages, **kwargs):
+        return self.query(messages, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def _fresh_caches():
+    close_response_caches()
+    yield
+    close_response_caches()
+
+
+def _cached(tmp_path, inner=None, **kwargs):
+    return CachedModel(model=inner or _CountingModel(), cache_path=str(tmp_path / "cache.sqlite"), **kwargs)
+
+
+def test_read_through_serves_hits_without_cost(tmp_path):
+    model = _cached(tmp_path)
+    first = model.query([{"role": "user", "content": "hi"}])
+    second = model.query([{"role": "user", "content": "hi", "extra": {"ignored": True}}])
+
+    assert model.model.calls == 1
+    assert first["extra"]["cache"]["hit"] is False
+    assert first["extra"]["cost"] == 0.5
+    assert second["content"] == "reply 1"
+    assert second["extra"]["cache"] == {"hit": True, "key": first["extra"]["cache"]["key"], "cached_cost": 0.5}
+    assert second["extra"]["cost"] == 0.0
+    assert second["extra"]["actions"] == [{"command": "ls", "tool_call_id": "call_1"}]
+
+
+def test_key_covers_model_kwargs_and_tools(tmp_path):
+    messages = [{"role": "user", "content": "hi"}]
+    keys = {
+        _cached(tmp_path)._key(messages, {}),
+        _cached(tmp_path, _CountingModel(model_kwargs={"temperature": 0}))._key(messages, {}),
+        _cached(tmp_path, _CountingModel(require_reasoning=True))._key(messages, {}),
+        _cached(tmp_path)._key(messages, {"max_tokens": 10}),
+        _cached(tmp_path)._key([{"role": "user", "content": "hello"}], {}),
+    }
+    assert len(keys) == 5
+
+
+def test_replay_raises_on_miss_and_record_overwrites(tmp_path):
+    messages = [{"role": "user", "content": "hi"}]
+    with pytest.raises(ResponseCacheMiss):
+        _cached(tmp_path, cache_mode="replay").query(messages)
+
+    recorder = _cached(tmp_path, cache_mode="record")
+    recorder.query(messages)
+    recorder.query(messages)
+    assert recorder.model.calls == 2
+
+    replay = _cached(tmp_path, cache_mode="replay")
+    assert replay.query(messages)["content"] == "reply 2"
+    assert replay.model.calls == 0
+
+
+def test_messages_appended_by_query_are_replayed(tmp_path):
+    class _NudgingModel(_CountingModel):
+        def query(self, messages, **kwargs):
+            messages.append({"role": "user", "content": "nudge"})
+            return super().query(messages, **kwargs)
+
+    model = _cached(tmp_path, _NudgingModel())
+    model.query([{"role": "user", "content": "hi"}])
+    replayed = [{"role": "user", "content": "hi"}]
+    asyncio.run(model.aquery(replayed))
+
+    assert model.model.calls == 1
+    assert replayed[-1] == {"role": "user", "content": "nudge"}
+
+
+def test_agent_facing_attributes_reach_the_wrapped_model(tmp_path):
+    inner = _CountingModel()
+    inner._previous_response_id = "resp_1"
+    inner.tool_call_listener = None
+    model = _cached(tmp_path, inner)
+
+    def listener(action):
+        return None
+
+    model.tool_call_listener = listener
+    assert inner.tool_call_listener is listener
+    assert model._previous_response_id == "resp_1"
+    model._previous_response_id = None
+    assert inner._previous_response_id is None
+    assert model._tools() == inner._tools()
+    assert not hasattr(_cached(tmp_path), "_previous_response_id")
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(tmp_path / "lru.sqlite", max_bytes=250)
+    for key in ("a", "b", "c"):
+        cache.put(key, "x" * 100)
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+    cache.put("d", "x" * 100)
+    assert cache.get("c") is None
+    assert cache.get("b") is not None
+    assert cache.stats()["entries"] == 2
+    cache.close()
+
+
+def test_builds_wrapped_model_from_config(tmp_path):
+    from ralphsweagent.models import register_model_overrides
+    from ralphsweagent.models.litellm_model import LitellmModel
+
+    register_model_overrides()
+    model = CachedModel(
+        model_name="gpt-4", wrapped_model={"model_class": "litellm"}, cache_path=str(tmp_path / "cache.sqlite")
+    )
+    assert isinstance(model.model, LitellmModel)
+    assert model.model.config.model_name == "gpt-4"
+    assert model.serialize()["info"]["config"]["model_cache"]["cache_mode"] == "read_through"
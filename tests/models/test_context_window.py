@@ -1,11 +1,21 @@
+import os
+import threading
 from pathlib import Path
 
+import yaml
+
+from ralphsweagent.models import context_window
 from ralphsweagent.models.context_window import (
+    ContextWindowIndex,
+    ContextWindowRegistry,
+    compile_context_window_map,
     ensure_live_context_window_map,
+    get_context_window_registry,
     get_seed_context_window_path,
     load_context_window_map,
     lookup_context_window,
     normalize_model_name,
+    update_context_window_map,
 )
 
 
@@ -31,6 +41,72 @@ def test_lookup_context_window_exact_and_prefix_matches():
     assert lookup_context_window("unknown-model", context_map) is None
 
 
+def _linear_lookup(model_name, context_map):
+    normalized_name = normalize_model_name(model_name)
+    normalized_map = {normalize_model_name(key): int(value) for key, value in context_map.items()}
+    matches = [key for key in normalized_map if key and normalized_name.startswith(key)]
+    return normalized_map[max(matches, key=len)] if matches else None
+
+
+def test_trie_index_matches_linear_scan():
+    context_map = {
+        "gpt-4": 8192,
+        "gpt-4o": 128000,
+        "openai/gpt-4o-mini-2024-07-18": 64000,
+        "GPT-4-Turbo": 128001,
+        "qwen2.5": 32768,
+        "qwen2.5-32b-instruct-awq": 131072,
+        "-preview": 1,
+    }
+    index = ContextWindowIndex(context_map)
+    names = [
+        "gpt-4",
+        "gpt-4o",
+        "gpt-4o-mini",
+        "gpt-4o-min",
+        "gpt-4-turbo-2024-04-09",
+        "gpt-3.5",
+        "qwen2.5-7b",
+        "Qwen/Qwen2.5-32B-Instruct",
+        "qwen2.5-32b-instruct-fp8",
+        "",
+        "g",
+        "anthropic/claude",
+    ]
+    for name in names:
+        assert index.lookup(name) == _linear_lookup(name, context_map), name
+
+
+def test_compiled_index_is_cached_by_version():
+    context_map = {"gpt-4o": 128000}
+    index = compile_context_window_map(context_map, "v1")
+    assert compile_context_window_map(context_map, "v1") is index
+    context_map["gpt-4o-mini"] = 64000
+    assert compile_context_window_map(context_map, "v2") is not index
+    assert lookup_context_window("gpt-4o-mini-2024-07-18", context_map, "v2") == 64000
+    assert compile_context_window_map(context_map) is not compile_context_window_map(context_map)
+
+
+def test_registry_version_changes_when_the_map_reloads(tmp_path: Path):
+    registry = ContextWindowRegistry(tmp_path)
+    context_map, version = registry.snapshot()
+    assert compile_context_window_map(context_map, version) is registry._index
+    assert registry.snapshot()[1] == version
+
+    registry.update("brand-new-model", 4096)
+    context_map, updated = registry.snapshot()
+    assert updated != version
+    assert lookup_context_window("brand-new-model-instruct", context_map, updated) == 4096
+
+    live_path = ensure_live_context_window_map(tmp_path)
+    live_path.write_text(yaml.safe_dump({"other-model": 8192}))
+    os.utime(live_path, ns=(0, 0))
+    context_map, reloaded = registry.snapshot()
+    assert reloaded not in (version, updated)
+    assert lookup_context_window("brand-new-model", context_map, reloaded) is None
+    assert ContextWindowRegistry(tmp_path).snapshot()[1] != reloaded
+
+
 def test_load_context_window_map_bootstraps_from_seed(tmp_path: Path):
     seed_path = get_seed_context_window_path()
     assert seed_path.exists()
@@ -41,3 +117,57 @@ def test_load_context_window_map_bootstraps_from_seed(tmp_path: Path):
     loaded = load_context_window_map(tmp_path)
     assert loaded
     assert all(isinstance(value, int) for value in loaded.values())
+
+
+def test_registry_matches_lookup_and_parses_once(tmp_path: Path, monkeypatch):
+    registry = get_context_window_registry(tmp_path)
+    assert get_context_window_registry(tmp_path) is registry
+    context_map, version = registry.snapshot()
+    parses = []
+    original_parse = context_window._parse_context_window_map
+    monkeypatch.setattr(
+        context_window, "_parse_context_window_map", lambda text: parses.append(1) or original_parse(text)
+    )
+
+    for name in ["openai/gpt-4o-2024-08-06", "gpt-4o-mini-latest", "claude-sonnet-4-5-20250929", "unknown-model"]:
+        for _ in range(3):
+            assert registry.lookup(name) == lookup_context_window(name, context_map, version)
+    assert parses == []
+
+
+def test_registry_reloads_when_file_changes(tmp_path: Path):
+    registry = ContextWindowRegistry(tmp_path)
+    assert registry.lookup("brand-new-model") is None
+    live_path = ensure_live_context_window_map(tmp_path)
+    live_path.write_text(yaml.safe_dump({"brand-new-model": 4096}))
+    os.utime(live_path, ns=(0, 0))
+    assert registry.lookup("brand-new-model-instruct") == 4096
+    assert registry.contains("brand-new-model")
+    assert not registry.contains("brand-new-model-instruct")
+
+
+def test_concurrent_updates_from_separate_registries_are_not_lost(tmp_path: Path):
+    registries = [ContextWindowRegistry(tmp_path) for _ in range(4)]
+
+    def worker(index: int) -> None:
+        for i in range(10):
+            registries[index % 4].update(f"model-{index}-{i}", 1000 + i)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    loaded = yaml.safe_load(ensure_live_context_window_map(tmp_path).read_text())
+    assert all(loaded[f"model-{index}-{i}"] == 1000 + i for index in range(8) for i in range(10))
+    assert ContextWindowRegistry(tmp_path).lookup("model-7-9") == 1009
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_update_context_window_map_normalizes_and_refreshes_registry(tmp_path: Path):
+    registry = get_context_window_registry(tmp_path)
+    assert registry.lookup("acme/widget-7b-2025-01-01") is None
+    update_context_window_map("acme/widget-7b-2025-01-01", 32768, tmp_path)
+    assert registry.lookup("acme/widget-7b-2025-01-01") == 32768
+    assert load_context_window_map(tmp_path)["widget-7b"] == 32768
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from ralphsweagent.models.context_window import ProviderContextWindowExceeded
+from ralphsweagent.models.openrouter_model import OpenRouterModel
+from ralphsweagent.models.openrouter_response_model import OpenRouterResponseModel
+from ralphsweagent.models.requesty_model import RequestyModel
+from ralphsweagent.models.utils.http_transport import (
+    close_http_transports,
+    get_async_http_transport,
+    get_http_transport,
+)
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    client_ports: list[int] = []
+    response_body: dict = {"ok": True}
+
+    def do_POST(self):
+        self.client_ports.append(self.client_address[1])
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps(self.response_body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    _EchoHandler.client_ports = []
+    _EchoHandler.response_body = {"ok": True}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _EchoHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def _fresh_transports():
+    close_http_transports()
+    yield
+    close_http_transports()
+
+
+def test_transport_shared_per_provider_and_origin():
+    first = get_http_transport("openrouter", "https://openrouter.ai/api/v1/chat/completions")
+    second = get_http_transport("openrouter", "https://openrouter.ai/api/v1/responses")
+    assert first is second
+    assert get_http_transport("requesty", "https://openrouter.ai/api/v1/chat/completions") is not first
+    assert get_http_transport("openrouter", "https://openrouter.ai/x", pool_maxsize=4) is not first
+
+
+def test_transport_creation_is_thread_safe():
+    results = []
+
+    def _get():
+        results.append(get_http_transport("openrouter", "https://openrouter.ai/api/v1/chat/completions"))
+
+    threads = [threading.Thread(target=_get) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(transport) for transport in results}) == 1
+
+
+def test_transport_reuses_connection(local_server):
+    transport = get_http_transport("test", local_server)
+    for _ in range(5):
+        response = transport.post(f"{local_server}/v1", headers={}, data="{}", timeout=5)
+        assert response.json() == {"ok": True}
+    assert len(set(_EchoHandler.client_ports)) == 1
+
+
+def test_transport_without_keep_alive_opens_new_connections(local_server):
+    transport = get_http_transport("test", local_server, keep_alive=False)
+    for _ in range(3):
+        transport.post(f"{local_server}/v1", headers={}, data="{}", timeout=5)
+    assert len(set(_EchoHandler.client_ports)) == 3
+
+
+@pytest.mark.parametrize("model_class", [OpenRouterModel, OpenRouterResponseModel, RequestyModel])
+def test_models_post_through_shared_transport(model_class):
+    model = model_class(model_name="test-model", http_pool_maxsize=8)
+    other = model_class(model_name="test-model", http_pool_maxsize=8)
+    assert model._transport is other._transport
+    assert model._transport.pool_maxsize == 8
+
+    response = MagicMock()
+    response.json.return_value = {"choices": []}
+    with patch.object(model._transport, "post", return_value=response) as mock_post:
+        assert model._query([{"role": "user", "content": "hi"}]) == {"choices": []}
+    mock_post.assert_called_once()
+    assert mock_post.call_args.args[0] == model._api_url
+
+
+@pytest.mark.parametrize("model_class", [OpenRouterModel, RequestyModel])
+def test_models_raise_context_window_errors_without_retrying(model_class):
+    model = model_class(model_name="test-model")
+    response = MagicMock(status_code=400, text="This model's maximum context length is 8192 tokens")
+    response.raise_for_status.side_effect = requests.exceptions.HTTPError(response=response)
+    with patch.object(model._transport, "post", return_value=response) as mock_post:
+        with pytest.raises(ProviderContextWindowExceeded, match="maximum context length"):
+            model.query([{"role": "user", "content": "hi"}])
+    mock_post.assert_called_once()
+
+
+def test_async_transport_is_per_event_loop(local_server):
+    async def _get():
+        first = get_async_http_transport("test", local_server)
+        assert get_async_http_transport("test", f"{local_server}/other") is first
+        response = await first.post(f"{local_server}/v1", headers={}, data="{}", timeout=5)
+        assert response.json() == {"ok": True}
+        await first.aclose()
+        return first
+
+    assert asyncio.run(_get()) is not asyncio.run(_get())
+
+
+@pytest.mark.parametrize("model_class", [OpenRouterModel, RequestyModel])
+def test_models_aquery_over_async_transport(model_class, local_server):
+    _EchoHandler.response_body = {
+        "choices": [
+            {
+                "message": {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": [
+                        {
+                            "id": "call_1",
+                            "type": "function",
+                            "function": {"name": "bash", "arguments": '{"command": "echo test"}'},
+                        }
+                    ],
+                }
+            }
+        ],
+        "usage": {"cost": 0.001},
+    }
+    model = model_class(model_name="test-model")
+    model._api_key = "test-key"
+    model._api_url = f"{local_server}/v1/chat/completions"
+
+    async def _run():
+        return await asyncio.gather(*(model.aquery([{"role": "user", "content": "hi"}]) for _ in range(8)))
+
+    results = asyncio.run(_run())
+    assert all(r["extra"]["actions"] == [{"command": "echo test", "tool_call_id": "call_1"}] for r in results)
+    assert all(r["extra"]["cost"] == 0.001 for r in results)
@@ -1,10 +1,11 @@
+import asyncio
 from types import SimpleNamespace
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
 from minisweagent.exceptions import FormatError
-from ralphsweagent.models.litellm_model import LitellmModel, LitellmModelConfig
+from ralphsweagent.models.litellm_model import LitellmModel, LitellmModelConfig, StreamInterruptedAfterDispatch
 from ralphsweagent.models.utils.actions_toolcall import BASH_TOOL, BASH_TOOL_WITH_REASONING
 
 
@@ -267,6 +268,87 @@ class TestLitellmModel:
         assert result["content"] == "Hello world</final>"
 
 
+class TestEarlyToolDispatch:
+    @staticmethod
+    def _tool_call_deltas(call_id, command):
+        arguments = f'{{"command": "{command}"}}'
+        return [
+            {"index": 0, "id": call_id, "type": "function", "function": {"name": "bash", "arguments": arguments[:5]}},
+            {"index": 0, "function": {"arguments": arguments[5:]}},
+        ]
+
+    @patch("ralphsweagent.models.litellm_model.litellm.completion")
+    @patch("ralphsweagent.models.litellm_model.litellm.cost_calculator.completion_cost")
+    def test_listener_receives_action_before_stream_ends(self, mock_cost, mock_completion):
+        events = []
+        first, second = self._tool_call_deltas("call_1", "ls")
+
+        def _stream():
+            yield _make_stream_chunk(tool_calls=[first])
+            yield _make_stream_chunk(tool_calls=[second])
+            events.append("stream continued")
+            yield _make_stream_chunk(
+                content="done", usage={"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
+            )
+
+        mock_completion.return_value = _stream()
+        mock_cost.return_value = 0.001
+        model = LitellmModel(model_name="gpt-4", use_streaming=True, early_tool_dispatch=True)
+        model.tool_call_listener = events.append
+        result = model.query([{"role": "user", "content": "test"}])
+
+        assert events == [{"command": "ls", "tool_call_id": "call_1"}, "stream continued"]
+        assert result["extra"]["actions"] == [{"command": "ls", "tool_call_id": "call_1"}]
+
+    @patch("ralphsweagent.models.litellm_model.litellm.completion")
+    @patch("ralphsweagent.models.litellm_model.litellm.cost_calculator.completion_cost")
+    def test_listener_skips_calls_parse_would_reject(self, mock_cost, mock_completion):
+        events = []
+        delta = {"index": 0, "id": "call_1", "function": {"name": "bash", "arguments": '{"command": "ls"}'}}
+        usage = {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
+        mock_completion.return_value = iter([_make_stream_chunk(tool_calls=[delta], usage=usage)])
+        mock_cost.return_value = 0.001
+        model = LitellmModel(model_name="gpt-4", use_streaming=True, early_tool_dispatch=True, require_reasoning=True)
+        model.tool_call_listener = events.append
+        with pytest.raises(FormatError):
+            model.query([{"role": "user", "content": "test"}])
+        assert events == []
+
+    @patch("ralphsweagent.models.litellm_model.litellm.token_counter", return_value=7)
+    @patch("ralphsweagent.models.litellm_model.litellm.completion")
+    @patch("ralphsweagent.models.litellm_model.litellm.cost_calculator.completion_cost")
+    def test_missing_usage_is_estimated_after_dispatch(self, mock_cost, mock_completion, _mock_counter):
+        events = []
+        mock_completion.return_value = iter([_make_stream_chunk(tool_calls=self._tool_call_deltas("call_1", "ls"))])
+        mock_cost.return_value = 0.001
+        model = LitellmModel(model_name="gpt-4", use_streaming=True, early_tool_dispatch=True)
+        model.tool_call_listener = events.append
+        result = model.query([{"role": "user", "content": "test"}])
+
+        assert mock_completion.call_count == 1
+        assert len(events) == 1
+        assert result["extra"]["response"]["usage"] == {"prompt_tokens": 7, "completion_tokens": 7, "total_tokens": 14}
+
+    @patch("ralphsweagent.models.litellm_model.litellm.completion")
+    def test_stream_failing_after_dispatch_is_not_retried(self, mock_completion):
+        events = []
+        first, second = self._tool_call_deltas("call_1", "rm -rf build")
+
+        def _stream():
+            yield _make_stream_chunk(tool_calls=[first])
+            yield _make_stream_chunk(tool_calls=[second])
+            raise ConnectionError("connection reset")
+
+        mock_completion.side_effect = lambda **kwargs: _stream()
+        model = LitellmModel(model_name="gpt-4", use_streaming=True, early_tool_dispatch=True)
+        model.tool_call_listener = events.append
+        with pytest.raises(StreamInterruptedAfterDispatch, match="connection reset"):
+            model.query([{"role": "user", "content": "test"}])
+
+        assert mock_completion.call_count == 1
+        assert events == [{"command": "rm -rf build", "tool_call_id": "call_1"}]
+
+
 class TestRetryMissingToolCalls:
     """Tests for the graceful tool-call recovery feature."""
 
@@ -368,3 +450,179 @@ class TestRetryMissingToolCalls:
 
         # Only one call (no retry)
         assert mock_completion.call_count == 1
+
+
+async def _astream(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+class TestAsyncQuery:
+    @staticmethod
+    def _tool_call(command="echo test", call_id="call_1"):
+        tc = MagicMock()
+        tc.function.name = "bash"
+        tc.function.arguments = f'{{"command": "{command}"}}'
+        tc.id = call_id
+        return tc
+
+    @patch("ralphsweagent.models.litellm_model.litellm.acompletion", new_callable=AsyncMock)
+    @patch("ralphsweagent.models.litellm_model.litellm.cost_calculator.completion_cost")
+    def test_aquery_matches_query(self, mock_cost, mock_acompletion):
+        mock_acompletion.return_value = _mock_litellm_response([self._tool_call("ls -la", "call_abc")])
+        mock_cost.return_value = 0.001
+
+        model = LitellmModel(model_name="gpt-4", tool_choice="required")
+        result = asyncio.run(model.aquery([{"role": "user", "content": "list files"}]))
+
+        assert mock_acompletion.call_args.kwargs["tools"] == [BASH_TOOL]
+        assert mock_acompletion.call_args.kwargs["tool_choice"] == "required"
+        assert result["extra"]["actions"] == [{"command": "ls -la", "tool_call_id": "call_abc"}]
+        assert result["extra"]["cost"] == 0.001
+
+    @patch("ralphsweagent.models.litellm_model.litellm.acompletion", new_callable=AsyncMock)
+    @patch("ralphsweagent.models.litellm_model.litellm.cost_calculator.completion_cost")
+    def test_aquery_streaming_reconstructs_content_and_usage(self, mock_cost, mock_acompletion):
+        tool_call_delta = {
+            "index": 0,
+            "id": "call_1",
+            "type": "function",
+            "function": {"name": "bash", "arguments": '{"command": "echo test"}'},
+        }
+        mock_acompletion.return_value = _astream(
+            [
+                _make_stream_chunk(content="Hello ", tool_calls=[tool_call_delta]),
+                _make_stream_chunk(
+                    content="world",
+                    usage={"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+                    finish_reason="stop",
+                ),
+            ]
+        )
+        mock_cost.return_value = 0.001
+
+        model = LitellmModel(model_name="gpt-4", use_streaming=True)
+        result = asyncio.run(model.aquery([{"role": "user", "content": "test"}]))
+
+        assert mock_acompletion.call_args.kwargs["stream"] is True
+        assert result["content"] == "Hello world"
+        assert result["extra"]["actions"] == [{"command": "echo test", "tool_call_id": "call_1"}]
+
+    @patch("ralphsweagent.models.litellm_model.litellm.acompletion", new_callable=AsyncMock)
+    @patch("ralphsweagent.models.litellm_model.litellm.cost_calculator.completion_cost")
+    def test_aquery_retries_missing_tool_calls(self, mock_cost, mock_acompletion):
+        no_tools_resp = _mock_litellm_response(None)
+        no_tools_resp.choices[0].message.model_dump.return_value = {"role": "assistant", "content": "Hmm"}
+        mock_acompletion.side_effect = [no_tools_resp, _mock_litellm_response([self._tool_call()])]
+        mock_cost.return_value = 0.001
+
+        model = LitellmModel(model_name="gpt-4", retry_missing_tool_calls=True)
+        messages = [{"role": "user", "content": "test"}]
+        result = asyncio.run(model.aquery(messages))
+
+        assert result["extra"]["cost"] == 0.002
+        assert mock_acompletion.call_args_list[1].kwargs["tool_choice"] == "required"
+        assert model.config.tool_choice is None
+        assert len(messages) == 3
+
+    @patch("ralphsweagent.models.litellm_model.litellm.acompletion", new_callable=AsyncMock)
+    @patch("ralphsweagent.models.litellm_model.litellm.cost_calculator.completion_cost")
+    def test_required_tool_choice_of_a_retry_does_not_leak_into_concurrent_queries(self, mock_cost, mock_acompletion):
+        no_tools_resp = _mock_litellm_response(None)
+        no_tools_resp.choices[0].message.model_dump.return_value = {"role": "assistant", "content": "Hmm"}
+        tool_choices: dict[str, object] = {}
+        retry_started, other_done = asyncio.Event(), asyncio.Event()
+
+        async def _completion(**kwargs):
+            task = kwargs["messages"][0]["content"]
+            if task == "nudged" and len(kwargs["messages"]) == 1:
+                return no_tools_resp
+            if task == "nudged":
+                retry_started.set()
+                await other_done.wait()
+            else:
+                await retry_started.wait()
+                other_done.set()
+            tool_choices[task] = kwargs.get("tool_choice")
+            return _mock_litellm_response([self._tool_call()])
+
+        mock_acompletion.side_effect = _completion
+        mock_cost.return_value = 0.001
+        model = LitellmModel(model_name="gpt-4", retry_missing_tool_calls=True)
+
+        async def _run():
+            await asyncio.gather(
+                model.aquery([{"role": "user", "content": "nudged"}]),
+                model.aquery([{"role": "user", "content": "other"}]),
+            )
+
+        asyncio.run(_run())
+        assert tool_choices == {"nudged": "required", "other": None}
+        assert model.config.tool_choice is None
+
+    @patch("ralphsweagent.models.litellm_model.litellm.acompletion", new_callable=AsyncMock)
+    @patch("ralphsweagent.models.litellm_model.litellm.cost_calculator.completion_cost")
+    def test_aquery_runs_concurrently_on_one_loop(self, mock_cost, mock_acompletion):
+        in_flight = 0
+        peak = 0
+
+        async def _slow_completion(**kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return _mock_litellm_response([self._tool_call()])
+
+        mock_acompletion.side_effect = _slow_completion
+        mock_cost.return_value = 0.001
+        model = LitellmModel(model_name="gpt-4")
+
+        async def _run():
+            return await asyncio.gather(*(model.aquery([{"role": "user", "content": "hi"}]) for _ in range(50)))
+
+        results = asyncio.run(_run())
+        assert len(results) == 50
+        assert peak == 50
+
+    def test_dispatch_of_one_stream_is_not_counted_for_a_concurrent_one(self, monkeypatch):
+        monkeypatch.setenv("MSWEA_MODEL_RETRY_STOP_AFTER_ATTEMPT", "1")
+        usage = {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
+        failing_started, dispatched, failed = asyncio.Event(), asyncio.Event(), asyncio.Event()
+        events = []
+
+        async def _dispatching():
+            await failing_started.wait()
+            yield _make_stream_chunk(tool_calls=TestEarlyToolDispatch._tool_call_deltas("call_1", "ls"))
+            dispatched.set()
+            await failed.wait()
+            yield _make_stream_chunk(content="done", usage=usage)
+
+        async def _failing():
+            failing_started.set()
+            await dispatched.wait()
+            failed.set()
+            raise ConnectionError("connection reset")
+            yield
+
+        async def _completion(**kwargs):
+            return _dispatching() if kwargs["messages"][0]["content"] == "dispatching" else _failing()
+
+        model = LitellmModel(model_name="gpt-4", use_streaming=True, early_tool_dispatch=True)
+        model.tool_call_listener = events.append
+
+        async def _run():
+            return await asyncio.gather(
+                model.aquery([{"role": "user", "content": "dispatching"}]),
+                model.aquery([{"role": "user", "content": "failing"}]),
+                return_exceptions=True,
+            )
+
+        with (
+            patch("ralphsweagent.models.litellm_model.litellm.acompletion", side_effect=_completion),
+            patch("ralphsweagent.models.litellm_model.litellm.cost_calculator.completion_cost", return_value=0.001),
+        ):
+            result, error = asyncio.run(_run())
+        assert result["extra"]["actions"] == [{"command": "ls", "tool_call_id": "call_1"}]
+        assert type(error) is ConnectionError
+        assert events == [{"command": "ls", "tool_call_id": "call_1"}]
@@ -1,4 +1,7 @@
-from unittest.mock import Mock, patch
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+import litellm
 
 from ralphsweagent.models.litellm_response_model import LitellmResponseModel
 from ralphsweagent.models.utils.actions_toolcall_response import (
@@ -61,3 +64,80 @@ def test_response_api_requires_reasoning_and_tool_choice(mock_cost, mock_respons
 
     assert mock_responses.call_args.kwargs["tools"] == [BASH_TOOL_RESPONSE_API_WITH_REASONING]
     assert mock_responses.call_args.kwargs["tool_choice"] == "required"
+
+
+@patch("ralphsweagent.models.litellm_response_model.litellm.aresponses", new_callable=AsyncMock)
+@patch("ralphsweagent.models.litellm_response_model.litellm.cost_calculator.completion_cost", return_value=0.01)
+def test_response_api_aquery_tracks_previous_response_id(mock_cost, mock_aresponses):
+    output = [
+        {"type": "message", "role": "assistant", "content": [{"type": "output_text", "text": "Hello"}]},
+        {"type": "function_call", "call_id": "call_1", "name": "bash", "arguments": '{"command": "echo test"}'},
+    ]
+    response = Mock()
+    response.output = output
+    response.model_dump.return_value = {"id": "resp_1", "output": output}
+    mock_aresponses.return_value = response
+
+    model = LitellmResponseModel(model_name="gpt-4o")
+    first = asyncio.run(model.aquery([{"role": "user", "content": "hi"}]))
+    asyncio.run(model.aquery([{"role": "user", "content": "hi again"}]))
+
+    assert first["content"] == "Hello"
+    assert first["extra"]["actions"] == [{"command": "echo test", "tool_call_id": "call_1"}]
+    assert mock_aresponses.call_args_list[1].kwargs["previous_response_id"] == "resp_1"
+
+
+def _response(response_id: str, call_id: str) -> Mock:
+    output = [
+        {"type": "function_call", "call_id": call_id, "name": "bash", "arguments": '{"command": "echo test"}'},
+    ]
+    response = Mock()
+    response.output = output
+    response.model_dump.return_value = {"id": response_id, "object": "response", "output": output}
+    return response
+
+
+def _tool_output(call_id: str) -> dict:
+    return {"type": "function_call_output", "call_id": call_id, "output": "test", "extra": {"raw": "x"}}
+
+
+@patch("ralphsweagent.models.litellm_response_model.litellm.responses")
+@patch("ralphsweagent.models.litellm_response_model.litellm.cost_calculator.completion_cost", return_value=0.01)
+def test_stateful_mode_sends_only_new_items(mock_cost, mock_responses):
+    mock_responses.side_effect = [_response("resp_1", "call_1"), _response("resp_2", "call_2")]
+    model = LitellmResponseModel(model_name="gpt-4o", stateful=True)
+
+    messages = [{"role": "system", "content": "sys"}, {"role": "user", "content": "task"}]
+    first = model.query(messages)
+    messages += [first, _tool_output("call_1")]
+    second = model.query(messages)
+
+    first_kwargs, second_kwargs = (call.kwargs for call in mock_responses.call_args_list)
+    assert "previous_response_id" not in first_kwargs
+    assert len(first_kwargs["input"]) == 2
+    assert second_kwargs["previous_response_id"] == "resp_1"
+    assert second_kwargs["input"] == [{"type": "function_call_output", "call_id": "call_1", "output": "test"}]
+    stats = second["extra"]["stateful_input"]
+    assert (stats["items_sent"], stats["items_total"], stats["full_replay"]) == (1, 4, False)
+    assert 0 < stats["saved_fraction"] < 1
+    assert first["extra"]["stateful_input"]["full_replay"] is True
+
+
+@patch("ralphsweagent.models.litellm_response_model.litellm.responses")
+@patch("ralphsweagent.models.litellm_response_model.litellm.cost_calculator.completion_cost", return_value=0.01)
+def test_stateful_mode_replays_history_when_id_rejected(mock_cost, mock_responses):
+    rejection = litellm.exceptions.BadRequestError(
+        message="Previous response with id 'resp_1' not found.", model="gpt-4o", llm_provider="openai"
+    )
+    mock_responses.side_effect = [_response("resp_1", "call_1"), rejection, _response("resp_2", "call_2")]
+    model = LitellmResponseModel(model_name="gpt-4o", stateful=True)
+
+    messages = [{"role": "user", "content": "task"}]
+    messages += [model.query(messages), _tool_output("call_1")]
+    second = model.query(messages)
+
+    replay_kwargs = mock_responses.call_args_list[2].kwargs
+    assert "previous_response_id" not in replay_kwargs
+    assert len(replay_kwargs["input"]) == 3
+    assert second["extra"]["stateful_input"]["full_replay"] is True
+    assert model._previous_response_id == "resp_2"
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from minisweagent.models.utils.anthropic_utils import _reorder_anthropic_thinking_blocks
+from minisweagent.models.utils.cache_control import set_cache_control
+from ralphsweagent.models.litellm_model import LitellmModel
+from ralphsweagent.models.litellm_response_model import LitellmResponseModel
+from ralphsweagent.models.utils.message_prep import ChatMessagePreparer, prepare_response_items
+
+
+def _reference_chat(messages, mode):
+    prepared = [{k: v for k, v in msg.items() if k != "extra"} for msg in messages]
+    prepared = _reorder_anthropic_thinking_blocks(prepared)
+    return set_cache_control(prepared, mode=mode)
+
+
+def _random_message(rng, i, mode=None):
+    # set_cache_control only supports single-block list content, so thinking blocks are chat-only.
+    kind = rng.choice(["user", "tool", "assistant"] + (["thinking"] if mode is None else []))
+    if kind == "thinking":
+        content = [{"type": "text", "text": f"answer {i}"}, {"type": "thinking", "thinking": f"t{i}"}]
+        return {"role": "assistant", "content": content, "extra": {"i": i}}
+    if kind == "tool":
+        return {"role": "tool", "tool_call_id": f"call_{i}", "content": f"out {i}", "extra": {"i": i}}
+    return {"role": kind, "content": f"{kind} {i}", "extra": {"i": i}}
+
+
+@pytest.mark.parametrize("mode", [None, "default_end"])
+@pytest.mark.parametrize("seed", range(5))
+def test_chat_preparer_matches_uncached_pipeline(seed, mode):
+    rng = random.Random(seed)
+    preparer = ChatMessagePreparer()
+    messages = []
+    for step in range(60):
+        messages.append(_random_message(rng, step, mode))
+        action = rng.random()
+        if action < 0.1 and len(messages) > 2:
+            messages[rng.randrange(len(messages))] = _random_message(rng, 1000 + step, mode)
+        elif action < 0.2:
+            messages[-1]["context_left_percent"] = step
+        elif action < 0.25:
+            messages[rng.randrange(len(messages))]["extra"]["touched"] = True
+        elif action < 0.3 and len(messages) > 4:
+            del messages[rng.randrange(len(messages))]
+        assert preparer.prepare(messages, cache_control=mode) == _reference_chat(messages, mode)
+
+
+def test_chat_preparer_only_prepares_new_tail():
+    preparer = ChatMessagePreparer()
+    messages = [{"role": "system", "content": "s"}, {"role": "user", "content": "u"}]
+    preparer.prepare(messages, cache_control="default_end")
+    for i in range(10):
+        messages.append({"role": "assistant", "content": f"a{i}"})
+        prepared = preparer.prepare(messages, cache_control="default_end")
+        assert prepared[-2] == messages[-2]
+        assert prepared[-1]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert preparer.n_prepared == 12
+    assert messages[-1] == {"role": "assistant", "content": "a9"}
+
+
+def test_response_model_prepares_incrementally_and_matches_flattening():
+    model = LitellmResponseModel(model_name="gpt-5")
+    messages = [{"role": "user", "content": "hi", "extra": {}}]
+    for i in range(5):
+        messages.append(
+            {"object": "response", "id": f"resp_{i}", "output": [{"type": "message", "extra": {}}, {"type": "x"}]}
+        )
+        messages.append({"type": "function_call_output", "call_id": f"c{i}", "output": "ok"})
+        assert model._prepare_messages_for_api(messages) == prepare_response_items(messages)
+    assert model._message_cache.n_prepared == len(messages)
+
+
+def test_chat_model_reuses_prefix():
+    model = LitellmModel(model_name="gpt-4")
+    messages = [{"role": "user", "content": "hi"}]
+    model._prepare_messages_for_api(messages)
+    messages.append({"role": "assistant", "content": "hello"})
+    assert model._prepare_messages_for_api(messages) == [{"role": "user", "content": "hi"}, messages[1]]
+    assert model._message_preparer.n_prepared == 2
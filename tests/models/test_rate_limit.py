@@ -0,0 +1,198 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from ralphsweagent.models.litellm_model import LitellmModel
+from ralphsweagent.models.openrouter_model import OpenRouterModel, OpenRouterRateLimitError
+from ralphsweagent.models.utils import rate_limit
+from ralphsweagent.models.utils.http_transport import close_http_transports
+from ralphsweagent.models.utils.rate_limit import (
+    DEFAULT_RATE_LIMIT_PAUSE,
+    RateLimiter,
+    get_rate_limiter,
+    parse_reset_seconds,
+    reset_rate_limiters,
+)
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _FakeClock()
+    monkeypatch.setattr(rate_limit, "time", fake)
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def _fresh_limiters():
+    reset_rate_limiters()
+    yield
+    reset_rate_limiters()
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [
+        ("7", 7.0),
+        ("1.5", 1.5),
+        ("6m0s", 360.0),
+        ("1m30.5s", 90.5),
+        ("20ms", 0.02),
+        ("1100", 1100.0),
+        ("1600000030", 30.0),
+        ("1600000030000", 30.0),
+        ("Sun, 13 Sep 2020 12:27:10 GMT", 30.0),
+        ("", None),
+        ("soon", None),
+    ],
+)
+def test_parse_reset_seconds(value, expected):
+    seconds = parse_reset_seconds(value, now=1600000000.0)
+    assert seconds is None if expected is None else seconds == pytest.approx(expected)
+
+
+def test_requests_per_minute_bucket_blocks_until_refilled(clock):
+    limiter = RateLimiter(requests_per_minute=2)
+    limiter.acquire()
+    limiter.acquire()
+    assert clock.sleeps == []
+    limiter.acquire()
+    assert sum(clock.sleeps) == pytest.approx(30.0)
+
+
+def test_tokens_per_minute_uses_estimate_then_settles_actual_usage(clock):
+    limiter = RateLimiter(tokens_per_minute=1000)
+    messages = [{"role": "user", "content": "x" * 400}]
+    reserved = limiter.acquire(messages)
+    assert 100 < reserved < 150
+    limiter.settle(reserved, {"total_tokens": 1000})
+    limiter.acquire(messages)
+    assert sum(clock.sleeps) == pytest.approx(reserved * 60 / 1000)
+
+
+def test_registry_shares_limiters_per_provider_and_model():
+    limiter = get_rate_limiter("openrouter", "m", requests_per_minute=10)
+    assert get_rate_limiter("openrouter", "m") is limiter
+    assert limiter.requests_per_minute == 10
+    assert get_rate_limiter("requesty", "m") is not limiter
+    assert get_rate_limiter("openrouter", "other") is not limiter
+
+
+def test_exhausted_remaining_header_pauses_until_reset(clock):
+    limiter = RateLimiter()
+    limiter.update_from_headers({"X-RateLimit-Remaining-Tokens": "0", "X-RateLimit-Reset-Tokens": "12s"})
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "5", "x-ratelimit-reset-requests": "1h"})
+    limiter.acquire()
+    assert sum(clock.sleeps) == pytest.approx(12.0)
+
+
+def test_on_error_reads_litellm_rate_limit_headers(clock):
+    limiter = RateLimiter()
+    error = SimpleNamespace(status_code=429, litellm_response_headers={"llm_provider-retry-after": "3"})
+    limiter.on_error(error)
+    limiter.on_error(SimpleNamespace(status_code=500, litellm_response_headers={"retry-after": "60"}))
+    limiter.acquire()
+    assert sum(clock.sleeps) == pytest.approx(3.0)
+
+
+def test_rate_limited_without_headers_uses_default_pause(clock):
+    assert RateLimiter().on_rate_limited(None) == DEFAULT_RATE_LIMIT_PAUSE
+
+
+class _RateLimitHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    statuses: list[int] = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        status = self.statuses.pop(0)
+        body = json.dumps({"choices": [{"message": {"role": "assistant", "content": "ok"}}], "usage": {"cost": 0.1}})
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "7")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def rate_limit_server():
+    _RateLimitHandler.statuses = [429, 200]
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RateLimitHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    close_http_transports()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    close_http_transports()
+    server.shutdown()
+    server.server_close()
+
+
+def test_429_retry_after_pauses_every_instance_of_the_model(clock, rate_limit_server):
+    first, second = OpenRouterModel(model_name="test-model"), OpenRouterModel(model_name="test-model")
+    for model in (first, second):
+        model._api_url = rate_limit_server
+
+    with pytest.raises(OpenRouterRateLimitError, match="7.0s"):
+        first._query([{"role": "user", "content": "hi"}])
+    assert clock.sleeps == []
+
+    assert second._query([{"role": "user", "content": "hi"}])["choices"][0]["message"]["content"] == "ok"
+    assert sum(clock.sleeps) == pytest.approx(7.0)
+
+
+def _stream(*chunks, error: Exception | None = None):
+    yield from chunks
+    if error is not None:
+        raise error
+
+
+def _chunk(*, content=None, usage=None):
+    delta = SimpleNamespace(content=content, tool_calls=None, role="assistant")
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None, index=0)], usage=usage)
+
+
+class _StreamRateLimitError(Exception):
+    status_code = 429
+    litellm_response_headers = {"retry-after": "9"}
+
+
+def test_streamed_response_settles_its_reassembled_usage(clock):
+    model = LitellmModel(model_name="test-model", use_streaming=True, tokens_per_minute=1000)
+    usage = {"prompt_tokens": 900, "completion_tokens": 100, "total_tokens": 1000}
+    stream = _stream(_chunk(content="ok"), _chunk(usage=usage))
+    with patch("ralphsweagent.models.litellm_model.litellm.completion", return_value=stream):
+        assert model._query([{"role": "user", "content": "hi"}]).usage == usage
+    assert model._rate_limiter._tokens.level == pytest.approx(0.0)
+
+
+def test_rate_limit_error_while_reading_a_stream_pauses_other_callers(clock):
+    model = LitellmModel(model_name="test-model", use_streaming=True)
+    stream = _stream(_chunk(content="partial"), error=_StreamRateLimitError("rate limited"))
+    with patch("ralphsweagent.models.litellm_model.litellm.completion", return_value=stream):
+        with pytest.raises(_StreamRateLimitError):
+            model._query([{"role": "user", "content": "hi"}])
+    get_rate_limiter("litellm", "test-model").acquire()
+    assert sum(clock.sleeps) == pytest.approx(9.0)
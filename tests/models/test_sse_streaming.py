@@ -0,0 +1,131 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ralphsweagent.models.openrouter_model import OpenRouterAPIError, OpenRouterModel
+from ralphsweagent.models.openrouter_response_model import OpenRouterResponseModel
+from ralphsweagent.models.requesty_model import RequestyModel
+from ralphsweagent.models.utils.http_transport import close_http_transports
+
+_TOOL_CALL_ARGS = ['{"comm', 'and": "echo', ' test"}']
+
+
+def _sse_events(error: bool = False) -> list[dict]:
+    events = [{"id": "gen-1", "model": "m", "choices": [{"index": 0, "delta": {"role": "assistant", "content": "Run"}}]}]
+    for i, arguments in enumerate(_TOOL_CALL_ARGS):
+        tool_call = {"index": 0, "function": {"arguments": arguments}}
+        if i == 0:
+            tool_call.update(id="call_1", type="function", function={"name": "bash", "arguments": arguments})
+        events.append({"choices": [{"index": 0, "delta": {"tool_calls": [tool_call]}}]})
+    if error:
+        events.append({"error": {"code": 502, "message": "upstream died"}, "choices": []})
+    events.append({"choices": [{"index": 0, "delta": {}, "finish_reason": "tool_calls"}], "usage": {"cost": 0.002}})
+    return events
+
+
+def _responses_sse_events() -> list[dict]:
+    tool_call = {"type": "function_call", "call_id": "call_1", "name": "bash", "arguments": '{"command": "echo test"}'}
+    response = {"id": "resp_1", "object": "response", "output": [tool_call], "usage": {"cost": 0.002}}
+    return [
+        {"type": "response.created", "response": {**response, "output": []}},
+        {"type": "response.function_call_arguments.delta", "delta": '{"command"'},
+        {"type": "response.completed", "response": response},
+    ]
+
+
+class _SSEHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    chunk_delay = 0.0
+    error = False
+    payloads: list[dict] = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.payloads.append(payload)
+        events = _responses_sse_events() if "input" in payload else _sse_events(self.error)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            self.wfile.write(b": PROCESSING\n\n")
+            for event in events:
+                time.sleep(self.chunk_delay)
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def sse_server():
+    _SSEHandler.chunk_delay, _SSEHandler.error, _SSEHandler.payloads = 0.0, False, []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SSEHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    close_http_transports()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    close_http_transports()
+    server.shutdown()
+    server.server_close()
+
+
+def _model(model_class, url, **kwargs):
+    model = model_class(model_name="test-model", use_streaming=True, **kwargs)
+    model._api_key = "test-key"
+    model._api_url = url
+    return model
+
+
+@pytest.mark.parametrize("model_class", [OpenRouterModel, RequestyModel])
+def test_streaming_query_reassembles_tool_calls_and_cost(model_class, sse_server):
+    result = _model(model_class, sse_server).query([{"role": "user", "content": "hi"}])
+
+    assert _SSEHandler.payloads[0]["stream"] is True
+    assert result["content"] == "Run"
+    assert result["extra"]["actions"] == [{"command": "echo test", "tool_call_id": "call_1"}]
+    assert result["extra"]["cost"] == 0.002
+    json.dumps(result["extra"]["response"])
+
+
+@pytest.mark.parametrize("model_class", [OpenRouterModel, RequestyModel])
+def test_streaming_aquery_reassembles_tool_calls(model_class, sse_server):
+    result = asyncio.run(_model(model_class, sse_server).aquery([{"role": "user", "content": "hi"}]))
+
+    assert result["extra"]["actions"] == [{"command": "echo test", "tool_call_id": "call_1"}]
+    assert result["extra"]["cost"] == 0.002
+
+
+def test_streaming_responses_api_uses_the_completed_response(sse_server):
+    model = _model(OpenRouterResponseModel, sse_server)
+    result = model.query([{"role": "user", "content": "hi"}])
+    assert asyncio.run(model.aquery([{"role": "user", "content": "hi"}]))["id"] == "resp_1"
+
+    assert [payload["stream"] for payload in _SSEHandler.payloads] == [True, True]
+    assert result["id"] == "resp_1"
+    assert result["extra"]["actions"] == [{"command": "echo test", "tool_call_id": "call_1"}]
+    assert result["extra"]["cost"] == 0.002
+
+
+def test_streaming_timeout_is_per_chunk_not_per_response(sse_server):
+    _SSEHandler.chunk_delay = 0.1
+    model = _model(OpenRouterModel, sse_server, request_timeout=0.3)
+    start = time.monotonic()
+    result = model.query([{"role": "user", "content": "hi"}])
+
+    assert time.monotonic() - start > 0.3
+    assert result["extra"]["actions"] == [{"command": "echo test", "tool_call_id": "call_1"}]
+
+
+def test_streaming_error_event_raises_api_error(sse_server):
+    _SSEHandler.error = True
+    with pytest.raises(OpenRouterAPIError, match="upstream died"):
+        _model(OpenRouterModel, sse_server)._query([{"role": "user", "content": "hi"}])
@@ -0,0 +1,147 @@
+import asyncio
+import random
+import threading
+
+import pytest
+
+from ralphsweagent.models.utils.stream_reassembly import (
+    CLOSING_TAG_RE,
+    ClosingTagWindow,
+    StreamIdleTimeout,
+    StreamReassembler,
+    aiter_with_idle_timeout,
+    iter_with_idle_timeout,
+)
+
+
+def _reference(content: str, window: int, threshold: int) -> tuple[int, int | None]:
+    window_text = content[-window:] if len(content) > window else content
+    matches = list(CLOSING_TAG_RE.finditer(window_text))
+    cutoff = len(content) - len(window_text) + matches[threshold - 1].start() if len(matches) >= threshold else None
+    return len(matches), cutoff
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_closing_tag_window_matches_regex_on_every_chunk(seed):
+    rng = random.Random(seed)
+    window, threshold = rng.randint(4, 40), rng.randint(1, 6)
+    counter = ClosingTagWindow(window, threshold)
+    content = ""
+    for _ in range(300):
+        delta = "".join(rng.choice("<</>>ab ") for _ in range(rng.randint(1, 6)))
+        content += delta
+        counter.feed(delta)
+        count, cutoff = _reference(content, window, threshold)
+        assert counter.count() == count
+        assert counter.cutoff() == cutoff
+
+
+def test_closing_tag_window_handles_tag_straddling_window_start():
+    counter = ClosingTagWindow(window=6, threshold=1)
+    for delta in ["</a </", "b>"]:
+        counter.feed(delta)
+    assert _reference("</a </b>", 6, 1) == (1, 4)
+    assert (counter.count(), counter.cutoff()) == (1, 4)
+
+
+def test_reassembler_accepts_dict_chunks_and_joins_deltas():
+    reassembler = StreamReassembler()
+    tool_call = {"index": 0, "id": "call_1", "type": "function", "function": {"name": "bash", "arguments": '{"command": '}}
+    reassembler.add({"model": "m", "id": "r1", "choices": [{"delta": {"content": "Hello ", "tool_calls": [tool_call]}}]})
+    reassembler.add(
+        {
+            "choices": [
+                {
+                    "delta": {"content": "world", "tool_calls": [{"index": 0, "function": {"arguments": '"ls"}'}}]},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 2},
+        }
+    )
+    response = reassembler.build()
+
+    message = response.choices[0].message
+    assert message.content == "Hello world"
+    assert message.tool_calls[0].function.arguments == '{"command": "ls"}'
+    assert response["id"] == "r1"
+    assert response.usage == {"prompt_tokens": 1, "completion_tokens": 2}
+    assert response.choices[0].finish_reason == "stop"
+
+
+def test_reassembler_measures_time_to_first_token(monkeypatch):
+    from ralphsweagent.models.utils import stream_reassembly
+
+    now = iter([10.5, 11.0])
+    monkeypatch.setattr(stream_reassembly.time, "monotonic", lambda: next(now))
+    reassembler = StreamReassembler(started_at=10.0)
+    reassembler.add({"choices": [{"delta": {"role": "assistant"}}]})
+    assert reassembler.time_to_first_token is None
+    reassembler.add({"choices": [{"delta": {"content": "Hi"}}]})
+    reassembler.add({"choices": [{"delta": {"content": "!"}}]})
+    response = reassembler.build()
+    assert response.time_to_first_token == pytest.approx(0.5)
+    assert "time_to_first_token" not in response.model_dump()
+
+
+def test_reassembler_reports_tool_call_once_arguments_are_complete():
+    seen = []
+    reassembler = StreamReassembler(on_tool_call=lambda *call: seen.append((call, len(reassembler._content))))
+    deltas = ['{"command": "echo }', '"', "}", " "]
+    reassembler.add({"choices": [{"delta": {"tool_calls": [{"index": 0, "id": "call_1", "function": {"name": "bash"}}]}}]})
+    for delta in deltas:
+        reassembler.add({"choices": [{"delta": {"tool_calls": [{"index": 0, "function": {"arguments": delta}}]}}]})
+    reassembler.add({"choices": [{"delta": {"content": "done"}}]})
+
+    assert seen == [(("call_1", "bash", {"command": "echo }"}), 0)]
+
+
+class _StallingStream:
+    """Yields ``chunks``, then blocks until closed."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        yield from self.chunks
+        self.closed.wait()
+
+    def close(self):
+        self.closed.set()
+
+
+def test_idle_timeout_closes_a_stalled_stream():
+    stream = _StallingStream(["a", "b"])
+    received = []
+    with pytest.raises(StreamIdleTimeout):
+        for chunk in iter_with_idle_timeout(stream, 0.1):
+            received.append(chunk)
+    assert received == ["a", "b"]
+    assert stream.closed.is_set()
+
+
+def test_idle_timeout_passes_through_chunks_and_errors():
+    def _failing():
+        yield "a"
+        raise ConnectionError("reset")
+
+    assert list(iter_with_idle_timeout(iter(["a", "b"]), 1.0)) == ["a", "b"]
+    with pytest.raises(ConnectionError):
+        list(iter_with_idle_timeout(_failing(), 1.0))
+
+
+def test_async_idle_timeout_abandons_a_stalled_stream():
+    async def _stalling():
+        yield "a"
+        await asyncio.sleep(10)
+        yield "b"
+
+    async def _read():
+        received = []
+        with pytest.raises(StreamIdleTimeout):
+            async for chunk in aiter_with_idle_timeout(_stalling(), 0.1):
+                received.append(chunk)
+        return received
+
+    assert asyncio.run(_read()) == ["a"]
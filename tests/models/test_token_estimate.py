@@ -0,0 +1,53 @@
+import pytest
+
+from ralphsweagent.models.utils import token_estimate
+from ralphsweagent.models.utils.token_estimate import (
+    PromptTokenEstimator,
+    get_message_token_counter,
+    heuristic_token_count,
+)
+
+
+@pytest.fixture(autouse=True)
+def _clear_counter_cache():
+    get_message_token_counter.cache_clear()
+    yield
+    get_message_token_counter.cache_clear()
+
+
+def test_estimator_uses_tokenizer_and_counts_only_new_messages(monkeypatch):
+    counted = []
+
+    def fake_token_counter(*, model, messages):
+        counted.append(messages[0]["content"])
+        return len(messages[0]["content"].split())
+
+    monkeypatch.setattr("litellm.token_counter", fake_token_counter)
+    estimator = PromptTokenEstimator("gpt-4o")
+    messages = [{"role": "system", "content": "a b"}, {"role": "user", "content": "c d e", "extra": {"x": 1}}]
+    assert estimator.estimate(messages) == 5
+    messages.append({"role": "assistant", "content": "f"})
+    assert estimator.estimate(messages) == 6
+    assert counted == ["probe", "a b", "c d e", "f"]
+
+
+def test_estimator_falls_back_to_heuristic_without_tokenizer(monkeypatch):
+    def broken_token_counter(**kwargs):
+        raise ValueError("no tokenizer")
+
+    monkeypatch.setattr("litellm.token_counter", broken_token_counter)
+    assert get_message_token_counter("unknown/model") is heuristic_token_count
+    message = {"role": "user", "content": "x" * 4000}
+    assert PromptTokenEstimator("unknown/model").estimate([message]) == heuristic_token_count(message)
+
+
+def test_tools_are_added_to_the_estimate():
+    estimator = PromptTokenEstimator("gpt-4o")
+    messages = [{"role": "user", "content": "hello"}]
+    tools = [{"type": "function", "function": {"name": "bash", "description": "run " * 100}}]
+    assert estimator.estimate(messages, tools=tools) == estimator.estimate(messages) + heuristic_token_count(tools)
+
+
+def test_heuristic_is_about_four_characters_per_token():
+    assert heuristic_token_count("x" * 4000) == pytest.approx(1000, abs=2)
+    assert token_estimate.CHARS_PER_TOKEN == 4
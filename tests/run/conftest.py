@@ -0,0 +1,38 @@
+"""Shared fixtures for runner tests."""
+
+import subprocess
+
+import pytest
+
+from ralphsweagent.run.benchmarks.image_prefetch import ImagePrefetcher
+
+
+class FakeDockerPrefetcher(ImagePrefetcher):
+    """Prefetcher that records docker commands instead of running them."""
+
+    def __init__(self, *args, present=(), size=100, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.local = set(present)
+        self.size = size
+        self.commands: list[tuple[str, ...]] = []
+        self.evict_retry_delay = 0.0
+
+    def _run(self, *args, timeout=None):
+        self.commands.append(args)
+        ok = True
+        stdout = ""
+        if args[:2] == ("image", "inspect"):
+            ok = args[-1] in self.local
+            stdout = str(self.size)
+        elif args[0] == "pull":
+            self.local.add(args[1])
+            stdout = "latest: Pulling from swebench/img\nbase: Already exists\nrepo: Pull complete\n"
+        elif args[0] == "rmi":
+            self.local.discard(args[1])
+        return subprocess.CompletedProcess(args, 0 if ok else 1, stdout, "")
+
+
+@pytest.fixture
+def fake_docker_prefetcher() -> type[FakeDockerPrefetcher]:
+    """The `FakeDockerPrefetcher` class, to build prefetchers over a test's queue."""
+    return FakeDockerPrefetcher
@@ -0,0 +1,91 @@
+import threading
+
+from ralphsweagent.run.benchmarks.environment_pool import EnvironmentPool
+
+
+class FakeEnvironment:
+    def __init__(self, instance_id: str, healthy: bool = True):
+        self.instance_id = instance_id
+        self.healthy = healthy
+        self.cleaned_up = False
+
+    def execute(self, action: dict, cwd: str = "") -> dict:
+        return {"output": "", "returncode": 0 if self.healthy else 1}
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+def test_pre_started_environments_are_handed_to_their_instances():
+    started: list[str] = []
+
+    def factory(instance_id):
+        started.append(instance_id)
+        return FakeEnvironment(instance_id)
+
+    pool = EnvironmentPool(["i0", "i1", "i2", "i3"], factory, depth=2)
+    pool.start()
+
+    assert pool.acquire("i0").instance_id == "i0"
+    assert pool.acquire("i3") is None
+    assert pool.acquire("i1").instance_id == "i1"
+    pool.close()
+
+    assert sorted(started[:2]) == ["i0", "i1"]
+    assert "i3" not in started
+    assert (pool.stats["hits"], pool.stats["misses"]) == (2, 1)
+
+
+def test_unhealthy_environments_are_cleaned_up_and_not_handed_out():
+    envs = {"i0": FakeEnvironment("i0", healthy=False)}
+    pool = EnvironmentPool(["i0"], envs.__getitem__, depth=1)
+    pool.start()
+
+    assert pool.acquire("i0") is None
+    assert envs["i0"].cleaned_up
+    assert pool.stats["unhealthy"] == 1
+    pool.close()
+
+
+def test_close_waits_for_starting_environments_and_cleans_them_up():
+    release = threading.Event()
+    envs: dict[str, FakeEnvironment] = {}
+
+    def factory(instance_id):
+        release.wait(5)
+        envs[instance_id] = FakeEnvironment(instance_id)
+        return envs[instance_id]
+
+    pool = EnvironmentPool(["i0", "i1"], factory, depth=2)
+    pool.start()
+    threading.Timer(0.1, release.set).start()
+    pool.close(timeout=5)
+
+    assert envs["i0"].cleaned_up and envs["i1"].cleaned_up
+    assert pool.stats["discarded"] == 2
+
+
+def test_close_after_timeout_cleans_up_environments_once_they_start():
+    entered, release = threading.Event(), threading.Event()
+    envs: dict[str, FakeEnvironment] = {}
+
+    def factory(instance_id):
+        if instance_id == "i1":
+            entered.set()
+            release.wait(5)
+        envs[instance_id] = FakeEnvironment(instance_id)
+        return envs[instance_id]
+
+    pool = EnvironmentPool(["i0", "i1", "i2"], factory, depth=2)
+    pool.start()
+    handed_out = pool.acquire("i2")
+    entered.wait(5)
+    pool.close(timeout=0.01)
+    assert "i1" not in envs
+    release.set()
+    pool._executor.shutdown(wait=True)
+
+    assert handed_out is None
+    assert envs["i0"].cleaned_up and envs["i1"].cleaned_up
+    assert pool.stats["discarded"] == 2
+    assert pool.acquire("i0") is None
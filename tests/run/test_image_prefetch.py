@@ -0,0 +1,69 @@
+import time
+
+
+def _eventually(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def _pulls(prefetcher):
+    return [command[1] for command in prefetcher.commands if command[0] == "pull"]
+
+
+def test_pulls_ahead_of_the_queue_and_evicts_after_the_last_user(fake_docker_prefetcher):
+    queue = [("i0", "a"), ("i1", "a"), ("i2", "b"), ("i3", "c")]
+    prefetcher = fake_docker_prefetcher(queue, lookahead=2, max_pulls=1)
+    prefetcher.start()
+    _eventually(lambda: "a" in prefetcher.local)
+    assert _pulls(prefetcher) == ["a"]
+
+    prefetcher.wait("i0", "a")
+    _eventually(lambda: "b" in prefetcher.local)
+    prefetcher.release("i0", "a")
+    assert "a" in prefetcher.local
+
+    prefetcher.wait("i1", "a")
+    prefetcher.release("i1", "a")
+    _eventually(lambda: prefetcher.stats["evicted"] == 1 and "c" in prefetcher.local)
+    assert "a" not in prefetcher.local
+    assert _pulls(prefetcher) == ["a", "b", "c"]
+    prefetcher.close()
+
+
+def test_images_that_were_already_present_are_kept(fake_docker_prefetcher):
+    prefetcher = fake_docker_prefetcher([("i0", "a")], present={"a"})
+    prefetcher.start()
+    _eventually(lambda: prefetcher.stats["present"] == 1)
+    prefetcher.wait("i0", "a")
+    prefetcher.release("i0", "a")
+    prefetcher.close()
+
+    assert _pulls(prefetcher) == []
+    assert not any(command[0] == "rmi" for command in prefetcher.commands)
+
+
+def test_disk_budget_holds_back_pulls_until_an_image_is_evicted(fake_docker_prefetcher):
+    queue = [("i0", "a"), ("i1", "b"), ("i2", "c")]
+    prefetcher = fake_docker_prefetcher(queue, lookahead=3, max_pulls=1, disk_budget_bytes=150, size=100)
+    prefetcher.start()
+    _eventually(lambda: {"a", "b"} <= prefetcher.local and prefetcher.stats["budget_stalls"])
+    assert "c" not in prefetcher.local
+
+    prefetcher.wait("i0", "a")
+    prefetcher.release("i0", "a")
+    _eventually(lambda: "c" in prefetcher.local)
+    assert "a" not in prefetcher.local
+    prefetcher.close()
+
+
+def test_layer_cache_hit_rate_comes_from_pull_output(fake_docker_prefetcher):
+    prefetcher = fake_docker_prefetcher([("i0", "a"), ("i1", "b")], lookahead=2)
+    assert prefetcher.layer_cache_hit_rate() is None
+    prefetcher.start()
+    _eventually(lambda: prefetcher.stats["pulled"] == 2)
+    prefetcher.close()
+
+    assert (prefetcher.stats["layers_reused"], prefetcher.stats["layers_pulled"]) == (2, 2)
+    assert prefetcher.layer_cache_hit_rate() == 0.5
@@ -0,0 +1,66 @@
+import json
+import multiprocessing
+import threading
+
+from typer.testing import CliRunner
+
+from ralphsweagent.run.benchmarks.preds_log import (
+    get_preds_log_path,
+    materialize_predictions,
+    record_prediction,
+    remove_prediction,
+)
+from ralphsweagent.run.utilities.materialize_preds import app as materialize_app
+
+
+def test_events_are_folded_in_order_into_existing_preds(tmp_path):
+    preds_path = tmp_path / "preds.json"
+    preds_path.write_text(json.dumps({"old": {"instance_id": "old"}, "kept": {"instance_id": "kept"}}))
+    remove_prediction(preds_path, "old")
+    record_prediction(preds_path, "new", "gpt-4o", "p1")
+    remove_prediction(preds_path, "new")
+    record_prediction(preds_path, "new", "gpt-4o", "p2")
+
+    predictions = materialize_predictions(preds_path)
+
+    assert set(predictions) == {"kept", "new"}
+    assert predictions["new"] == {"model_name_or_path": "gpt-4o", "instance_id": "new", "model_patch": "p2"}
+    assert json.loads(preds_path.read_text()) == predictions
+    assert get_preds_log_path(preds_path).read_text() == ""
+    assert materialize_predictions(preds_path) == predictions
+
+
+def test_unreadable_lines_are_skipped(tmp_path):
+    preds_path = tmp_path / "preds.json"
+    record_prediction(preds_path, "a", "m", "patch")
+    with get_preds_log_path(preds_path).open("a") as handle:
+        handle.write('{"instance_id": "b", "predic')
+
+    assert set(materialize_predictions(preds_path)) == {"a"}
+
+
+def _append_many(preds_path, worker: int) -> None:
+    for index in range(50):
+        record_prediction(preds_path, f"w{worker}-{index}", "m", "x" * 5000)
+
+
+def test_concurrent_appends_from_threads_and_processes_are_not_lost(tmp_path):
+    preds_path = tmp_path / "preds.json"
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_append_many, args=(preds_path, i)) for i in range(2)]
+    threads = [threading.Thread(target=_append_many, args=(preds_path, i)) for i in range(2, 4)]
+    for worker in [*processes, *threads]:
+        worker.start()
+    for worker in [*processes, *threads]:
+        worker.join()
+
+    assert len(materialize_predictions(preds_path)) == 200
+
+
+def test_materialize_command_accepts_output_directories(tmp_path):
+    record_prediction(tmp_path / "preds.json", "a", "m", "patch")
+
+    result = CliRunner().invoke(materialize_app, [str(tmp_path)])
+
+    assert result.exit_code == 0, result.output
+    assert set(json.loads((tmp_path / "preds.json").read_text())) == {"a"}
@@ -0,0 +1,115 @@
+import json
+
+import pytest
+
+from ralphsweagent.run.benchmarks.scheduling import (
+    DEFAULT_SECONDS_PER_STEP,
+    family_cache_hit_rate,
+    load_history,
+    locality_order,
+    lpt_order,
+    order_instances,
+    predict_durations,
+    repo_family,
+    simulate_makespan,
+)
+
+
+def _instance(instance_id: str, repo: str = "", version: str = "") -> dict:
+    return {"instance_id": instance_id, "repo": repo, "version": version}
+
+
+def test_repo_family_uses_repo_and_version_or_the_instance_id():
+    assert repo_family(_instance("astropy__astropy-12907", "astropy/astropy", "4.3")) == "astropy/astropy@4.3"
+    assert repo_family({"instance_id": "django__django-11099"}) == "django__django@"
+
+
+def test_locality_order_groups_families_largest_first():
+    instances = [
+        _instance("a-1", "a", "1"),
+        _instance("b-1", "b", "1"),
+        _instance("a-2", "a", "1"),
+        _instance("c-1", "c", "1"),
+        _instance("b-2", "b", "2"),
+        _instance("a-3", "a", "1"),
+    ]
+
+    ordered = locality_order(instances, lambda instance: f"img-{instance['instance_id']}")
+
+    assert [instance["instance_id"] for instance in ordered] == ["a-1", "a-2", "a-3", "b-1", "b-2", "c-1"]
+    assert order_instances(instances, "dataset", image_name=str) is instances
+    with pytest.raises(ValueError, match="Unknown schedule"):
+        order_instances(instances, "fastest", image_name=str)
+
+
+def test_family_cache_hit_rate_counts_recent_families():
+    assert family_cache_hit_rate(["a", "b", "a", "b"], window=1) == 0.0
+    assert family_cache_hit_rate(["a", "b", "a", "b"], window=2) == 0.5
+    assert family_cache_hit_rate(["a", "a", "b", "b"], window=1) == 0.5
+    assert family_cache_hit_rate([], window=4) == 0.0
+
+
+def _write_trajectory(run_dir, instance_id, api_calls, timings=None):
+    messages = [{"role": "assistant", "content": "", "extra": {"timings": timings}}] if timings else []
+    data = {"instance_id": instance_id, "info": {"model_stats": {"api_calls": api_calls}}, "messages": messages}
+    (run_dir / instance_id).mkdir()
+    (run_dir / instance_id / f"{instance_id}.traj.json").write_text(json.dumps(data))
+
+
+def test_history_from_trajectories_scales_untimed_runs_by_seconds_per_step(tmp_path):
+    timings = {"model": 30.0, "time_to_first_token": 5.0, "environment": 10.0}
+    _write_trajectory(tmp_path, "timed", api_calls=2, timings=timings)
+    _write_trajectory(tmp_path, "untimed", api_calls=5)
+
+    assert load_history(tmp_path) == {"timed": 40.0, "untimed": 100.0}
+
+    (tmp_path / "schedule.json").write_text(json.dumps({"instance_seconds": {"timed": 55.0}}))
+    assert load_history(tmp_path) == {"timed": 55.0, "untimed": 100.0}
+
+
+def test_history_without_timings_uses_default_seconds_per_step(tmp_path):
+    _write_trajectory(tmp_path, "a", api_calls=3)
+    history_file = tmp_path / "history.json"
+    history_file.write_text(json.dumps({"b": 12, "c": "not a number"}))
+
+    assert load_history(tmp_path)["a"] == 3 * DEFAULT_SECONDS_PER_STEP
+    assert load_history(history_file) == {"b": 12.0}
+    assert load_history(tmp_path / "missing.json") == {}
+
+
+def test_history_from_a_schedule_report_uses_only_instance_seconds(tmp_path):
+    report = tmp_path / "schedule.json"
+    report.write_text(json.dumps({"schedule": "lpt", "instances_started": 2, "actual_makespan": 90.0}))
+    assert load_history(report) == {}
+
+    report.write_text(json.dumps({"schedule": "lpt", "actual_makespan": 90.0, "instance_seconds": {"a": 60}}))
+    assert load_history(report) == {"a": 60.0}
+
+
+def test_predictions_fall_back_to_family_mean_then_median():
+    instances = [
+        _instance("a-1", "a"),
+        _instance("a-2", "a"),
+        _instance("a-3", "a"),
+        _instance("b-1", "b"),
+        _instance("c-1", "c"),
+    ]
+    history = {"a-1": 100.0, "a-2": 200.0, "b-1": 10.0}
+
+    predicted = predict_durations(instances, history)
+
+    assert predicted == {"a-1": 100.0, "a-2": 200.0, "a-3": 150.0, "b-1": 10.0, "c-1": 100.0}
+    assert [instance["instance_id"] for instance in lpt_order(instances, predicted)] == [
+        "a-2",
+        "a-3",
+        "a-1",
+        "c-1",
+        "b-1",
+    ]
+
+
+def test_longest_first_shortens_the_simulated_makespan():
+    durations = [1.0, 1.0, 1.0, 1.0, 4.0]
+    assert simulate_makespan(durations, workers=2) == 6.0
+    assert simulate_makespan(sorted(durations, reverse=True), workers=2) == 4.0
+    assert simulate_makespan([], workers=3) == 0.0
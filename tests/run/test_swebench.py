@@ -8,14 +8,18 @@ and the ``docker_image`` field fallback monkeypatch.
 import json
 import threading
 import time
+from pathlib import Path
 from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
 
+import pytest
+
 from ralphsweagent._bootstrap import ensure_vendor_minisweagent_on_path
 
 ensure_vendor_minisweagent_on_path()
 
 from ralphsweagent.agents.enhancements import register_agent_enhancements
+from ralphsweagent.run.benchmarks.scheduling import load_history
 
 from minisweagent.environments.local import LocalEnvironment
 
@@ -162,6 +166,351 @@ def test_live_trajectory_jsonl_content(tmp_path):
         assert "content" in obj
 
 
+def test_resume_continues_from_live_trajectory(tmp_path, monkeypatch):
+    """With ``--resume``, the surviving live JSONL is replayed and the run continues from it."""
+    import ralphsweagent.run.benchmarks.swebench as ralph_swebench
+
+    monkeypatch.setattr(ralph_swebench, "_resume", True)
+    instance_id = "swe-agent__test-repo-1"
+    instance_dir = tmp_path / instance_id
+    instance_dir.mkdir()
+    recorded = [
+        {"role": "system", "content": "You are a test agent."},
+        {"role": "user", "content": "Resume me."},
+        {"role": "assistant", "content": "", "extra": {"actions": [{"command": "touch replayed"}], "cost": 1.5}},
+        {"role": "user", "content": "<returncode>0</returncode>"},
+    ]
+    (instance_dir / f"{instance_id}.traj.jsonl").write_text("".join(json.dumps(m) + "\n" for m in recorded))
+    workdir = tmp_path / "repo"
+    workdir.mkdir()
+    config: dict = {"agent": {"system_template": "unused", "instance_template": "unused"}, "model": {}}
+
+    with (
+        patch("ralphsweagent.run.benchmarks.swebench.get_model", return_value=SlowExitModel(delay=0.0)),
+        patch(
+            "ralphsweagent.run.benchmarks.swebench.base_swebench.get_sb_environment",
+            return_value=LocalEnvironment(cwd=str(workdir)),
+        ),
+    ):
+        ralph_swebench.process_instance(
+            {"instance_id": instance_id, "problem_statement": "Resume me."}, tmp_path, config, MagicMock()
+        )
+
+    assert (workdir / "replayed").exists()
+    data = json.loads((instance_dir / f"{instance_id}.traj.json").read_text())
+    assert data["messages"][:4] == recorded
+    assert data["messages"][4]["role"] == "exit"
+    assert data["info"]["model_stats"] == {"instance_cost": 1.5, "api_calls": 2}
+
+
+def test_non_resumed_instance_drops_a_stale_partial_log(tmp_path, monkeypatch):
+    """Without ``--resume``, a partial log left by an earlier run must not survive into this one."""
+    import ralphsweagent.run.benchmarks.swebench as ralph_swebench
+
+    monkeypatch.setattr(ralph_swebench, "_resume", False)
+    instance_id = "swe-agent__test-repo-1"
+    instance_dir = tmp_path / instance_id
+    instance_dir.mkdir()
+    partial_path = instance_dir / f"{instance_id}.traj.json.partial.jsonl"
+    partial_path.write_text(json.dumps({"start": 0, "messages": [{"role": "user", "content": "stale"}]}) + "\n")
+    seen_at_startup = []
+
+    def failing_environment(config, instance):
+        seen_at_startup.append(partial_path.exists())
+        raise RuntimeError("no docker")
+
+    with (
+        patch("ralphsweagent.run.benchmarks.swebench.get_model", return_value=SlowExitModel(delay=0.0)),
+        patch("ralphsweagent.run.benchmarks.swebench.base_swebench.get_sb_environment", failing_environment),
+    ):
+        ralph_swebench.process_instance(
+            {"instance_id": instance_id, "problem_statement": "Do it."}, tmp_path, {"model": {}}, MagicMock()
+        )
+
+    assert seen_at_startup == [False]
+    assert not partial_path.exists()
+
+
+def test_batch_run_writes_step_timing_summary_and_preds(tmp_path, monkeypatch):
+    import ralphsweagent.run.benchmarks.swebench as ralph_swebench
+
+    config: dict = {"agent": {"system_template": "system", "instance_template": "{{ task }}"}, "model": {}}
+
+    def fake_upstream_main(output: str, **kwargs):
+        for index in range(2):
+            instance = {"instance_id": f"repo-{index}", "problem_statement": "Do it."}
+            ralph_swebench.process_instance(instance, tmp_path, config, MagicMock())
+
+    monkeypatch.setattr(ralph_swebench, "_upstream_main", fake_upstream_main)
+    with (
+        patch("ralphsweagent.run.benchmarks.swebench.get_model", return_value=SlowExitModel(delay=0.0)),
+        patch("ralphsweagent.run.benchmarks.swebench.base_swebench.get_sb_environment", return_value=LocalEnvironment()),
+    ):
+        ralph_swebench._patched_main(output=str(tmp_path))
+
+    summary = json.loads((tmp_path / "timings.json").read_text())
+    assert summary["model"]["count"] == 2
+    assert set(json.loads((tmp_path / "preds.json").read_text())) == {"repo-0", "repo-1"}
+    assert (tmp_path / "preds.jsonl").read_text() == ""
+    assert set(summary["model"]) == {"count", "total", "p50", "p95", "max"}
+
+
+def test_prediction_and_progress_end_survive_failing_cleanup(tmp_path, monkeypatch):
+    import ralphsweagent.run.benchmarks.swebench as ralph_swebench
+
+    class FailingCleanupEnvironment(LocalEnvironment):
+        def cleanup(self):
+            raise RuntimeError("container is gone")
+
+    prefetcher = MagicMock()
+    prefetcher.release.side_effect = RuntimeError("docker daemon is gone")
+    monkeypatch.setattr(ralph_swebench, "_get_prefetcher", lambda config: prefetcher)
+    progress_manager = MagicMock()
+    config: dict = {"agent": {"system_template": "system", "instance_template": "{{ task }}"}, "model": {}}
+    with (
+        patch("ralphsweagent.run.benchmarks.swebench.get_model", return_value=SlowExitModel(delay=0.0)),
+        patch.object(ralph_swebench, "_start_environment", lambda config, instance: FailingCleanupEnvironment()),
+    ):
+        ralph_swebench.process_instance(
+            {"instance_id": "repo-1", "problem_statement": "Do it."}, tmp_path, config, progress_manager
+        )
+
+    assert prefetcher.release.called
+    assert "repo-1" in (tmp_path / "preds.jsonl").read_text()
+    progress_manager.on_instance_end.assert_called_once_with("repo-1", "Submitted")
+
+
+def test_first_model_query_does_not_wait_for_environment_startup(tmp_path, monkeypatch):
+    """The environment starts in the background; only executing an action waits for it."""
+    import ralphsweagent.run.benchmarks.swebench as ralph_swebench
+
+    monkeypatch.setattr(ralph_swebench, "_deferred_environment", True)
+
+    started = threading.Event()
+    queried_before_startup: list[bool] = []
+
+    class ActionThenExitModel(SlowExitModel):
+        def query(self, messages, **kwargs):
+            if len(messages) == 2:
+                queried_before_startup.append(not started.is_set())
+                actions = [{"command": "echo hi"}]
+                return {"role": "assistant", "content": "", "extra": {"actions": actions, "cost": 0.0}}
+            return super().query(messages, **kwargs)
+
+        def format_observation_messages(self, message, outputs, template_vars=None):
+            return [{"role": "user", "content": output["output"]} for output in outputs]
+
+    def slow_environment(config, instance):
+        time.sleep(0.2)
+        started.set()
+        return LocalEnvironment()
+
+    config: dict = {"agent": {"system_template": "system", "instance_template": "{{ task }}"}, "model": {}}
+    with (
+        patch("ralphsweagent.run.benchmarks.swebench.get_model", return_value=ActionThenExitModel(delay=0.0)),
+        patch("ralphsweagent.run.benchmarks.swebench.base_swebench.get_sb_environment", slow_environment),
+        patch.object(ralph_swebench, "_step_timings", []),
+    ):
+        ralph_swebench.process_instance(
+            {"instance_id": "repo-1", "problem_statement": "Do it."}, tmp_path, config, MagicMock()
+        )
+        startup = ralph_swebench._step_timings[-1]
+
+    assert queried_before_startup == [True]
+    data = json.loads((tmp_path / "repo-1" / "repo-1.traj.json").read_text())
+    assert data["messages"][3]["content"] == "hi\n"
+    assert data["info"]["config"]["environment_type"].endswith("LocalEnvironment")
+    assert startup["environment_startup"] >= 0.2
+
+
+def test_early_template_vars_match_the_started_environment(tmp_path, monkeypatch):
+    import ralphsweagent.run.benchmarks.swebench as ralph_swebench
+
+    monkeypatch.setattr(ralph_swebench, "_deferred_environment", True)
+    release = threading.Event()
+    upstream_get_sb_environment = base_swebench.get_sb_environment
+
+    def slow_environment(config, instance):
+        release.wait(5)
+        return upstream_get_sb_environment(config, instance)
+
+    config = {"environment": {"environment_class": "local", "cwd": str(tmp_path), "env": {"PAGER": "cat"}}}
+    with patch.object(base_swebench, "get_sb_environment", slow_environment):
+        env = ralph_swebench._start_environment(config, {"instance_id": "repo-1"})
+        early = env.get_template_vars()
+        assert not env.ready
+        release.set()
+        started = env.environment.get_template_vars()
+
+    assert early == started
+    assert early["timeout"] == LocalEnvironment().config.timeout
+
+
+def test_early_template_vars_of_docker_include_defaults_and_image():
+    import ralphsweagent.run.benchmarks.swebench as ralph_swebench
+    from minisweagent.environments.docker import DockerEnvironmentConfig
+
+    instance = {"instance_id": "repo-1", "image_name": "example/repo-1:latest"}
+    early = ralph_swebench._early_template_vars({"environment": {"cwd": "/testbed"}}, instance)
+
+    expected = DockerEnvironmentConfig(image="example/repo-1:latest", cwd="/testbed").model_dump()
+    assert early.items() >= expected.items()
+    assert "system" in early
+    assert ralph_swebench._early_template_vars({"environment": {"environment_class": "nope"}}, instance) is None
+
+
+def test_batch_run_prefetches_images_of_upcoming_instances(tmp_path, monkeypatch, fake_docker_prefetcher):
+    import ralphsweagent.run.benchmarks.swebench as ralph_swebench
+
+    prefetchers = []
+
+    def make_prefetcher(*args, **kwargs):
+        prefetchers.append(fake_docker_prefetcher(*args, **kwargs))
+        return prefetchers[-1]
+
+    instances = [
+        {"instance_id": f"repo-{index}", "problem_statement": "Do it.", "image_name": f"img-{index}"}
+        for index in range(3)
+    ]
+    config: dict = {
+        "agent": {"system_template": "system", "instance_template": "{{ task }}"},
+        "environment": {"environment_class": "docker"},
+        "model": {},
+    }
+
+    def fake_upstream_main(output: str, **kwargs):
+        for instance in base_swebench.filter_instances(instances, filter_spec="", slice_spec=""):
+            ralph_swebench.process_instance(instance, tmp_path, config, MagicMock())
+
+    monkeypatch.setattr(ralph_swebench, "_upstream_main", fake_upstream_main)
+    monkeypatch.setattr(ralph_swebench, "_image_prefetch", 2)
+    monkeypatch.setattr(ralph_swebench, "ImagePrefetcher", make_prefetcher)
+    (tmp_path / "preds.json").write_text(json.dumps({"repo-0": {}}))
+    with (
+        patch("ralphsweagent.run.benchmarks.swebench.get_model", return_value=SlowExitModel(delay=0.0)),
+        patch("ralphsweagent.run.benchmarks.swebench.base_swebench.get_sb_environment", return_value=LocalEnvironment()),
+    ):
+        ralph_swebench._patched_main(output=str(tmp_path))
+
+    [prefetcher] = prefetchers
+    assert prefetcher.queue == [("repo-1", "img-1"), ("repo-2", "img-2")]
+    assert sorted(command[1] for command in prefetcher.commands if command[0] == "pull") == ["img-1", "img-2"]
+    assert ralph_swebench._prefetcher is None
+
+
+def test_batch_run_hands_pre_started_environments_to_workers(tmp_path, monkeypatch):
+    import ralphsweagent.run.benchmarks.swebench as ralph_swebench
+    from ralphsweagent.run.benchmarks.environment_pool import EnvironmentPool
+
+    pools: list[EnvironmentPool] = []
+
+    def make_pool(*args, **kwargs):
+        pools.append(EnvironmentPool(*args, **kwargs))
+        return pools[-1]
+
+    instances = [{"instance_id": f"repo-{index}", "problem_statement": "Do it."} for index in range(3)]
+    config: dict = {"agent": {"system_template": "system", "instance_template": "{{ task }}"}, "model": {}}
+
+    def fake_upstream_main(output: str, **kwargs):
+        for instance in base_swebench.filter_instances(instances, filter_spec="", slice_spec=""):
+            ralph_swebench.process_instance(instance, tmp_path, config, MagicMock())
+
+    started: list[str] = []
+
+    def get_sb_environment(config, instance):
+        started.append(instance["instance_id"])
+        return LocalEnvironment()
+
+    monkeypatch.setattr(ralph_swebench, "_upstream_main", fake_upstream_main)
+    monkeypatch.setattr(ralph_swebench, "_environment_pool", 2)
+    monkeypatch.setattr(ralph_swebench, "EnvironmentPool", make_pool)
+    with (
+        patch("ralphsweagent.run.benchmarks.swebench.get_model", return_value=SlowExitModel(delay=0.0)),
+        patch("ralphsweagent.run.benchmarks.swebench.base_swebench.get_sb_environment", get_sb_environment),
+    ):
+        ralph_swebench._patched_main(output=str(tmp_path))
+
+    [pool] = pools
+    assert pool.stats["hits"] == 3
+    assert sorted(started) == ["repo-0", "repo-1", "repo-2"]
+    assert ralph_swebench._pool is None
+
+
+def test_locality_schedule_groups_repo_families_and_reports_hit_rate(tmp_path, monkeypatch):
+    import ralphsweagent.run.benchmarks.swebench as ralph_swebench
+
+    instances = [
+        {"instance_id": f"{repo}__{repo}-{index}", "repo": repo, "version": "1", "problem_statement": "Do it."}
+        for index in range(2)
+        for repo in ("a", "b", "c")
+    ]
+    config: dict = {"agent": {"system_template": "system", "instance_template": "{{ task }}"}, "model": {}}
+    started: list[str] = []
+
+    def fake_upstream_main(output: str, workers: int = 1, **kwargs):
+        for instance in base_swebench.filter_instances(instances, filter_spec="", slice_spec=""):
+            started.append(instance["instance_id"])
+            ralph_swebench.process_instance(instance, tmp_path, config, MagicMock())
+
+    monkeypatch.setattr(ralph_swebench, "_upstream_main", fake_upstream_main)
+    monkeypatch.setattr(ralph_swebench, "_schedule", "dataset")
+    with (
+        patch("ralphsweagent.run.benchmarks.swebench.get_model", return_value=SlowExitModel(delay=0.0)),
+        patch("ralphsweagent.run.benchmarks.swebench.base_swebench.get_sb_environment", return_value=LocalEnvironment()),
+    ):
+        ralph_swebench._patched_main(output=str(tmp_path), workers=1, schedule="locality")
+
+    assert started == ["a__a-0", "a__a-1", "b__b-0", "b__b-1", "c__c-0", "c__c-1"]
+    report = json.loads((tmp_path / "schedule.json").read_text())
+    assert report["schedule"] == "locality"
+    assert report["instances_started"] == 6
+    assert (report["family_cache_hit_rate"], report["dataset_order_family_cache_hit_rate"]) == (0.5, 0.0)
+    assert ralph_swebench._schedule == "locality"
+
+
+def test_lpt_schedule_runs_longest_predicted_first_and_reports_makespan(tmp_path, monkeypatch):
+    import ralphsweagent.run.benchmarks.swebench as ralph_swebench
+
+    instances = [{"instance_id": f"repo-{index}", "problem_statement": "Do it."} for index in range(3)]
+    history = tmp_path / "history.json"
+    history.write_text(json.dumps({"repo-0": 10.0, "repo-1": 300.0, "repo-2": 20.0}))
+    output = tmp_path / "run"
+    output.mkdir()
+    config: dict = {"agent": {"system_template": "system", "instance_template": "{{ task }}"}, "model": {}}
+    started: list[str] = []
+
+    def fake_upstream_main(output: str, workers: int = 1, **kwargs):
+        for instance in base_swebench.filter_instances(instances, filter_spec="", slice_spec=""):
+            started.append(instance["instance_id"])
+            ralph_swebench.process_instance(instance, Path(output), config, MagicMock())
+
+    monkeypatch.setattr(ralph_swebench, "_upstream_main", fake_upstream_main)
+    monkeypatch.setattr(ralph_swebench, "_schedule", "dataset")
+    monkeypatch.setattr(ralph_swebench, "_history", None)
+    with (
+        patch("ralphsweagent.run.benchmarks.swebench.get_model", return_value=SlowExitModel(delay=0.0)),
+        patch("ralphsweagent.run.benchmarks.swebench.base_swebench.get_sb_environment", return_value=LocalEnvironment()),
+    ):
+        ralph_swebench._patched_main(output=str(output), workers=2, schedule="lpt", history=str(history))
+
+    assert started == ["repo-1", "repo-2", "repo-0"]
+    report = json.loads((output / "schedule.json").read_text())
+    assert report["predicted_makespan"] == 300.0
+    assert report["dataset_order_predicted_makespan"] == 300.0
+    assert report["actual_makespan"] > 0
+    assert set(report["instance_seconds"]) == {"repo-0", "repo-1", "repo-2"}
+    assert load_history(output) == pytest.approx(report["instance_seconds"])
+
+
+def test_resume_option_is_added_to_the_batch_command():
+    import inspect
+
+    from ralphsweagent.run.benchmarks.swebench import app
+
+    [command] = app.registered_commands
+    assert {"resume", "schedule", "history"} <= set(inspect.signature(command.callback).parameters)
+
+
 # ---------------------------------------------------------------------------
 # docker_image fallback monkeypatch tests
 # ---------------------------------------------------------------------------